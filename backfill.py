@@ -0,0 +1,262 @@
+"""
+Bulk import of result screenshots collected outside Discord.
+
+Walks a directory, decodes and crops the images in a process pool, sends them
+to Cloud Vision with batch_annotate_images (up to 16 images per call, a few
+calls in flight), matches all titles in one pass and writes the rows to a CSV
+file and/or the sheet with a single append_rows call.
+
+The player name is taken from the first sub-directory (<dir>/<player>/x.png);
+images directly in <dir> use --username.
+
+Progress is recorded in a checkpoint file (JSON lines), so an interrupted run
+resumes where it stopped and rows already appended to the sheet are not sent
+again. Images of a Vision batch that failed as a whole are retried on the
+next run.
+
+Usage:
+    uv run python backfill.py <dir> --csv results.csv
+    uv run python backfill.py <dir> --sheet [--qualifier] [--checkpoint backfill.jsonl]
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from functools import partial
+
+from dotenv import load_dotenv
+
+from src.ocr import IIDXReader, MAX_BATCH_IMAGES, prepare_request
+from src.matcher import TitleMatcher
+from src.sheets import SheetManager
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+CSV_COLUMNS = ["file", "date", "username", "title", "score", "is_qualifier", "error"]
+
+
+def find_images(root):
+    """Relative paths of all screenshots under root, sorted."""
+    paths = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.relpath(os.path.join(dirpath, filename), root))
+    return sorted(paths)
+
+
+def player_for(path, default):
+    parts = path.split(os.sep)
+    return parts[0] if len(parts) > 1 else default
+
+
+def prepare_file(root, path, compact_encoding=True):
+    """Process pool worker: (path, content, bands, error)."""
+    try:
+        with open(os.path.join(root, path), 'rb') as f:
+            content, bands = prepare_request(f.read(), compact_encoding)
+        return path, content, bands, None
+    except Exception as e:
+        return path, None, None, str(e)
+
+
+class Checkpoint:
+    """
+    Append-only JSON lines log of finished images and sheet appends.
+    Entries marked "retry" (their batch failed) are recorded but not finished.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.results = {}
+        self.appended = set()
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if "appended" in entry:
+                        self.appended.update(entry["appended"])
+                    else:
+                        self.results[entry["file"]] = entry
+        self.file = open(path, 'a', encoding='utf-8') if path else None
+
+    def _write(self, entry):
+        if self.file:
+            self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.file.flush()
+
+    def finished(self):
+        """Files that need no more OCR."""
+        return {file for file, entry in self.results.items() if not entry.get("retry")}
+
+    def add(self, entry):
+        self.results[entry["file"]] = entry
+        self._write(entry)
+
+    def mark_appended(self, files):
+        self.appended.update(files)
+        self._write({"appended": list(files)})
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+
+def annotate(reader, matcher, batch):
+    """Vision + parsing + title matching for one batch of prepared images."""
+    results = reader.annotate_batch([content for _, content, _ in batch])
+    entries = []
+    for (path, _, bands), annotations in zip(batch, results):
+        if isinstance(annotations, Exception):
+            entries.append({"file": path, "error": str(annotations)})
+            continue
+        data = reader.parse_regions(reader.assign_words(annotations, bands))
+        entries.append({"file": path, "data": data})
+
+    parsed = [entry for entry in entries if "data" in entry]
+    titles = matcher.correct_titles([entry["data"]["title"] for entry in parsed])
+    for entry, title in zip(parsed, titles):
+        data = entry.pop("data")
+        data["title"] = title
+        data["score"] = matcher.pick_score(title, data)
+        entry.update(date=data["date"], title=title, score=data["score"])
+        if not data["date"] or not data["score"]:
+            entry["error"] = "date or score not found"
+    return entries
+
+
+def run(root, reader, matcher, checkpoint, username="Unknown", is_qualifier=False, processes=None,
+        batch_size=MAX_BATCH_IMAGES, concurrency=4, compact_encoding=True, log=print):
+    """OCRs every image under root that is not in the checkpoint. Returns a report dict."""
+    finished_files = checkpoint.finished()
+    paths = [p for p in find_images(root) if p not in finished_files]
+    log(f"{len(paths)} images to process ({len(finished_files)} already done)")
+    start = time.perf_counter()
+    done = failed = calls = 0
+
+    def finish(entries):
+        nonlocal done, failed
+        for entry in entries:
+            entry.update(username=player_for(entry["file"], username), is_qualifier=is_qualifier)
+            checkpoint.add(entry)
+            done += 1
+            failed += "error" in entry
+        elapsed = time.perf_counter() - start
+        log(f"  {done}/{len(paths)} images, {done / elapsed:.1f} images/s")
+
+    def collect(future, batch):
+        try:
+            entries = future.result()
+        except Exception as e:
+            # The whole call failed (e.g. Vision unreachable): record the batch and keep going
+            log(f"  batch of {len(batch)} images failed: {e}")
+            entries = [{"file": path, "error": str(e), "retry": True} for path, _, _ in batch]
+        finish(entries)
+
+    batch_size = min(batch_size, MAX_BATCH_IMAGES)
+    prepare = partial(prepare_file, root, compact_encoding=compact_encoding)
+    with ProcessPoolExecutor(processes) as pool, ThreadPoolExecutor(concurrency) as vision_pool:
+        in_flight = {}  # future -> batch
+        batch = []
+        for path, content, bands, error in pool.map(prepare, paths, chunksize=4):
+            if error:
+                finish([{"file": path, "error": error}])
+                continue
+            batch.append((path, content, bands))
+            if len(batch) < batch_size:
+                continue
+            if len(in_flight) >= concurrency:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    collect(future, in_flight.pop(future))
+            in_flight[vision_pool.submit(annotate, reader, matcher, batch)] = batch
+            calls += 1
+            batch = []
+        if batch:
+            in_flight[vision_pool.submit(annotate, reader, matcher, batch)] = batch
+            calls += 1
+        for future, batch in in_flight.items():
+            collect(future, batch)
+
+    elapsed = time.perf_counter() - start
+    return {
+        "images": done,
+        "failed": failed,
+        "vision_calls": calls,
+        "seconds": round(elapsed, 2),
+        "images_per_second": round(done / elapsed, 2) if elapsed and done else 0.0,
+    }
+
+
+def row_for(entry):
+    return [entry.get("date"), entry["username"], entry.get("title") or "Unknown", entry.get("score") or 0,
+            entry["is_qualifier"]]
+
+
+def write_csv(path, checkpoint):
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        for file, entry in sorted(checkpoint.results.items()):
+            writer.writerow([file] + row_for(entry) + [entry.get("error", "")])
+
+
+def append_to_sheet(sheet_manager, checkpoint, worksheet_name="素データ"):
+    """Appends every good row not appended yet, in one call. Returns the number of rows."""
+    entries = [entry for file, entry in sorted(checkpoint.results.items())
+               if "error" not in entry and file not in checkpoint.appended]
+    if entries:
+        sheet_manager.append_rows([row_for(entry) for entry in entries], worksheet_name)
+        checkpoint.mark_appended([entry["file"] for entry in entries])
+    return len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", help="screenshots, optionally in one sub-directory per player")
+    parser.add_argument("--csv", help="write all results (including failures) to this CSV file")
+    parser.add_argument("--sheet", action="store_true", help="append the rows to the 素データ sheet")
+    parser.add_argument("--username", default="Unknown", help="player for images directly in the directory")
+    parser.add_argument("--qualifier", action="store_true", help="mark the rows as qualifier entries")
+    parser.add_argument("--checkpoint", default="backfill.jsonl", help="progress file used to resume")
+    parser.add_argument("--processes", type=int, default=None, help="decode processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=MAX_BATCH_IMAGES, help="images per Vision call")
+    parser.add_argument("--concurrency", type=int, default=4, help="Vision calls in flight")
+    parser.add_argument("--songs", default="songs.txt", help="song list for title matching")
+    args = parser.parse_args()
+
+    if not args.csv and not args.sheet:
+        parser.error("choose an output: --csv and/or --sheet")
+
+    load_dotenv()
+    sheet_manager = None
+    if args.sheet:
+        sheet_manager = SheetManager()
+        sheet_manager.connect(os.environ["SPREADSHEET_KEY"])
+
+    reader = IIDXReader(max_workers=1)
+    checkpoint = Checkpoint(args.checkpoint)
+    try:
+        report = run(args.directory, reader, TitleMatcher(args.songs), checkpoint, username=args.username,
+                     is_qualifier=args.qualifier, processes=args.processes, batch_size=args.batch_size,
+                     concurrency=args.concurrency)
+        print(f"Processed {report['images']} images ({report['failed']} failed) with "
+              f"{report['vision_calls']} Vision calls in {report['seconds']:.1f}s: "
+              f"{report['images_per_second']:.1f} images/s")
+        if args.csv:
+            write_csv(args.csv, checkpoint)
+            print(f"Wrote {len(checkpoint.results)} rows to {args.csv}")
+        if sheet_manager:
+            print(f"Appended {append_to_sheet(sheet_manager, checkpoint)} rows to the sheet")
+    finally:
+        checkpoint.close()
+        reader.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,313 @@
+"""
+Offline benchmark for the OCR pipeline (IIDXReader + TitleMatcher).
+
+Replays a directory of labelled screenshots without live credentials and
+reports per-stage latency percentiles, bytes sent to Vision and field-level
+accuracy, optionally comparing against a previous run.
+
+Corpus layout:
+    <corpus>/labels.json     {"result1.png": {"date": "2026-02-11 12:34", "title": "SHADE", "score": 1234}, ...}
+    <corpus>/vision/         recorded Vision responses (replay/record modes)
+
+Recordings are keyed by the exact bytes sent to Vision, so every request
+shape needs its own `record` run: a corpus recorded with the default settings
+cannot be replayed with --per-crop or --legacy-encoding until it has also been
+recorded with those flags. Both sets can live in the same vision/ directory.
+
+Vision backends:
+    stub    answers with the labelled text at the right position (pipeline overhead only)
+    replay  answers with responses recorded earlier by `record`
+    record  calls the real Cloud Vision API and stores its responses
+
+Usage:
+    uv run python bench_ocr.py <corpus> [--mode stub|replay|record] [--output bench.json] [--baseline old.json]
+    uv run python bench_ocr.py --synthetic 50
+"""
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import time
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+from google.cloud import vision
+
+from src.ocr import IIDXReader, REGIONS
+from src.matcher import TitleMatcher
+
+STAGES = ["decode", "crop", "encode", "ocr", "parse", "match", "total"]
+
+
+def word(text, x0, y0, x1, y1):
+    vertices = [vision.Vertex(x=x0, y=y0), vision.Vertex(x=x1, y=y0),
+                vision.Vertex(x=x1, y=y1), vision.Vertex(x=x0, y=y1)]
+    return vision.EntityAnnotation(description=text, bounding_poly=vision.BoundingPoly(vertices=vertices))
+
+
+class StubVisionClient:
+    """
+    Stands in for vision.ImageAnnotatorClient. Answers with the labelled text
+    of the image being processed, after an optional simulated latency.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.labels = {}
+        self.bands = None
+        self.calls = 0
+
+    def expect(self, labels, bands):
+        """Sets the answers for the next image. bands=None means per-crop mode."""
+        self.labels = labels
+        self.bands = bands
+        self.calls = 0
+
+    def text_detection(self, image, image_context=None, timeout=None):
+        if self.latency:
+            time.sleep(self.latency)
+        texts = {
+            "date": self.labels.get("date") or "",
+            "score": str(self.labels.get("score") or ""),
+            "title": self.labels.get("title") or "",
+        }
+
+        if self.bands is None:
+            # Per-crop mode: one call per region, in REGIONS order
+            text = texts[list(REGIONS)[self.calls]]
+            self.calls += 1
+            annotations = [word(text, 0, 0, 10, 10)] if text else []
+            return vision.AnnotateImageResponse(text_annotations=annotations)
+
+        annotations = [word("\n".join(texts.values()), 0, 0, 10, 10)]
+        for name, (top, bottom) in self.bands.items():
+            if texts[name]:
+                annotations.append(word(texts[name], 4, top + 2, 4 + 12 * len(texts[name]), bottom - 2))
+        return vision.AnnotateImageResponse(text_annotations=annotations)
+
+
+class RecordedVisionClient:
+    """Replays Vision responses stored as <directory>/<sha256 of request image>.json, or records them.
+
+    The key is the encoded request, so changing the crop encoding or request
+    mode needs a fresh recording.
+    """
+
+    def __init__(self, directory, live_client=None):
+        self.directory = directory
+        self.live_client = live_client
+        os.makedirs(directory, exist_ok=True)
+
+    def text_detection(self, image, image_context=None, timeout=None):
+        path = os.path.join(self.directory, hashlib.sha256(image.content).hexdigest() + ".json")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return vision.AnnotateImageResponse.from_json(f.read())
+        if not self.live_client:
+            raise KeyError(f"No recorded Vision response for this request ({os.path.basename(path)}); run with --mode record")
+        response = self.live_client.text_detection(image=image, image_context=image_context, timeout=timeout)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(vision.AnnotateImageResponse.to_json(response))
+        return response
+
+
+def make_synthetic_corpus(directory, count):
+    """Renders `count` fake result screens with known labels."""
+    songs = ["GRADIUS 2012", "SHADE", "Snake Stick", "Scharfrichter", "BLACK.by X-Cross Fade"]
+    rng = np.random.default_rng(0)
+    labels = {}
+    for i in range(count):
+        img = np.full((1080, 1920, 3), 20, dtype=np.uint8)
+        date = f"2026-02-{1 + i % 28:02d} {10 + i % 12}:{i % 60:02d}"
+        title = songs[i % len(songs)]
+        score = int(rng.integers(1000, 4000))
+        cv2.putText(img, date, (70, 45), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2)
+        cv2.putText(img, title, (200, 285), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+        cv2.putText(img, str(score), (1300, 550), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2)
+        name = f"synthetic_{i:03d}.png"
+        cv2.imwrite(os.path.join(directory, name), img)
+        labels[name] = {"date": date, "title": title, "score": score}
+    with open(os.path.join(directory, "labels.json"), "w", encoding="utf-8") as f:
+        json.dump(labels, f, ensure_ascii=False, indent=2)
+
+
+def normalize_date(value):
+    return (value or "").replace("/", "-").replace(".", "-")[:16]
+
+
+def summarize(values):
+    if not values:
+        return None
+    arr = np.array(values) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p90_ms": round(float(np.percentile(arr, 90)), 3),
+        "p99_ms": round(float(np.percentile(arr, 99)), 3),
+        "mean_ms": round(float(arr.mean()), 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def run(corpus, mode="stub", single_request=True, latency=0.0, repeat=1, songs="songs.txt", compact_encoding=True):
+    with open(os.path.join(corpus, "labels.json"), encoding="utf-8") as f:
+        labels = json.load(f)
+
+    if mode == "stub":
+        client = StubVisionClient(latency)
+    else:
+        live = None
+        if mode == "record":
+            if os.path.exists("service_account.json"):
+                os.environ.setdefault("GOOGLE_APPLICATION_CREDENTIALS", "service_account.json")
+            live = vision.ImageAnnotatorClient()
+        client = RecordedVisionClient(os.path.join(corpus, "vision"), live)
+
+    with patch("src.ocr.vision.ImageAnnotatorClient", return_value=client):
+        reader = IIDXReader(single_request=single_request, max_workers=1, compact_encoding=compact_encoding)
+    matcher = TitleMatcher(songs)
+
+    timings = {stage: [] for stage in STAGES}
+    bytes_sent, vision_calls = [], []
+    correct = {"date": 0, "title": 0, "score": 0, "all": 0}
+    failures = []
+    processed = 0
+    # Time spent preparing the stub's answers is not part of the pipeline
+    setup_time = 0.0
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for name, expected in labels.items():
+            with open(os.path.join(corpus, name), "rb") as f:
+                image_bytes = f.read()
+
+            if mode == "stub":
+                setup_start = time.perf_counter()
+                bands = None
+                if single_request:
+                    crops = reader.prepare_crops(reader.crop_regions(reader.decode_image(image_bytes)))
+                    _, bands = reader.build_composite(crops)
+                client.expect(expected, bands)
+                setup_time += time.perf_counter() - setup_start
+
+            stats = {}
+            start = time.perf_counter()
+            try:
+                data = reader.extract_data(image_bytes, stats)
+            except Exception as e:
+                failures.append({"image": name, "error": str(e)})
+                continue
+            match_start = time.perf_counter()
+            data["title"] = matcher.correct_title(data.get("title"))
+            data["score"] = matcher.pick_score(data["title"], data)
+            end = time.perf_counter()
+            stats["match"] = end - match_start
+            stats["total"] = end - start
+            processed += 1
+
+            for stage in STAGES:
+                if stage in stats:
+                    timings[stage].append(stats[stage])
+            bytes_sent.append(stats.get("bytes_sent", 0))
+            vision_calls.append(stats.get("vision_calls", 0))
+
+            ok = {
+                "date": normalize_date(data.get("date")) == normalize_date(expected.get("date")),
+                "title": data.get("title") == expected.get("title"),
+                "score": data.get("score") == expected.get("score"),
+            }
+            ok["all"] = all(ok.values())
+            for field, hit in ok.items():
+                correct[field] += hit
+            if not ok["all"]:
+                failures.append({"image": name, "expected": expected,
+                                 "got": {k: data.get(k) for k in ("date", "title", "score")}})
+    elapsed = time.perf_counter() - started - setup_time
+    reader.close()
+
+    return {
+        "commit": git_commit(),
+        "mode": mode,
+        "single_request": single_request,
+        "compact_encoding": compact_encoding,
+        "images": processed,
+        "images_per_sec": round(processed / elapsed, 2) if elapsed else None,
+        "stages": {stage: summarize(values) for stage, values in timings.items() if values},
+        "bytes_sent": {
+            "mean": round(float(np.mean(bytes_sent)), 1) if bytes_sent else 0,
+            "max": int(max(bytes_sent)) if bytes_sent else 0,
+        },
+        "vision_calls_per_image": round(float(np.mean(vision_calls)), 2) if vision_calls else 0,
+        "accuracy": {field: round(count / processed, 4) if processed else 0.0 for field, count in correct.items()},
+        "failures": failures[:50],
+    }
+
+
+def print_report(report, baseline=None):
+    print(f"Commit {report['commit']}  mode={report['mode']}  single_request={report['single_request']}"
+          f"  compact_encoding={report.get('compact_encoding')}")
+    print(f"{report['images']} images, {report['images_per_sec']} images/sec, "
+          f"{report['vision_calls_per_image']} Vision calls and {report['bytes_sent']['mean']:.0f} bytes sent per image")
+    print(f"{'stage':<8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+    for stage, summary in report["stages"].items():
+        line = f"{stage:<8} {summary['p50_ms']:>9.2f} {summary['p90_ms']:>9.2f} {summary['p99_ms']:>9.2f} {summary['mean_ms']:>9.2f}"
+        old = (baseline or {}).get("stages", {}).get(stage)
+        if old:
+            line += f"   p50 {summary['p50_ms'] - old['p50_ms']:+.2f} ms vs {baseline.get('commit')}"
+        print(line)
+    for field, value in report["accuracy"].items():
+        line = f"accuracy {field:<6} {value:.2%}"
+        if baseline and field in baseline.get("accuracy", {}):
+            line += f"   {value - baseline['accuracy'][field]:+.2%}"
+        print(line)
+    if baseline:
+        print(f"bytes sent per image {report['bytes_sent']['mean'] - baseline['bytes_sent']['mean']:+.0f} vs {baseline.get('commit')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline OCR pipeline benchmark")
+    parser.add_argument("corpus", nargs="?", help="directory with screenshots and labels.json")
+    parser.add_argument("--mode", choices=["stub", "replay", "record"], default="stub")
+    parser.add_argument("--per-crop", action="store_true", help="one Vision call per crop instead of one per image")
+    parser.add_argument("--legacy-encoding", action="store_true", help="send full-resolution colour JPEG crops")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated Vision latency in seconds (stub mode)")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--songs", default="songs.txt")
+    parser.add_argument("--synthetic", type=int, metavar="N", help="benchmark N generated screenshots instead of a corpus")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="JSON report of a previous run to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = args.corpus
+        if args.synthetic:
+            corpus = tmp
+            make_synthetic_corpus(corpus, args.synthetic)
+        if not corpus:
+            parser.error("a corpus directory or --synthetic N is required")
+
+        report = run(corpus, args.mode, not args.per_crop, args.latency, args.repeat, args.songs,
+                     not args.legacy_encoding)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,27 @@
 import discord
 from discord import app_commands
 import os
-import aiohttp
+import asyncio
+import io
+import logging
+import time
 from datetime import datetime
 from dotenv import load_dotenv
-from src.ocr import IIDXReader
-from src.sheets import SheetManager
-from src.matcher import TitleMatcher
-from src.ui import VerificationView
+# OCR, Sheets and matcher modules (cv2, google-cloud-vision, gspread, rapidfuzz)
+# are imported inside their startup functions, off the event loop
+from src.ingest import AttachmentIngestor, IngestError
+from src.services import BackgroundService, ServiceUnavailable
+from src.resilience import CircuitBreaker, CircuitOpen, Deadline, DeadlineExceeded
+from src.pending import PendingStore, PendingSubmission
+from src.scores import ScoreStore
+from src.dedupe import DuplicateIndex
+from src.ui import EditButton, SubmitButton, VerificationView, build_preview_embed
+from src.metrics import METRICS, start_http_server
+from src.ratelimit import AdmissionController, RateLimited, TokenBucket
+from src.watchdog import LoopWatchdog
+from src.results import CIRCUIT_OPEN_MESSAGE, check_date, match_result
+from src.jobqueue import JobClient, JobQueue
+from src.profiler import hottest, sample_stacks, to_collapsed
 
 # Load environment variables
 load_dotenv()
@@ -16,158 +30,486 @@ SPREADSHEET_KEY = os.getenv('SPREADSHEET_KEY')
 GUILD_ID = os.getenv('GUILD_ID') # Optional: for instant sync in dev server
 EVENT_START_DATE = os.getenv('EVENT_START_DATE')
 EVENT_END_DATE = os.getenv('EVENT_END_DATE')
+# Set to 0 to fall back to one Cloud Vision call per crop
+OCR_SINGLE_REQUEST = os.getenv('OCR_SINGLE_REQUEST', '1') != '0'
+# Number of screenshots processed concurrently
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', '4'))
+# OCR result cache: in-memory entries and optional SQLite file
+OCR_CACHE_SIZE = int(os.getenv('OCR_CACHE_SIZE', '512'))
+OCR_CACHE_PATH = os.getenv('OCR_CACHE_PATH')
+# Glyph templates for reading score/date locally (see `python -m src.digits`)
+DIGIT_TEMPLATES_DIR = os.getenv('DIGIT_TEMPLATES_DIR', 'templates/digits')
+# Local journal for rows waiting to be written to the sheet
+SHEET_JOURNAL_PATH = os.getenv('SHEET_JOURNAL_PATH', 'sheet_journal.db')
+# Set to 1 to append with values_append on the range instead of through the worksheet
+SHEETS_DIRECT_APPEND = os.getenv('SHEETS_DIRECT_APPEND', '0') == '1'
+# DEBUG shows raw OCR text and title matching
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# Optional Prometheus endpoint at http://127.0.0.1:<port>/metrics
+METRICS_PORT = os.getenv('METRICS_PORT')
+# Admission control: /result requests processed at once, and per-user budget
+RESULT_CONCURRENCY = int(os.getenv('RESULT_CONCURRENCY', str(OCR_WORKERS)))
+USER_RESULTS_PER_MINUTE = float(os.getenv('USER_RESULTS_PER_MINUTE', '3'))
+USER_RESULTS_BURST = int(os.getenv('USER_RESULTS_BURST', '3'))
+# API quotas shared by every caller (Cloud Vision requests/sec, Sheets writes/min)
+VISION_QPS = float(os.getenv('VISION_QPS', '10'))
+SHEETS_WRITES_PER_MINUTE = float(os.getenv('SHEETS_WRITES_PER_MINUTE', '55'))
+# Attachments larger than this are rejected before downloading
+MAX_ATTACHMENT_MB = float(os.getenv('MAX_ATTACHMENT_MB', '8'))
+# Previews waiting for 送信/修正: SQLite file (kept across restarts), lifetime and in-memory limit
+PENDING_DB_PATH = os.getenv('PENDING_DB_PATH', 'pending.db')
+PENDING_TTL_HOURS = float(os.getenv('PENDING_TTL_HOURS', '24'))
+PENDING_MAX_IN_MEMORY = int(os.getenv('PENDING_MAX_IN_MEMORY', '1000'))
+# Local copy of submitted scores for /ranking and /mybest
+SCORE_DB_PATH = os.getenv('SCORE_DB_PATH', 'scores.db')
+# Screenshots accepted by one /result (or リザルト登録 on a message)
+MAX_RESULT_IMAGES = 5
+# How long /result waits for OCR and the title matcher while the bot is starting
+STARTUP_WAIT_SECONDS = float(os.getenv('STARTUP_WAIT_SECONDS', '30'))
+# Time budget for one /result (queueing, download, OCR, matching); Discord allows 15 minutes
+RESULT_DEADLINE_SECONDS = float(os.getenv('RESULT_DEADLINE_SECONDS', '60'))
+# Cloud Vision: per-call timeout, hedged second request (1 to enable) and circuit breaker
+VISION_TIMEOUT_SECONDS = float(os.getenv('VISION_TIMEOUT_SECONDS', '10'))
+VISION_HEDGE = os.getenv('VISION_HEDGE', '0') == '1'
+VISION_BREAKER_FAILURES = int(os.getenv('VISION_BREAKER_FAILURES', '5'))
+VISION_BREAKER_RESET_SECONDS = float(os.getenv('VISION_BREAKER_RESET_SECONDS', '30'))
+# Processes decoding and cropping screenshots, started at startup (0: decode in the OCR threads).
+# Default: one per core; off on a single core, where the extra process only adds overhead
+CPU_COUNT = os.cpu_count() or 1
+PREPROCESS_PROCESSES = int(os.getenv('PREPROCESS_PROCESSES', str(CPU_COUNT if CPU_COUNT > 1 else 0)))
+# Worker mode: queue OCR jobs in this SQLite file for worker.py processes instead of running OCR here
+OCR_QUEUE_PATH = os.getenv('OCR_QUEUE_PATH')
+# Event loop blocked longer than this is logged with the stack of the blocking code
+LOOP_STALL_MS = float(os.getenv('LOOP_STALL_MS', '250'))
+# Longest sampling run allowed for /profile
+PROFILE_MAX_SECONDS = int(os.getenv('PROFILE_MAX_SECONDS', '60'))
 SERVICE_ACCOUNT_PATH = "service_account.json"
 
+logger = logging.getLogger("hiyoshi_bot")
+
 class MyClient(discord.Client):
     def __init__(self):
         super().__init__(intents=discord.Intents.default())
         self.tree = app_commands.CommandTree(self)
         self.ocr_reader = None
         self.sheet_manager = None
+        self.sheet_writer = None
         self.matcher = None
+        self.metrics_runner = None
+        self.ocr_service = None
+        self.sheets_service = None
+        self.matcher_service = None
+        self.sync_task = None
+        self.reconcile_task = None
+        self.sheets_stop_task = None
+        self.pending = None
+        self.scores = None
+        self.dedupe = None
+        self.jobs = None
+        self.watchdog = LoopWatchdog(threshold=LOOP_STALL_MS / 1000)
+        # Only one /profile samples at a time
+        self.profile_lock = asyncio.Lock()
+        self.ingestor = AttachmentIngestor(max_bytes=int(MAX_ATTACHMENT_MB * 1024 * 1024))
+        self.admission = AdmissionController(RESULT_CONCURRENCY, USER_RESULTS_PER_MINUTE / 60, USER_RESULTS_BURST)
+        self.vision_budget = TokenBucket(VISION_QPS, max(1, int(VISION_QPS)))
+        self.sheets_budget = TokenBucket(SHEETS_WRITES_PER_MINUTE / 60, 5)
 
     async def setup_hook(self):
-        # Initialize modules
-        print("Initializing OCR Reader...")
-        self.ocr_reader = IIDXReader()
-        print("OCR Reader Ready.")
-        
-        if SPREADSHEET_KEY and os.path.exists(SERVICE_ACCOUNT_PATH):
-            print("Initializing Sheet Manager...")
-            self.sheet_manager = SheetManager(SERVICE_ACCOUNT_PATH)
-            try:
-                self.sheet_manager.connect(SPREADSHEET_KEY)
-                print("Sheet Manager Connected.")
-            except Exception as e:
-                print(f"Sheet Connection Failed: {e}")
-                self.sheet_manager = None
+        # Subsystems are built concurrently in worker threads while the gateway
+        # connects; /result waits for the ones it needs (see STARTUP_WAIT_SECONDS).
+        # A subsystem that fails to start is retried in the background.
+        self.watchdog.start()
+        await self.ingestor.start()
+        # Previews from before a restart keep working: their buttons are matched by custom_id
+        self.pending = PendingStore(PENDING_DB_PATH, ttl=PENDING_TTL_HOURS * 3600, max_entries=PENDING_MAX_IN_MEMORY)
+        self.add_dynamic_items(SubmitButton, EditButton)
+        logger.info("%d pending previews restored.", len(self.pending))
+        self.scores = ScoreStore(SCORE_DB_PATH)
+        self.dedupe = DuplicateIndex()
+        self.dedupe.load(self.scores.submission_keys())
+        logger.info("Duplicate index loaded (%d results).", len(self.dedupe))
+        if OCR_QUEUE_PATH:
+            # OCR and matching run in worker.py processes; the matcher here only serves /ranking
+            self.jobs = JobClient(JobQueue(OCR_QUEUE_PATH))
+            self.jobs.start()
+            logger.info("Worker mode: OCR jobs are queued in %s.", OCR_QUEUE_PATH)
         else:
-            print("Spreadsheet configuration missing. Sheets disabled.")
-
-        print("Initializing Title Matcher...")
-        self.matcher = TitleMatcher()
-        print("Title Matcher Ready.")
-
-        # Sync commands
-        if GUILD_ID:
-            guild = discord.Object(id=GUILD_ID)
-            self.tree.copy_global_to(guild=guild)
-            await self.tree.sync(guild=guild)
-            print(f"Commands synced to guild {GUILD_ID}.")
+            self.ocr_service = BackgroundService("ocr", self._build_ocr_reader, on_ready=self._set_ocr_reader)
+            self.ocr_service.start()
+        self.matcher_service = BackgroundService("matcher", self._build_matcher, on_ready=self._set_matcher)
+        self.matcher_service.start()
+
+        if SPREADSHEET_KEY and os.path.exists(SERVICE_ACCOUNT_PATH):
+            from src.sheet_writer import SheetWriter, is_retryable
+            # Submissions are journaled from the start; the writer sends them once Sheets is connected.
+            # Only network errors, rate limits and server errors are retried.
+            self.sheet_writer = SheetWriter(None, SHEET_JOURNAL_PATH)
+            self.sheet_writer.start()
+            self.sheets_service = BackgroundService("sheets", self._connect_sheets, on_ready=self._set_sheet_manager,
+                                                    retry_if=is_retryable, on_failed=self._disable_sheets)
+            self.sheets_service.start()
+        elif SPREADSHEET_KEY:
+            logger.error("%s not found. Sheets disabled.", SERVICE_ACCOUNT_PATH)
         else:
-            await self.tree.sync()
-            print("Commands synced globally (may take up to 1 hour).")
+            logger.warning("SPREADSHEET_KEY not set. Sheets disabled.")
+
+        if METRICS_PORT:
+            self.metrics_runner = await start_http_server(int(METRICS_PORT))
+            logger.info("Metrics served at http://127.0.0.1:%s/metrics", METRICS_PORT)
+
+        self.sync_task = asyncio.create_task(self._sync_commands())
+
+    def _build_ocr_reader(self):
+        from src.ocr import IIDXReader
+        from src.ocr_cache import OCRCache
+        from src.digits import DigitRecognizer
+
+        ocr_cache = OCRCache(max_entries=OCR_CACHE_SIZE, db_path=OCR_CACHE_PATH)
+        local_engine = None
+        if os.path.isdir(DIGIT_TEMPLATES_DIR):
+            local_engine = DigitRecognizer.load(DIGIT_TEMPLATES_DIR)
+            logger.info("Local digit recognizer loaded (%d characters).", len(local_engine.templates))
+        breaker = CircuitBreaker("vision", VISION_BREAKER_FAILURES, VISION_BREAKER_RESET_SECONDS)
+        preprocess_pool = None
+        if PREPROCESS_PROCESSES > 0:
+            from src.preprocess import PreprocessPool
+            # Sized to the cores and started now, so the first burst doesn't wait for processes
+            preprocess_pool = PreprocessPool(PREPROCESS_PROCESSES)
+            preprocess_pool.warm()
+        return IIDXReader(single_request=OCR_SINGLE_REQUEST, max_workers=OCR_WORKERS,
+                          cache=ocr_cache, local_engine=local_engine, rate_limiter=self.vision_budget,
+                          vision_timeout=VISION_TIMEOUT_SECONDS, circuit_breaker=breaker, hedge=VISION_HEDGE,
+                          preprocess_pool=preprocess_pool)
+
+    def _set_ocr_reader(self, reader):
+        self.ocr_reader = reader
+
+    def _build_matcher(self):
+        from src.matcher import TitleMatcher
+        return TitleMatcher()
+
+    def _set_matcher(self, matcher):
+        self.matcher = matcher
+
+    def _connect_sheets(self):
+        from src.sheets import SheetManager
+        sheet_manager = SheetManager(SERVICE_ACCOUNT_PATH, direct_append=SHEETS_DIRECT_APPEND,
+                                     rate_limiter=self.sheets_budget)
+        sheet_manager.connect(SPREADSHEET_KEY)
+        return sheet_manager
+
+    def _set_sheet_manager(self, sheet_manager):
+        self.sheet_manager = sheet_manager
+        self.sheet_writer.set_sheet_manager(sheet_manager)
+        if not len(self.scores):
+            # First run with the local store: load what is already in the sheet
+            self.reconcile_task = asyncio.create_task(self._reconcile_scores())
+
+    def _disable_sheets(self, error):
+        # e.g. a wrong SPREADSHEET_KEY or revoked credentials: submissions stop being
+        # accepted for the sheet; rows journaled so far are sent after a fixed restart
+        logger.error("Sheets disabled: %s", error)
+        writer, self.sheet_writer = self.sheet_writer, None
+        self.sheets_stop_task = asyncio.create_task(writer.stop())
+
+    async def _reconcile_scores(self):
+        try:
+            await asyncio.to_thread(self.scores.reconcile, self.sheet_manager, self.sheet_writer.worksheet_name)
+            # Rows that were only in the sheet count as submitted too
+            self.dedupe.load(await asyncio.to_thread(self.scores.submission_keys))
+        except Exception as e:
+            METRICS.inc("errors_total", stage="reconcile")
+            logger.exception("Score reconcile failed: %s", e)
+
+    async def _sync_commands(self):
+        try:
+            if GUILD_ID:
+                guild = discord.Object(id=GUILD_ID)
+                self.tree.copy_global_to(guild=guild)
+                await self.tree.sync(guild=guild)
+                logger.info("Commands synced to guild %s.", GUILD_ID)
+            else:
+                await self.tree.sync()
+                logger.info("Commands synced globally (may take up to 1 hour).")
+        except Exception as e:
+            logger.exception("Command sync failed: %s", e)
+
+    async def close(self):
+        for service in (self.ocr_service, self.matcher_service, self.sheets_service):
+            if service:
+                await service.close()
+        for task in (self.sync_task, self.reconcile_task):
+            if task:
+                task.cancel()
+        if self.sheets_stop_task:
+            await self.sheets_stop_task
+        if self.sheet_writer:
+            await self.sheet_writer.stop()
+        if self.ocr_reader:
+            self.ocr_reader.close()
+        if self.jobs:
+            await self.jobs.close()
+        if self.metrics_runner:
+            await self.metrics_runner.cleanup()
+        await self.ingestor.close()
+        await self.watchdog.stop()
+        if self.scores:
+            self.scores.close()
+        await super().close()
 
 client = MyClient()
 
 @client.tree.command(name="result", description="日吉マスターズ予選のリザルト画像を登録します")
-@app_commands.describe(image="リザルト画像")
-async def result(interaction: discord.Interaction, image: discord.Attachment):
-    # Defer response as OCR might take time
-    await interaction.response.defer(ephemeral=True)
+@app_commands.describe(image="リザルト画像", image2="2枚目（任意）", image3="3枚目（任意）", image4="4枚目（任意）",
+                       image5="5枚目（任意）")
+async def result(interaction: discord.Interaction, image: discord.Attachment,
+                 image2: discord.Attachment = None, image3: discord.Attachment = None,
+                 image4: discord.Attachment = None, image5: discord.Attachment = None):
+    images = [a for a in (image, image2, image3, image4, image5) if a]
+    await handle_results(interaction, images)
 
-    if not image.content_type or not image.content_type.startswith('image/'):
-        await interaction.followup.send("画像ファイルをアップロードしてください。")
+@client.tree.context_menu(name="リザルト登録")
+async def result_from_message(interaction: discord.Interaction, message: discord.Message):
+    if message.author.id != interaction.user.id:
+        await interaction.response.send_message("自分が投稿した画像のみ登録できます。", ephemeral=True)
+        return
+    images = [a for a in message.attachments if a.content_type and a.content_type.startswith('image/')]
+    if not images:
+        await interaction.response.send_message("このメッセージには画像が添付されていません。", ephemeral=True)
         return
+    await handle_results(interaction, images[:MAX_RESULT_IMAGES])
+
+async def handle_results(interaction: discord.Interaction, images):
+    with METRICS.timer("result_seconds"):
+        # Shared by every stage, so a slow stage can't run past the interaction
+        deadline = Deadline(RESULT_DEADLINE_SECONDS)
+        # Defer response as OCR might take time
+        await interaction.response.defer(ephemeral=True)
+
+        async def on_queued(position):
+            METRICS.inc("result_queued_total")
+            await interaction.followup.send(f"混み合っています。順番待ち中です（{position}番目）。しばらくお待ちください。", ephemeral=True)
+
+        try:
+            queued_at = time.perf_counter()
+            async with client.admission.admit(interaction.user.id, on_queued=on_queued):
+                METRICS.observe("admission_wait_seconds", time.perf_counter() - queued_at)
+                await process_results(interaction, images, deadline)
+        except RateLimited as e:
+            METRICS.inc("rejections_total", reason="user_rate_limited")
+            await interaction.followup.send(f"送信が多すぎます。{e.retry_after:.0f}秒後にもう一度お試しください。", ephemeral=True)
 
+async def read_result(reader, matcher, image: discord.Attachment, deadline, meta=None):
+    """Downloads and OCRs one screenshot. Returns (data, None) or (None, error message)."""
     try:
-        # Download image
-        image_bytes = await image.read()
-        
-        # Save temporary file for OpenCV
-        # src/ocr.py expects a file path.
-        temp_filename = f"temp_{interaction.id}_{image.filename}"
-        with open(temp_filename, 'wb') as f:
-            f.write(image_bytes)
-        
+        # Download image (streamed; oversized or non-result images are rejected early)
         try:
-            # Run OCR
-            data = client.ocr_reader.extract_data(temp_filename)
-            
-            # --- Date Filtering ---
-            ocr_date_str = data.get('date')
-            if ocr_date_str:
-                try:
-                    # Cloud Vision usually returns YYYY-MM-DD HH:MM
-                    # Or verify_ocr output format which is similar
-                    # Let's handle generic ISO-like formats
-                    # Normalize separators
-                    norm_date = ocr_date_str.replace('/', '-').replace('.', '-')
-                    # Parse just the date part (first 10 chars should be YYYY-MM-DD)
-                    date_obj = datetime.strptime(norm_date[:10], "%Y-%m-%d")
-                    
-                    if EVENT_START_DATE and EVENT_END_DATE:
-                        start_obj = datetime.strptime(EVENT_START_DATE, "%Y-%m-%d")
-                        end_obj = datetime.strptime(EVENT_END_DATE, "%Y-%m-%d")
-                        
-                        if not (start_obj <= date_obj <= end_obj):
-                            await interaction.followup.send(f"指定期間外のリザルトです。予選期間内の画像をアップロードしてください。")
-                            return
-                except Exception as e:
-                    print(f"Date Parsing Warning: {e}")
+            with METRICS.timer("download_seconds"):
+                image_bytes = await client.ingestor.fetch(image, deadline)
+        except IngestError as e:
+            return None, str(e)
+
+        timeout = deadline.timeout()
+        if client.jobs:
+            # Worker mode: a worker.py process does OCR, the date check and matching
+            meta = dict(meta or {}, image_url=image.url, event_start=EVENT_START_DATE, event_end=EVENT_END_DATE,
+                        expires_at=time.time() + timeout)
+            data, rejection = await client.jobs.run(image_bytes, meta, timeout)
+            return (None, rejection) if rejection else (data, None)
+
+        # Run OCR (off the event loop, decoded in memory)
+        data = await asyncio.wait_for(reader.extract_data_async(image_bytes, deadline), timeout)
+
+        # --- Date Filtering ---
+        rejection = check_date(data, EVENT_START_DATE, EVENT_END_DATE)
+        if rejection:
+            return None, rejection
+
+        return match_result(matcher, data, image_bytes), None
+    except (DeadlineExceeded, asyncio.TimeoutError) as e:
+        METRICS.inc("rejections_total", reason="deadline_exceeded")
+        logger.warning("Result timed out after %.0fs: %r", deadline.seconds, e)
+        return None, "処理がタイムアウトしました。しばらくしてからもう一度お試しください。"
+    except CircuitOpen as e:
+        return None, CIRCUIT_OPEN_MESSAGE.format(retry_after=e.retry_after)
+    except Exception as e:
+        METRICS.inc("errors_total", stage="ocr")
+        logger.exception("OCR Error: %s", e)
+        return None, f"Error processing image: {e}"
+
+async def process_results(interaction: discord.Interaction, images, deadline):
+    try:
+        wait = min(STARTUP_WAIT_SECONDS, deadline.remaining())
+        reader = matcher = None
+        if not client.jobs:
+            # In worker mode worker.py does OCR and matching, so nothing here has to be ready
+            reader = await client.ocr_service.get(timeout=wait)
+            matcher = await client.matcher_service.get(timeout=wait)
+    except ServiceUnavailable as e:
+        METRICS.inc("rejections_total", reason="starting")
+        logger.warning("Rejected /result: %s", e)
+        await interaction.followup.send("ボットの起動中です。しばらくしてからもう一度お試しください。")
+        return
+
+    try:
+        # All screenshots are downloaded and OCR'd concurrently
+        meta = {"interaction_id": interaction.id, "user_id": interaction.user.id}
+        results = await asyncio.gather(*(read_result(reader, matcher, image, deadline, meta) for image in images))
+        METRICS.inc("result_images_total", len(images))
+
+        entries = []
+        errors = []
+        # Results earlier in this /result, so the same screenshot attached twice is listed once
+        seen = DuplicateIndex()
+        for i, (image, (data, error)) in enumerate(zip(images, results), 1):
+            if data and client.dedupe.check(interaction.user.id, interaction.user.display_name, data,
+                                            data['image_hash']):
+                errors.append(f"{i}枚目: 既に登録済みのリザルトです。" if len(images) > 1 else "既に登録済みのリザルトです。")
+            elif data and seen.check(interaction.user.id, None, data, data['image_hash']):
+                errors.append(f"{i}枚目: 同じリザルトが既に添付されています。")
+            elif data:
+                seen.add(interaction.user.id, data, data['image_hash'])
+                entries.append(PendingSubmission.entry(data, image.url, data['image_hash']))
             else:
-                 # If no date found, what to do? User said: "入っていない場合は...受け取るようにして欲しい"(Only strict filtering mentioned). 
-                 # Usually safest to block if strict, or warn. 
-                 # "指定期間内のリザルトをアップロードしてください" implies rejection if not verified.
-                 # Let's assume rejection if no date found? Or let it pass if date is missing (OCR failure)?
-                 # "日付について...入っているものだけを受け取る" implies strict -> Reject on missing date.
-                 await interaction.followup.send(f"画像から日付を読み取れませんでした。鮮明な画像をアップロードしてください。")
-                 return
-
-            # --- Title Fuzzy Matching ---
-            raw_title = data.get('title')
-            corrected_title = client.matcher.correct_title(raw_title)
-            data['title'] = corrected_title
-
-
-            # Get username
-            username = interaction.user.display_name
-            
-            # Format reply (Preview for Verification)
-            reply_text = "### OCR Result Preview\n"
-            reply_text += "以下の内容で登録します。問題なければ「送信」、間違っていれば「修正」を押してください。\n"
-            
-            # Create Embed for preview
-            embed = discord.Embed(title="OCR Result Preview", color=discord.Color.blue())
-            embed.add_field(name="Date", value=data.get('date') or 'N/A', inline=True)
-            embed.add_field(name="Player", value=username, inline=True)
-            embed.add_field(name="Song", value=data.get('title') or 'N/A', inline=True)
-            embed.add_field(name="Score", value=str(data.get('score') or 'N/A'), inline=True)
-            
-            # Image URL for embed
-            # discord.Attachment has a 'url' property
-            image_url = image.url
-            embed.set_thumbnail(url=image_url)
-            
-            # Check for qualifier role
-            is_qualifier = False
-            if isinstance(interaction.user, discord.Member):
-                role_names = [role.name for role in interaction.user.roles]
-                if "日吉マスターズ予選参加者" in role_names:
-                    is_qualifier = True
-            
-            # Create View
-            view = VerificationView(data, username, client, image_url, is_qualifier)
-            
-            # Send Ephemeral Message with View
-            # Using followup because we deferred
-            message = await interaction.followup.send(content=reply_text, embed=embed, view=view, ephemeral=True)
-            view.message = message
-        
-        except Exception as e:
-            await interaction.followup.send(f"Error processing image: {e}")
-            print(f"OCR Error: {e}")
-        
-        finally:
-            if os.path.exists(temp_filename):
-                os.remove(temp_filename)
+                errors.append(f"{i}枚目: {error}" if len(images) > 1 else error)
+        if not entries:
+            await interaction.followup.send("\n".join(errors))
+            return
+
+        # Get username
+        username = interaction.user.display_name
+
+        # Format reply (Preview for Verification)
+        reply_text = "### OCR Result Preview\n"
+        reply_text += "以下の内容で登録します。問題なければ「送信」、間違っていれば「修正」を押してください。\n"
+        if errors:
+            reply_text += "\n次の画像は登録されません:\n" + "\n".join(errors) + "\n"
+
+        # Check for qualifier role
+        is_qualifier = False
+        if isinstance(interaction.user, discord.Member):
+            role_names = [role.name for role in interaction.user.roles]
+            if "日吉マスターズ予選参加者" in role_names:
+                is_qualifier = True
+
+        # Keep the preview until the user answers (survives restarts)
+        record = PendingSubmission(interaction.id, interaction.user.id, username, entries, is_qualifier)
+        client.pending.add(record)
+        view = VerificationView(record)
+
+        # Send Ephemeral Message with View
+        # Using followup because we deferred
+        await interaction.followup.send(content=reply_text, embed=build_preview_embed(record), view=view,
+                                        ephemeral=True)
 
     except Exception as e:
+        METRICS.inc("errors_total", stage="result")
         await interaction.followup.send(f"An error occurred: {e}")
-        print(f"Global Error: {e}")
+        logger.exception("Global Error: %s", e)
+
+async def song_autocomplete(interaction: discord.Interaction, current: str):
+    if not client.matcher:
+        return []
+    current = current.casefold()
+    titles = [title for title in client.matcher.songs if current in title.casefold()]
+    return [app_commands.Choice(name=title[:100], value=title[:100]) for title in titles[:25]]
+
+@client.tree.command(name="ranking", description="曲ごとのスコアランキングを表示します")
+@app_commands.describe(song="曲名")
+@app_commands.autocomplete(song=song_autocomplete)
+async def ranking(interaction: discord.Interaction, song: str):
+    title = client.matcher.correct_title(song) if client.matcher else song
+    with METRICS.timer("ranking_seconds"):
+        rows = client.scores.ranking(title)
+    if not rows:
+        await interaction.response.send_message(f"「{title}」のスコアはまだ登録されていません。", ephemeral=True)
+        return
+    lines = [f"{rank}. {username} — {score:,}" for rank, (username, score, _) in enumerate(rows, 1)]
+    embed = discord.Embed(title=f"Ranking: {title}", description="\n".join(lines), color=discord.Color.gold())
+    await interaction.response.send_message(embed=embed)
+
+@client.tree.command(name="mybest", description="自分の曲ごとのベストスコアを表示します")
+async def mybest(interaction: discord.Interaction):
+    username = interaction.user.display_name
+    with METRICS.timer("mybest_seconds"):
+        rows = client.scores.best_for_user(username)
+    if not rows:
+        await interaction.response.send_message("登録されたスコアはまだありません。", ephemeral=True)
+        return
+    lines = [f"{title}: {score:,}（{rank}位）" for title, score, rank in rows]
+    embed = discord.Embed(title=f"Best scores: {username}", description="\n".join(lines)[:4000],
+                          color=discord.Color.blue())
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+def format_stats():
+    """Renders the metrics snapshot as a compact text block for /stats. Queries SQLite; call it off the event loop."""
+    snapshot = METRICS.snapshot()
+    hours, rest = divmod(int(snapshot["uptime"]), 3600)
+    lines = [f"Uptime: {hours}h{rest // 60:02d}m", "", "Latency (count / p50 / p95 / p99 ms)"]
+    for name, h in snapshot["histograms"].items():
+        p50, p95, p99 = (f"{h[q] * 1000:.0f}" for q in ("p50", "p95", "p99"))
+        lines.append(f"{name}: {h['count']} / {p50} / {p95} / {p99}")
+    lines += ["", "Counters"]
+    for name, value in snapshot["counters"].items():
+        lines.append(f"{name}: {value}")
+    if client.ocr_reader and client.ocr_reader.cache:
+        cache = client.ocr_reader.cache.stats()
+        lines.append(f"ocr cache: {cache['entries']} entries, hit rate {cache['hit_rate']:.0%}, title-only {cache['title_only_hits']}")
+    if client.ocr_reader and client.ocr_reader.circuit_breaker:
+        lines.append(f"vision circuit: {client.ocr_reader.circuit_breaker.state}")
+    if client.jobs:
+        jobs = client.jobs.queue.counts()
+        lines.append(f"ocr jobs: {jobs.get('queued', 0)} queued, {jobs.get('running', 0)} running")
+    if client.sheet_writer:
+        lines.append(f"sheet rows pending: {client.sheet_writer.pending_count()}")
+    for service in (client.ocr_service, client.matcher_service, client.sheets_service):
+        if service and service.failed:
+            lines.append(f"{service.name}: disabled ({service.error})")
+        elif service and not service.ready:
+            lines.append(f"{service.name}: starting (attempt {service.attempts}, last error: {service.error})")
+    if client.pending is not None:
+        lines.append(f"previews pending: {len(client.pending)}")
+    lines.append(f"/result in progress: {client.admission.active}, queued: {client.admission.queued}")
+    if client.watchdog.stall_count:
+        stall = client.watchdog.stalls[-1]
+        lines.append(f"event loop stalls: {client.watchdog.stall_count} (last {stall['seconds'] * 1000:.0f} ms)")
+    return "\n".join(lines)
+
+@client.tree.command(name="stats", description="ボットの処理時間とカウンタを表示します（管理者用）")
+@app_commands.default_permissions(administrator=True)
+@app_commands.checks.has_permissions(administrator=True)
+async def stats(interaction: discord.Interaction):
+    text = await asyncio.to_thread(format_stats)
+    # Discord messages are limited to 2000 characters
+    await interaction.response.send_message(f"```\n{text[:1900]}\n```", ephemeral=True)
+
+@client.tree.command(name="profile", description="ボットの処理をサンプリングしてプロファイルを取得します（管理者用）")
+@app_commands.describe(seconds="計測する秒数")
+@app_commands.default_permissions(administrator=True)
+@app_commands.checks.has_permissions(administrator=True)
+async def profile(interaction: discord.Interaction, seconds: app_commands.Range[int, 1, PROFILE_MAX_SECONDS] = 10):
+    if client.profile_lock.locked():
+        await interaction.response.send_message("別のプロファイルを計測中です。終わってからもう一度お試しください。", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    async with client.profile_lock:
+        # Samples from a worker thread, so the bot keeps running normally meanwhile
+        counts, rounds = await asyncio.to_thread(sample_stacks, seconds)
+
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    # Collapsed stacks: open in speedscope.app or render with flamegraph.pl
+    files = [discord.File(io.BytesIO(to_collapsed(counts).encode()), filename=f"profile-{stamp}.collapsed")]
+    if client.watchdog.stalls:
+        files.append(discord.File(io.BytesIO(client.watchdog.format_stalls().encode()), filename=f"stalls-{stamp}.txt"))
+    lines = [f"{rounds} samples over {seconds}s. Hottest on the event loop:"]
+    lines += [f"{count / rounds:>5.0%} {name}" for name, count in hottest(counts, thread="MainThread")]
+    text = "\n".join(lines)
+    await interaction.followup.send(f"```\n{text[:1900]}\n```", files=files, ephemeral=True)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
     if not TOKEN:
-        print("Error: DISCORD_TOKEN is not set in .env")
+        logger.error("DISCORD_TOKEN is not set in .env")
     else:
-        client.run(TOKEN)
+        # Logging is configured above, so discord.py must not add its own handler
+        client.run(TOKEN, log_handler=None)
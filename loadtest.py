@@ -0,0 +1,551 @@
+"""
+Concurrent load test for the /result flow, without Discord or Google.
+
+Runs the bot's real setup_hook, `result` command, VerificationView buttons and
+ScoreCorrectionModal against synthetic interactions, with every player
+uploading at the same moment. The outside world is replaced by:
+
+    a local HTTP server   serves the attachments (Discord CDN) and answers
+                          Cloud Vision requests made by the real client over its
+                          REST transport, with configurable latency and errors
+    FakeSheetManager      stands in for Google Sheets behind the real SheetWriter
+
+For each concurrency level it reports throughput, p50/p99 latency of the
+preview (/result -> OCR preview) and of the submission (送信/修正 -> done), and
+event-loop lag measured by a probe task. The run fails (exit code 1) if the
+loop was blocked longer than --max-lag-ms at any level, i.e. something
+synchronous ran on the event loop; the stacks the bot's LoopWatchdog captured
+(LOOP_STALL_MS) are printed to show what it was.
+
+Usage:
+    uv run python loadtest.py [--levels 1,10,25,50] [--vision-latency 0.3] [--vision-error-rate 0.05]
+                              [--sheets-latency 0.5] [--edit-rate 0.2] [--max-lag-ms 100] [--output load.json]
+
+The bot's own environment variables (RESULT_CONCURRENCY, VISION_QPS, OCR_WORKERS, ...)
+apply as usual.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+import requests
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import vision
+
+import bot
+from bench_ocr import git_commit, summarize, word
+from src.sheets import SheetManager
+from src.ui import EditButton, SubmitButton
+
+SONGS = ["GRADIUS 2012", "SHADE", "Snake Stick", "Scharfrichter", "BLACK.by X-Cross Fade"]
+RESULT_DATE = "2026-02-11 12:34"
+SCREEN_SIZE = (1280, 720)
+
+logger = logging.getLogger("loadtest")
+
+
+def make_screenshot(index):
+    """A result-sized PNG, unique per index so neither the OCR cache nor dedupe can short-cut it."""
+    width, height = SCREEN_SIZE
+    rng = np.random.default_rng(index)
+    img = np.full((height, width, 3), 20, dtype=np.uint8)
+    img[:, :, 0] = rng.integers(0, 40, size=(height, width), dtype=np.uint8)
+    cv2.putText(img, f"player {index}", (60, 300), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2)
+    success, encoded = cv2.imencode(".png", img)
+    return encoded.tobytes()
+
+
+def expected_result(content):
+    """What the Vision stand-in reads from a request: derived from its content, so it is stable."""
+    h = int(hashlib.sha256(content).hexdigest()[:8], 16)
+    return {"date": RESULT_DATE, "title": SONGS[h % len(SONGS)], "score": 1000 + h % 1000}
+
+
+class StandInServer:
+    """
+    Local HTTP server playing both the Discord CDN (GET /attachments/<name>) and
+    Cloud Vision (POST /v1/images:annotate, as sent by the REST transport).
+
+    Vision answers are laid out in the composite bands the reader expects, so
+    the real parsing code runs. Each Vision request waits `latency` plus up to
+    `jitter` seconds, and fails with HTTP 503 with probability `error_rate`
+    (raised by the client as ServiceUnavailable, so it reaches the circuit breaker).
+    """
+
+    def __init__(self, bands, latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+        self.bands = bands
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.attachments = {}
+        self.lock = threading.Lock()
+        self.vision_requests = 0
+        self.vision_errors = 0
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_port}"
+
+    def start(self):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.standin = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="standin", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+
+    def add_attachment(self, name, content):
+        self.attachments[name] = content
+        return f"{self.url}/attachments/{name}"
+
+    def vision_client(self):
+        """A real ImageAnnotatorClient that talks to this server."""
+        return self.vision_client_class(transport="rest", credentials=AnonymousCredentials(),
+                                        client_options={"api_endpoint": self.url})
+
+    vision_client_class = vision.ImageAnnotatorClient
+
+    def annotate(self, body):
+        """Returns (status, JSON response) for a batch annotate request."""
+        with self.lock:
+            self.vision_requests += 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.vision_errors += 1
+        if delay:
+            time.sleep(delay)
+        if failed:
+            return 503, {"error": {"code": 503, "message": "stand-in unavailable", "status": "UNAVAILABLE"}}
+
+        responses = []
+        for request in json.loads(body)["requests"]:
+            labels = expected_result(base64.b64decode(request["image"]["content"]))
+            texts = {"date": labels["date"], "title": labels["title"], "score": str(labels["score"])}
+            annotations = [word("\n".join(texts.values()), 0, 0, 10, 10)]
+            for name, (top, bottom) in self.bands.items():
+                annotations.append(word(texts[name], 4, top + 2, 4 + 12 * len(texts[name]), bottom - 2))
+            responses.append(vision.AnnotateImageResponse(text_annotations=annotations))
+        response = vision.BatchAnnotateImagesResponse(responses=responses)
+        return 200, json.loads(vision.BatchAnnotateImagesResponse.to_json(response))
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        name = self.path.rsplit("/", 1)[-1]
+        content = self.server.standin.attachments.get(name)
+        if content is None:
+            self._reply(404, b"", "text/plain")
+            return
+        self._reply(200, content, "image/png")
+
+    def do_POST(self):
+        if not self.path.startswith("/v1/images:annotate"):
+            self._reply(404, b"", "text/plain")
+            return
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        status, payload = self.server.standin.annotate(body)
+        self._reply(status, json.dumps(payload).encode(), "application/json")
+
+    def _reply(self, status, content, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeSheetManager(SheetManager):
+    """SheetManager whose appends land in a list after `latency` seconds, failing with `error_rate`."""
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        super().__init__()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.rows = []
+        self.lock = threading.Lock()
+
+    def read_rows(self, worksheet_name=None):
+        with self.lock:
+            return list(self.rows)
+
+    def _append_rows(self, rows, worksheet_name):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            if self.random.random() < self.error_rate:
+                raise requests.exceptions.ConnectionError("fake sheets unavailable")
+            self.rows.extend(rows)
+
+
+class FakeUser:
+    def __init__(self, user_id, display_name):
+        self.id = user_id
+        self.display_name = display_name
+        self.name = display_name
+        self.roles = []
+
+
+class FakeAttachment:
+    def __init__(self, url, size, width, height, content_type="image/png"):
+        self.url = url
+        self.size = size
+        self.width = width
+        self.height = height
+        self.content_type = content_type
+        self.filename = url.rsplit("/", 1)[-1]
+
+
+class FakeMessage:
+    def __init__(self, content=None, embed=None, view=None):
+        self.content = content
+        self.embed = embed
+        self.view = view
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self.done = False
+        self.modal = None
+
+    def is_done(self):
+        return self.done
+
+    async def defer(self, **kwargs):
+        self.done = True
+
+    async def send_message(self, content=None, **kwargs):
+        self.done = True
+        self.interaction.messages.append(FakeMessage(content, kwargs.get("embed"), kwargs.get("view")))
+
+    async def send_modal(self, modal):
+        self.done = True
+        self.modal = modal
+
+    async def edit_message(self, **kwargs):
+        self.done = True
+        self.interaction.edits.append(kwargs)
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        message = FakeMessage(content, kwargs.get("embed"), kwargs.get("view"))
+        self.interaction.messages.append(message)
+        return message
+
+
+class FakeChannel:
+    def __init__(self):
+        self.messages = []
+
+    async def send(self, content=None, **kwargs):
+        message = FakeMessage(content, kwargs.get("embed"))
+        self.messages.append(message)
+        return message
+
+
+class FakeInteraction:
+    """The parts of discord.Interaction the bot uses; everything sent is recorded."""
+
+    ids = itertools.count(10 ** 17)
+
+    def __init__(self, client, user, channel):
+        self.id = next(self.ids)
+        self.client = client
+        self.user = user
+        self.channel = channel
+        self.messages = []
+        self.edits = []
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+    async def edit_original_response(self, **kwargs):
+        self.edits.append(kwargs)
+
+    def preview(self):
+        return next((m for m in self.messages if m.view is not None), None)
+
+    def last_text(self):
+        texts = [e.get("content") for e in self.edits] or [m.content for m in self.messages]
+        return next((text for text in reversed(texts) if text), "")
+
+
+class LagProbe:
+    """Sleeps `interval` seconds in a loop and records how late it wakes up."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - start - self.interval))
+
+
+class LoadTest:
+    def __init__(self, workdir, vision_latency=0.0, vision_jitter=0.0, vision_error_rate=0.0,
+                 sheets_latency=0.0, sheets_error_rate=0.0, edit_rate=0.0, cache=False, seed=0):
+        self.workdir = workdir
+        self.vision_options = dict(latency=vision_latency, jitter=vision_jitter, error_rate=vision_error_rate,
+                                   seed=seed)
+        self.sheets = FakeSheetManager(sheets_latency, sheets_error_rate, seed)
+        self.edit_rate = edit_rate
+        self.cache = cache
+        self.random = random.Random(seed)
+        self.client = bot.client
+        self.channel = FakeChannel()
+        self.standin = None
+        self.players = itertools.count()
+        self.submitted = 0
+
+    async def start(self):
+        # Local files only, no Sheets credentials, no metrics port, every date accepted
+        for name in ("PENDING_DB_PATH", "SCORE_DB_PATH", "SHEET_JOURNAL_PATH"):
+            setattr(bot, name, os.path.join(self.workdir, name.lower().replace("_path", "")))
+        # Any key and credentials file turn the sheet writer on; the connection is replaced by the fake sheet
+        bot.SPREADSHEET_KEY = "loadtest"
+        bot.SERVICE_ACCOUNT_PATH = os.path.join(self.workdir, "service_account.json")
+        open(bot.SERVICE_ACCOUNT_PATH, "w").close()
+        self.client._connect_sheets = lambda: self.sheets
+        bot.METRICS_PORT = None
+        bot.OCR_CACHE_PATH = None
+        bot.OCR_QUEUE_PATH = None
+        bot.OCR_SINGLE_REQUEST = True
+        bot.EVENT_START_DATE = bot.EVENT_END_DATE = None
+
+        # The Vision answers need the composite layout, which depends only on the screen size
+        from src.ocr import IIDXReader
+        crops = IIDXReader.crop_regions(IIDXReader.decode_image(make_screenshot(0)))
+        with patch("src.ocr.vision.ImageAnnotatorClient"):
+            layout = IIDXReader(credentials_path="missing.json", max_workers=1)
+        _, bands = layout.build_composite(layout.prepare_crops(crops))
+        layout.close()
+
+        self.standin = StandInServer(bands, **self.vision_options)
+        self.standin.start()
+
+        with patch("src.ocr.vision.ImageAnnotatorClient", side_effect=lambda *a, **k: self.standin.vision_client()):
+            await self.client.setup_hook()
+            # No Discord connection to sync commands with
+            self.client.sync_task.cancel()
+            await self.client.sheets_service.get(timeout=120)
+            reader = await self.client.ocr_service.get(timeout=120)
+            await self.client.matcher_service.get(timeout=120)
+        if not self.cache:
+            reader.cache = None
+
+    async def stop(self):
+        await self.client.close()
+        self.standin.stop()
+
+    def new_player(self):
+        index = next(self.players)
+        content = make_screenshot(index)
+        url = self.standin.add_attachment(f"result_{index}.png", content)
+        user = FakeUser(10 ** 6 + index, f"player{index}")
+        return user, FakeAttachment(url, len(content), *SCREEN_SIZE)
+
+    async def play(self, user, attachment, edit):
+        """One player: /result, then 送信 (or 修正 + new score). Returns the outcome dict."""
+        outcome = {"queued": False, "preview": None, "submit": None, "error": None}
+        interaction = FakeInteraction(self.client, user, self.channel)
+        start = time.perf_counter()
+        await bot.result.callback(interaction, attachment)
+        outcome["preview"] = time.perf_counter() - start
+        outcome["queued"] = any("順番待ち" in (m.content or "") for m in interaction.messages)
+        preview = interaction.preview()
+        if preview is None:
+            outcome["error"] = interaction.last_text()
+            return outcome
+
+        click = FakeInteraction(self.client, user, self.channel)
+        start = time.perf_counter()
+        if edit:
+            button = next(item for item in preview.view.children if isinstance(item, EditButton))
+            await button.callback(click)
+            modal = click.response.modal
+            modal.score_input._refresh_state(click, {"value": "1999"})
+            click = FakeInteraction(self.client, user, self.channel)
+            await modal.on_submit(click)
+        else:
+            button = next(item for item in preview.view.children if isinstance(item, SubmitButton))
+            await button.callback(click)
+        outcome["submit"] = time.perf_counter() - start
+
+        text = click.last_text()
+        if text.startswith("送信が完了しました"):
+            self.submitted += 1
+        else:
+            outcome["error"] = text
+        return outcome
+
+    async def run_level(self, concurrency):
+        # Rendering the screenshots is the harness's own work; keep it off the loop
+        players = await asyncio.to_thread(lambda: [self.new_player() for _ in range(concurrency)])
+        edits = [self.random.random() < self.edit_rate for _ in players]
+        probe = LagProbe()
+        probe.start()
+        start = time.perf_counter()
+        outcomes = await asyncio.gather(*(self.play(user, attachment, edit)
+                                          for (user, attachment), edit in zip(players, edits)))
+        elapsed = time.perf_counter() - start
+        await probe.stop()
+
+        completed = [o for o in outcomes if not o["error"]]
+        errors = {}
+        for o in outcomes:
+            if o["error"]:
+                errors[o["error"]] = errors.get(o["error"], 0) + 1
+        lag = probe.samples or [0.0]
+        return {
+            "concurrency": concurrency,
+            "completed": len(completed),
+            "queued": sum(o["queued"] for o in outcomes),
+            "errors": errors,
+            "seconds": round(elapsed, 3),
+            "throughput_per_sec": round(len(completed) / elapsed, 2) if elapsed else None,
+            "preview": summarize([o["preview"] for o in outcomes]),
+            "submit": summarize([o["submit"] for o in outcomes if o["submit"] is not None]),
+            "loop_lag": dict(summarize(lag), max_ms=round(max(lag) * 1000, 3)),
+        }
+
+    async def flush_sheets(self, attempts=5):
+        """Writes out the journal; True once nothing is pending."""
+        for _ in range(attempts):
+            if await self.client.sheet_writer.flush():
+                return True
+            await asyncio.sleep(0.1)
+        return False
+
+
+async def run(levels, max_lag_ms=100.0, log=print, **options):
+    """Runs every concurrency level in order against one bot instance. Returns the report dict."""
+    with tempfile.TemporaryDirectory() as workdir:
+        test = LoadTest(workdir, **options)
+        await test.start()
+        try:
+            results = []
+            for concurrency in levels:
+                result = await test.run_level(concurrency)
+                log(format_level(result))
+                results.append(result)
+            flushed = await test.flush_sheets()
+            vision = {"requests": test.standin.vision_requests, "errors": test.standin.vision_errors}
+            # Stacks the bot's LoopWatchdog captured while the loop was blocked
+            stalls = [{"ms": round(stall["seconds"] * 1000, 1), "stack": stall["stack"]}
+                      for stall in test.client.watchdog.stalls]
+        finally:
+            await test.stop()
+    # Counted after the bot's shutdown (SheetWriter.stop), so rows sent twice would show here
+    rows = len(test.sheets.rows)
+
+    worst = max(results, key=lambda r: r["loop_lag"]["max_ms"])
+    return {
+        "commit": git_commit(),
+        "options": options,
+        "levels": results,
+        "submitted": test.submitted,
+        "sheet_rows": rows,
+        "sheets_flushed": flushed,
+        "vision": vision,
+        "max_lag_ms": max_lag_ms,
+        "passed": worst["loop_lag"]["max_ms"] <= max_lag_ms,
+        "worst_lag": {"concurrency": worst["concurrency"], "max_ms": worst["loop_lag"]["max_ms"]},
+        "stalls": stalls,
+    }
+
+
+def format_level(result):
+    preview, submit, lag = result["preview"], result["submit"] or {}, result["loop_lag"]
+    errors = sum(result["errors"].values())
+    return (f"{result['concurrency']:>4} players: {result['completed']} done, {errors} failed, "
+            f"{result['queued']} queued, {result['throughput_per_sec']} flows/s | "
+            f"preview p50 {preview['p50_ms']:.0f} / p99 {preview['p99_ms']:.0f} ms | "
+            f"submit p50 {submit.get('p50_ms', 0):.0f} / p99 {submit.get('p99_ms', 0):.0f} ms | "
+            f"loop lag p99 {lag['p99_ms']:.1f} / max {lag['max_ms']:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", default="1,10,25,50", help="comma-separated numbers of simultaneous players")
+    parser.add_argument("--vision-latency", type=float, default=0.3, help="Vision stand-in latency in seconds")
+    parser.add_argument("--vision-jitter", type=float, default=0.2, help="extra random Vision latency, up to this")
+    parser.add_argument("--vision-error-rate", type=float, default=0.0, help="share of Vision requests answered 503")
+    parser.add_argument("--sheets-latency", type=float, default=0.5, help="fake Sheets append latency in seconds")
+    parser.add_argument("--sheets-error-rate", type=float, default=0.0, help="share of Sheets appends that fail")
+    parser.add_argument("--edit-rate", type=float, default=0.2, help="share of players who press 修正 first")
+    parser.add_argument("--cache", action="store_true", help="keep the OCR cache enabled")
+    parser.add_argument("--max-lag-ms", type=float, default=100.0, help="fail if the event loop is blocked longer")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    levels = [int(level) for level in args.levels.split(",")]
+    report = asyncio.run(run(levels, args.max_lag_ms, vision_latency=args.vision_latency,
+                             vision_jitter=args.vision_jitter, vision_error_rate=args.vision_error_rate,
+                             sheets_latency=args.sheets_latency, sheets_error_rate=args.sheets_error_rate,
+                             edit_rate=args.edit_rate, cache=args.cache))
+
+    print(f"{report['submitted']} submitted, {report['sheet_rows']} rows in the fake sheet, "
+          f"{report['vision']['requests']} Vision requests ({report['vision']['errors']} failed)")
+    for result in report["levels"]:
+        for error, count in result["errors"].items():
+            print(f"  {result['concurrency']} players, {count}x: {error}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Report written to {args.output}")
+    if not report["passed"]:
+        worst = report["worst_lag"]
+        print(f"FAIL: event loop blocked for {worst['max_ms']:.0f} ms with {worst['concurrency']} players "
+              f"(limit {args.max_lag_ms:.0f} ms)")
+        for stall in report["stalls"][-3:]:
+            print(f"\nBlocked {stall['ms']:.0f} ms in:\n{stall['stack']}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
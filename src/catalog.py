@@ -0,0 +1,87 @@
+import logging
+import os
+import unicodedata
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_title(title):
+    """NFKC (full-width -> half-width), case-folded, whitespace collapsed."""
+    return " ".join(unicodedata.normalize("NFKC", title).casefold().split())
+
+
+class Chart(NamedTuple):
+    title: str
+    difficulty: str
+    notes: int
+
+    @property
+    def max_score(self):
+        """Max EX score: 2 points per note."""
+        return self.notes * 2
+
+
+class SongCatalog:
+    """
+    In-memory song catalog loaded from songs.txt.
+
+    One chart per line, tab-separated:
+        title<TAB>difficulty<TAB>notes
+    A line with only a title is still accepted (no score bound for it).
+    Blank lines and lines starting with '#' are ignored.
+    """
+
+    def __init__(self, charts=()):
+        self.charts = list(charts)
+        # title -> [Chart, ...]; titles keep file order
+        self.by_title = {}
+        for chart in self.charts:
+            self.by_title.setdefault(chart.title, []).append(chart)
+
+    @property
+    def titles(self):
+        return list(self.by_title)
+
+    @classmethod
+    def load(cls, path):
+        charts = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.rstrip("\r\n")
+                if not line.strip() or line.startswith("#"):
+                    continue
+                fields = [field.strip() for field in line.split("\t")]
+                title = fields[0]
+                difficulty = fields[1] if len(fields) > 1 else ""
+                notes = 0
+                if len(fields) > 2 and fields[2]:
+                    try:
+                        notes = int(fields[2])
+                    except ValueError:
+                        logger.warning("%s:%d: bad note count '%s'", os.path.basename(path), line_no, fields[2])
+                charts.append(Chart(title, difficulty, notes))
+        return cls(charts)
+
+    def max_score(self, title, difficulty=None):
+        """
+        Highest possible EX score for the title (optionally one difficulty).
+        Returns None when the catalog has no note count for it.
+        """
+        charts = [c for c in self.by_title.get(title, ())
+                  if c.notes and (not difficulty or c.difficulty == difficulty)]
+        if not charts:
+            return None
+        return max(c.max_score for c in charts)
+
+    def pick_score(self, title, candidates, fallback=None):
+        """
+        Chooses the OCR score candidate for a matched title.
+        Candidates above the chart's max EX score are impossible and dropped;
+        the largest remaining one wins. Without a bound, `fallback` is returned.
+        """
+        bound = self.max_score(title)
+        if bound is None:
+            return fallback
+        valid = [c for c in candidates if 0 < c <= bound]
+        return max(valid) if valid else None
@@ -0,0 +1,73 @@
+import threading
+
+from src.catalog import normalize_title
+
+
+def result_key(user, data):
+    """(user, normalized title, date, score) identifying one result, or None if incomplete."""
+    title, date, score = data.get('title'), data.get('date'), data.get('score')
+    if user is None or user == "" or not (title and date and score):
+        return None
+    date = str(date).replace('/', '-').replace('.', '-').strip()
+    return user, normalize_title(str(title)), date, int(score)
+
+
+class DuplicateIndex:
+    """
+    In-memory index of everything already submitted, so duplicates are caught
+    before any write: the same result from the same user, or the same image
+    file from anyone. Loaded once from the local ScoreStore and updated on
+    every accepted submission.
+
+    Results are keyed by Discord user id, so renaming doesn't get around it.
+    Rows that only have a display name (read back from the sheet, or stored
+    before user ids were kept) are matched by name instead.
+    """
+
+    def __init__(self):
+        self.keys = set()
+        self.name_keys = set()
+        self.image_hashes = set()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys) + len(self.name_keys)
+
+    def load(self, rows):
+        """Replaces the index with (user_id, username, title, date, score, image_hash) rows."""
+        keys = set()
+        name_keys = set()
+        image_hashes = set()
+        for user_id, username, title, date, score, image_hash in rows:
+            data = {'title': title, 'date': date, 'score': score}
+            if user_id is not None:
+                key = result_key(user_id, data)
+                if key:
+                    keys.add(key)
+            else:
+                key = result_key(username, data)
+                if key:
+                    name_keys.add(key)
+            if image_hash:
+                image_hashes.add(image_hash)
+        with self.lock:
+            self.keys = keys
+            self.name_keys = name_keys
+            self.image_hashes = image_hashes
+
+    def check(self, user_id, username, data, image_hash=None):
+        """Returns why the submission is a duplicate ('result' or 'image'), or None."""
+        with self.lock:
+            if image_hash and image_hash in self.image_hashes:
+                return "image"
+            if result_key(user_id, data) in self.keys or result_key(username, data) in self.name_keys:
+                return "result"
+        return None
+
+    def add(self, user_id, data, image_hash=None):
+        key = result_key(user_id, data)
+        with self.lock:
+            if key:
+                self.keys.add(key)
+            if image_hash:
+                self.image_hashes.add(image_hash)
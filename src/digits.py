@@ -0,0 +1,199 @@
+import os
+
+import cv2
+import numpy as np
+
+# Glyphs are padded to a square and scaled to this size before matching
+GLYPH_SIZE = 20
+# Components shorter than this fraction of the tallest one are separators
+# ('-', ':', '/') or noise, not digits.
+MIN_DIGIT_HEIGHT = 0.6
+# A horizontal gap wider than this fraction of the digit height starts a new group
+GROUP_GAP = 0.45
+
+
+class DigitRecognizer:
+    """
+    Local OCR engine for the fixed-font digits in the date and score regions.
+
+    Implements the IIDXReader local engine interface: recognize(crops) takes
+    {region name: crop} and returns {region name: text} for the regions it read
+    confidently. Regions it leaves out are sent to Cloud Vision instead.
+
+    Each crop is binarized, split into connected components, and every
+    digit-sized component is matched against the stored glyph templates with
+    a vectorized distance. Separators are not classified; they show up as gaps
+    between digit groups.
+    """
+
+    regions = ("date", "score")
+
+    def __init__(self, templates=None, min_confidence=0.85):
+        # {character: [glyph, ...]}
+        self.templates = {}
+        self.min_confidence = min_confidence
+        self._matrix = None
+        self._labels = None
+        for char, glyphs in (templates or {}).items():
+            for glyph in glyphs:
+                self.add_template(char, glyph)
+
+    # --- Templates ---
+
+    def add_template(self, char, glyph):
+        self.templates.setdefault(char, []).append(glyph.astype(np.float32))
+        self._matrix = None
+
+    def learn(self, crop, text):
+        """
+        Adds templates from a crop whose digits are known, e.g. learn(score_crop, "1234").
+        Returns False if the number of digit components doesn't match the text.
+        """
+        digits = [c for c in text if c.isdigit()]
+        glyphs = [glyph for _, glyph in self.segment(crop)]
+        if len(glyphs) != len(digits):
+            return False
+        for char, glyph in zip(digits, glyphs):
+            self.add_template(char, glyph)
+        return True
+
+    def save(self, directory):
+        """Writes templates as <directory>/<char>_<n>.png."""
+        os.makedirs(directory, exist_ok=True)
+        for char, glyphs in self.templates.items():
+            for i, glyph in enumerate(glyphs):
+                cv2.imwrite(os.path.join(directory, f"{char}_{i}.png"), (glyph * 255).astype(np.uint8))
+
+    @classmethod
+    def load(cls, directory, **kwargs):
+        """Loads templates written by save()."""
+        recognizer = cls(**kwargs)
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".png"):
+                continue
+            glyph = cv2.imread(os.path.join(directory, name), cv2.IMREAD_GRAYSCALE)
+            if glyph is not None:
+                recognizer.add_template(name.split("_")[0], glyph / 255.0)
+        return recognizer
+
+    # --- Recognition ---
+
+    def segment(self, crop):
+        """Returns [(bounding box, normalized glyph)] for digit-sized components, left to right."""
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        # Text must be the foreground (white)
+        if np.count_nonzero(binary) > binary.size / 2:
+            binary = cv2.bitwise_not(binary)
+
+        count, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+        if count <= 1:
+            return []
+        boxes = stats[1:, :4]
+        max_height = boxes[:, 3].max()
+        boxes = boxes[boxes[:, 3] >= max_height * MIN_DIGIT_HEIGHT]
+        boxes = boxes[np.argsort(boxes[:, 0])]
+
+        return [(tuple(box), self._normalize(binary[box[1]:box[1] + box[3], box[0]:box[0] + box[2]]))
+                for box in boxes]
+
+    def classify(self, glyphs):
+        """Returns (characters, confidences) for a list of normalized glyphs."""
+        if self._matrix is None:
+            labels, rows = [], []
+            for char, templates in self.templates.items():
+                for glyph in templates:
+                    labels.append(char)
+                    rows.append(glyph.ravel())
+            self._labels = np.array(labels)
+            self._matrix = np.stack(rows)
+
+        queries = np.stack([g.ravel() for g in glyphs])
+        # Squared euclidean distance between every glyph and every template
+        distances = (
+            (queries ** 2).sum(axis=1)[:, None]
+            + (self._matrix ** 2).sum(axis=1)[None, :]
+            - 2 * queries @ self._matrix.T
+        )
+        best = distances.argmin(axis=1)
+        best_distance = np.maximum(distances[np.arange(len(glyphs)), best], 0) / queries.shape[1]
+        return list(self._labels[best]), list(1.0 - np.sqrt(best_distance))
+
+    def read(self, crop):
+        """Returns (digit groups, confidence) for one crop."""
+        segments = self.segment(crop)
+        if not segments or not self.templates:
+            return [], 0.0
+
+        chars, confidences = self.classify([glyph for _, glyph in segments])
+        groups = [chars[0]]
+        for (prev, _), (box, _), char in zip(segments, segments[1:], chars[1:]):
+            gap = box[0] - (prev[0] + prev[2])
+            if gap > max(prev[3], box[3]) * GROUP_GAP:
+                groups.append(char)
+            else:
+                groups[-1] += char
+        return groups, float(min(confidences))
+
+    def recognize(self, crops):
+        texts = {}
+        for name, crop in crops.items():
+            if name not in self.regions or crop.size == 0:
+                continue
+            groups, confidence = self.read(crop)
+            if confidence < self.min_confidence:
+                continue
+            text = self._format(name, groups)
+            if text:
+                texts[name] = text
+        return texts
+
+    @staticmethod
+    def _format(region, groups):
+        """Rebuilds text the parser understands from digit groups; None if the layout is unexpected."""
+        lengths = [len(g) for g in groups]
+        if region == "date":
+            if lengths == [4, 2, 2, 2, 2]:
+                return f"{groups[0]}-{groups[1]}-{groups[2]} {groups[3]}:{groups[4]}"
+            if lengths == [4, 2, 2]:
+                return f"{groups[0]}-{groups[1]}-{groups[2]}"
+            return None
+        return " ".join(groups) if groups else None
+
+    @staticmethod
+    def _normalize(component):
+        """Pads a binary glyph to a square and scales it to GLYPH_SIZE, values in [0, 1]."""
+        h, w = component.shape
+        side = max(h, w)
+        square = np.zeros((side, side), dtype=np.uint8)
+        top, left = (side - h) // 2, (side - w) // 2
+        square[top:top + h, left:left + w] = component
+        resized = cv2.resize(square, (GLYPH_SIZE, GLYPH_SIZE), interpolation=cv2.INTER_AREA)
+        return resized.astype(np.float32) / 255.0
+
+
+if __name__ == "__main__":
+    # Build templates from labelled screenshots:
+    #   python -m src.digits <templates_dir> <image> <score> [<image> <score> ...]
+    import sys
+    from src.ocr import REGIONS
+
+    if len(sys.argv) < 4 or len(sys.argv) % 2:
+        print("Usage: python -m src.digits <templates_dir> <image> <score> [<image> <score> ...]")
+        sys.exit(1)
+
+    out_dir = sys.argv[1]
+    recognizer = DigitRecognizer.load(out_dir) if os.path.isdir(out_dir) else DigitRecognizer()
+    for image_path, score in zip(sys.argv[2::2], sys.argv[3::2]):
+        img = cv2.imread(image_path)
+        if img is None:
+            print(f"Could not read {image_path}")
+            continue
+        height, width = img.shape[:2]
+        y0, y1, x0, x1 = REGIONS["score"]
+        crop = img[int(height*y0):int(height*y1), int(width*x0):int(width*x1)]
+        if recognizer.learn(crop, score):
+            print(f"Learned {score} from {image_path}")
+        else:
+            print(f"Skipped {image_path}: digit count doesn't match {score}")
+    recognizer.save(out_dir)
@@ -0,0 +1,115 @@
+import logging
+
+import aiohttp
+
+from src.imageinfo import SNIFF_LIMIT, sniff_image
+from src.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_FORMATS = ("png", "jpeg", "webp")
+CHUNK_SIZE = 64 * 1024
+
+
+class IngestError(Exception):
+    """An attachment that can't be a result screenshot. The message is shown to the user."""
+
+    def __init__(self, message, reason):
+        super().__init__(message)
+        self.reason = reason
+
+
+class AttachmentIngestor:
+    """
+    Downloads attachments for OCR, rejecting anything that can't be an IIDX
+    result screen as early as possible:
+
+    1. content type, size and (when Discord reports them) dimensions are
+       checked before downloading anything;
+    2. the download is streamed through one shared aiohttp session, and is
+       aborted once it exceeds `max_bytes` or once the sniffed header shows a
+       wrong format or aspect ratio.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024, min_width=640, min_aspect=1.2, max_aspect=2.4,
+                 timeout=30.0):
+        self.max_bytes = max_bytes
+        self.min_width = min_width
+        self.min_aspect = min_aspect
+        self.max_aspect = max_aspect
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session = None
+
+    async def start(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(timeout=self.timeout)
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+    def _reject(self, message, reason):
+        METRICS.inc("rejections_total", reason=reason)
+        return IngestError(message, reason)
+
+    def check_metadata(self, content_type, size, width=None, height=None):
+        """Checks what Discord tells us about the attachment, before downloading it."""
+        if not content_type or not content_type.startswith('image/'):
+            raise self._reject("画像ファイルをアップロードしてください。", "not_image")
+        if content_type == 'image/gif':
+            raise self._reject("GIF画像には対応していません。PNGまたはJPEGでアップロードしてください。", "bad_format")
+        if size and size > self.max_bytes:
+            raise self._reject(
+                f"画像サイズが大きすぎます（上限 {self.max_bytes // (1024 * 1024)}MB）。", "too_large")
+        if width and height:
+            self.check_dimensions(width, height)
+
+    def check_dimensions(self, width, height):
+        if width < self.min_width:
+            raise self._reject("画像の解像度が低すぎます。元のスクリーンショットをアップロードしてください。", "too_small")
+        aspect = width / height if height else 0
+        if not (self.min_aspect <= aspect <= self.max_aspect):
+            raise self._reject("リザルト画面の画像ではないようです。横向きのリザルト画面をアップロードしてください。",
+                               "bad_aspect")
+
+    async def fetch(self, attachment, deadline=None):
+        """
+        Validates and downloads a discord.Attachment. Returns the image as a bytearray.
+        With a Deadline, the download may take at most its remaining time.
+        """
+        self.check_metadata(attachment.content_type, attachment.size, attachment.width, attachment.height)
+        await self.start()
+
+        data = bytearray()
+        sniffed = False
+        options = {}
+        if deadline:
+            options["timeout"] = aiohttp.ClientTimeout(total=deadline.timeout(self.timeout.total))
+        async with self.session.get(attachment.url, **options) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                data += chunk
+                if len(data) > self.max_bytes:
+                    raise self._reject(
+                        f"画像サイズが大きすぎます（上限 {self.max_bytes // (1024 * 1024)}MB）。", "too_large")
+                if not sniffed:
+                    sniffed = self._check_header(data, final=False)
+
+        if not sniffed:
+            self._check_header(data, final=True)
+        return data
+
+    def _check_header(self, data, final):
+        """Returns True once the header has been checked; False if more data is needed."""
+        info = sniff_image(data)
+        if info is None:
+            if not final and len(data) < SNIFF_LIMIT:
+                return False
+            # Unknown header: leave the decision to the decoder
+            logger.debug("Could not sniff image header (%d bytes)", len(data))
+            return True
+        fmt, width, height = info
+        if fmt not in ALLOWED_FORMATS:
+            raise self._reject("PNGまたはJPEGの画像をアップロードしてください。", "bad_format")
+        self.check_dimensions(width, height)
+        return True
@@ -0,0 +1,234 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from src.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Largest number of ids per "IN (...)" query (SQLite's default variable limit is 999)
+ID_CHUNK = 500
+
+
+class JobFailed(Exception):
+    """A worker could not process the job. The message is the worker's error."""
+
+
+class JobQueue:
+    """
+    OCR jobs shared by the bot and the worker processes (worker.py) through one
+    SQLite file in WAL mode, so no outside service is needed.
+
+    The bot enqueues a downloaded screenshot with its metadata; a worker claims
+    it, runs OCR and title matching and stores the outcome, which the bot reads
+    back. Jobs go queued -> running -> done | failed. A running job whose
+    worker disappeared is queued again after `stale_after` seconds, at most
+    `max_attempts` times. Every process opens its own JobQueue on the file.
+    """
+
+    def __init__(self, db_path="jobs.db", stale_after=120.0, max_attempts=3):
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        # Autocommit; claim() takes the write lock itself with BEGIN IMMEDIATE
+        self.db = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " status TEXT NOT NULL,"
+            " image BLOB,"
+            " meta TEXT NOT NULL,"
+            " result TEXT,"
+            " error TEXT,"
+            " worker TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL,"
+            " claimed_at REAL,"
+            " finished_at REAL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+
+    def enqueue(self, image, meta):
+        """Queues one screenshot. Returns the job id."""
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT INTO jobs (status, image, meta, created_at) VALUES ('queued', ?, ?, ?)",
+                (bytes(image), json.dumps(meta, ensure_ascii=False), time.time()),
+            )
+            return cursor.lastrowid
+
+    def claim(self, worker):
+        """Takes the oldest queued job for `worker`. Returns (job id, image, meta) or None."""
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute(
+                    "SELECT id, image, meta FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+                if row:
+                    self.db.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, claimed_at = ?, attempts = attempts + 1"
+                        " WHERE id = ?",
+                        (worker, time.time(), row[0]),
+                    )
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def finish(self, job_id, result):
+        """Stores the outcome of a job (a JSON-serializable dict)."""
+        self._close_job(job_id, "done", json.dumps(result, ensure_ascii=False), None)
+
+    def fail(self, job_id, error):
+        self._close_job(job_id, "failed", None, str(error))
+
+    def _close_job(self, job_id, status, result, error):
+        with self.lock:
+            # The image is not needed any more; the bot deletes the row once it has read it
+            self.db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, image = NULL, finished_at = ?"
+                " WHERE id = ? AND status = 'running'",
+                (status, result, error, time.time(), job_id),
+            )
+
+    def results(self, job_ids):
+        """{job id: (status, result dict or None, error)} for the finished jobs among job_ids."""
+        finished = {}
+        with self.lock:
+            for i in range(0, len(job_ids), ID_CHUNK):
+                chunk = job_ids[i:i + ID_CHUNK]
+                rows = self.db.execute(
+                    f"SELECT id, status, result, error FROM jobs WHERE status IN ('done', 'failed')"
+                    f" AND id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for job_id, status, result, error in rows:
+                    finished[job_id] = (status, json.loads(result) if result else None, error)
+        return finished
+
+    def delete(self, job_ids):
+        with self.lock:
+            for i in range(0, len(job_ids), ID_CHUNK):
+                chunk = job_ids[i:i + ID_CHUNK]
+                self.db.execute(f"DELETE FROM jobs WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+
+    def requeue_stale(self):
+        """Puts jobs of vanished workers back in the queue (or fails them). Returns how many."""
+        cutoff = time.time() - self.stale_after
+        with self.lock:
+            self.db.execute(
+                "UPDATE jobs SET status = 'failed', error = 'worker did not finish', image = NULL, finished_at = ?"
+                " WHERE status = 'running' AND claimed_at < ? AND attempts >= ?",
+                (time.time(), cutoff, self.max_attempts),
+            )
+            cursor = self.db.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL WHERE status = 'running' AND claimed_at < ?",
+                (cutoff,),
+            )
+            return cursor.rowcount
+
+    def purge(self):
+        """Drops every job, e.g. at bot startup when no one is waiting for the old ones."""
+        with self.lock:
+            return self.db.execute("DELETE FROM jobs").rowcount
+
+    def counts(self):
+        """{status: number of jobs}."""
+        with self.lock:
+            return dict(self.db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class JobClient:
+    """
+    Bot side of the JobQueue: submits jobs and waits for their outcome.
+
+    A single poller task reads the outcome of every outstanding job with one
+    query per `poll_interval`, deletes finished and abandoned jobs, and
+    periodically re-queues jobs of workers that died.
+    """
+
+    def __init__(self, queue, poll_interval=0.1, stale_check_interval=30.0):
+        self.queue = queue
+        self.poll_interval = poll_interval
+        self.stale_check_interval = stale_check_interval
+        self.futures = {}
+        self.abandoned = []
+        self._task = None
+
+    def start(self):
+        """Starts polling. Must be called from a running event loop."""
+        if self._task is None:
+            dropped = self.queue.purge()
+            if dropped:
+                logger.info("Dropped %d OCR jobs left by a previous run.", dropped)
+            self._task = asyncio.create_task(self._poll(), name="job-poller")
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.queue.close()
+
+    async def run(self, image, meta, timeout=None):
+        """
+        Queues a screenshot and waits up to `timeout` seconds for a worker.
+        Returns (data, rejection message); raises JobFailed if the worker failed.
+        """
+        job_id = await asyncio.to_thread(self.queue.enqueue, image, meta)
+        future = asyncio.get_running_loop().create_future()
+        self.futures[job_id] = future
+        METRICS.inc("ocr_jobs_total")
+        start = time.perf_counter()
+        try:
+            status, result, error = await asyncio.wait_for(future, timeout)
+        finally:
+            del self.futures[job_id]
+            if future.cancelled() or not future.done():
+                # Timed out or cancelled: nobody will read this job
+                self.abandoned.append(job_id)
+        METRICS.observe("ocr_job_seconds", time.perf_counter() - start)
+        if status == "failed":
+            METRICS.inc("errors_total", stage="ocr_job")
+            raise JobFailed(error)
+        return result.get("data"), result.get("rejection")
+
+    async def _poll(self):
+        last_stale_check = time.monotonic()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                finished = {}
+                if self.futures:
+                    finished = await asyncio.to_thread(self.queue.results, list(self.futures))
+                for job_id, outcome in finished.items():
+                    future = self.futures.get(job_id)
+                    if future and not future.done():
+                        future.set_result(outcome)
+                done = list(finished) + self.abandoned
+                self.abandoned = []
+                if done:
+                    await asyncio.to_thread(self.queue.delete, done)
+                if time.monotonic() - last_stale_check > self.stale_check_interval:
+                    last_stale_check = time.monotonic()
+                    requeued = await asyncio.to_thread(self.queue.requeue_stale)
+                    if requeued:
+                        logger.warning("Re-queued %d OCR jobs of unresponsive workers.", requeued)
+            except Exception as e:
+                METRICS.inc("errors_total", stage="job_poll")
+                logger.exception("OCR job polling failed: %s", e)
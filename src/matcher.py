@@ -1,37 +1,168 @@
 from rapidfuzz import process, fuzz
+from collections import OrderedDict, defaultdict
+import logging
 import os
+import threading
+import time
+from src.catalog import SongCatalog, normalize_title
+from src.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Lower threshold for messy OCR
+MATCH_THRESHOLD = 45.0
+# Catalogs larger than this are shortlisted with the n-gram index before WRatio
+SHORTLIST_SIZE = 64
+NGRAM = 2
+
+
+def ngrams(text, n=NGRAM):
+    text = text.replace(" ", "")
+    if len(text) < n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class TitleIndex:
+    """Immutable search index over one version of the song list."""
+
+    def __init__(self, songs, catalog=None, memo_size=1024):
+        self.songs = songs
+        self.catalog = catalog or SongCatalog()
+        self.normalized = [normalize_title(s) for s in songs]
+        # n-gram -> indexes of songs containing it
+        self.postings = defaultdict(list)
+        for i, title in enumerate(self.normalized):
+            for gram in ngrams(title):
+                self.postings[gram].append(i)
+        self.memo = OrderedDict()
+        self.memo_size = memo_size
+        self.lock = threading.Lock()
+
+    def shortlist(self, query):
+        """Indexes of the songs sharing the most n-grams with the query."""
+        if len(self.songs) <= SHORTLIST_SIZE:
+            return range(len(self.songs))
+        counts = defaultdict(int)
+        for gram in ngrams(query):
+            for i in self.postings.get(gram, ()):
+                counts[i] += 1
+        if not counts:
+            return range(len(self.songs))
+        return sorted(counts, key=counts.get, reverse=True)[:SHORTLIST_SIZE]
+
+    def best_match(self, ocr_title):
+        """Returns (song, score) for the closest title, or None."""
+        query = normalize_title(ocr_title)
+        with self.lock:
+            if query in self.memo:
+                self.memo.move_to_end(query)
+                return self.memo[query]
+
+        choices = {i: self.normalized[i] for i in self.shortlist(query)}
+        # WRatio handles case, partial matching, and sorting well
+        result = process.extractOne(query, choices, scorer=fuzz.WRatio, processor=None)
+        match = (self.songs[result[2]], result[1]) if result else None
+
+        with self.lock:
+            self.memo[query] = match
+            while len(self.memo) > self.memo_size:
+                self.memo.popitem(last=False)
+        return match
+
 
 class TitleMatcher:
-    def __init__(self, song_list_path="songs.txt"):
-        self.songs = []
+    def __init__(self, song_list_path="songs.txt", reload_interval=5.0):
+        self.song_list_path = song_list_path
+        self.reload_interval = reload_interval
+        self.index = TitleIndex([])
+        self._mtime = None
+        self._checked_at = 0.0
         if os.path.exists(song_list_path):
-            with open(song_list_path, 'r', encoding='utf-8') as f:
-                self.songs = [line.strip() for line in f if line.strip()]
+            self.reload()
         else:
-            print(f"Warning: {song_list_path} not found. Fuzzy matching disabled.")
+            logger.warning("%s not found. Fuzzy matching disabled.", song_list_path)
+
+    @property
+    def songs(self):
+        return self.index.songs
+
+    @property
+    def catalog(self):
+        """SongCatalog (charts and note counts) for the current song list."""
+        return self.index.catalog
+
+    def reload(self):
+        """Rebuilds the index from the song list and swaps it in atomically."""
+        mtime = os.stat(self.song_list_path).st_mtime_ns
+        catalog = SongCatalog.load(self.song_list_path)
+        # Build fully before swapping so concurrent lookups never see a partial index
+        self.index = TitleIndex(catalog.titles, catalog)
+        self._mtime = mtime
+        logger.info("Loaded %d songs (%d charts) from %s.", len(catalog.titles), len(catalog.charts), self.song_list_path)
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.song_list_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._mtime:
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error("Song list reload failed, keeping previous list: %s", e)
 
     def correct_title(self, ocr_title):
         """
         Returns the best matching title from the song list.
         If no songs are loaded or match score is too low, returns original.
         """
-        if not self.songs or not ocr_title:
+        self._reload_if_changed()
+        index = self.index
+        if not index.songs or not ocr_title:
             return ocr_title
 
-        # extractOne returns (match, score, index)
-        # WRatio handles case, partial matching, and sorting well
-        result = process.extractOne(ocr_title, self.songs, scorer=fuzz.WRatio)
-        
+        with METRICS.timer("title_match_seconds"):
+            result = index.best_match(ocr_title)
+
         if result:
-            match, score, _ = result
-            print(f"DEBUG: Matching '{ocr_title}' -> '{match}' (Score: {score})")
-            
-            # Lower threshold for messy OCR
-            if score >= 45.0:
+            match, score = result
+            logger.debug("Matching '%s' -> '%s' (Score: %s)", ocr_title, match, score)
+
+            if score >= MATCH_THRESHOLD:
                 return match
-        
+
         return ocr_title
 
+    def correct_titles(self, ocr_titles):
+        """
+        correct_title for many titles at once (bulk imports): one index snapshot,
+        and each distinct title is matched only once.
+        """
+        self._reload_if_changed()
+        index = self.index
+        corrected = {}
+        for ocr_title in set(ocr_titles):
+            corrected[ocr_title] = ocr_title
+            if not index.songs or not ocr_title:
+                continue
+            result = index.best_match(ocr_title)
+            if result and result[1] >= MATCH_THRESHOLD:
+                corrected[ocr_title] = result[0]
+        return [corrected[ocr_title] for ocr_title in ocr_titles]
+
+    def pick_score(self, title, data):
+        """
+        Re-picks the OCR score for a corrected title, dropping candidates
+        above the chart's max EX score (2 x notes). Keeps the OCR score
+        when the catalog has no note count for the song.
+        """
+        return self.catalog.pick_score(title, data.get('score_candidates') or [], fallback=data.get('score'))
+
 if __name__ == "__main__":
     # Test
     matcher = TitleMatcher()
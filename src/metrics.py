@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Latency buckets in seconds (Prometheus histogram upper bounds)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Recent samples kept per histogram for the percentiles shown by /stats
+RECENT_SAMPLES = 1024
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+                break
+
+    def percentile(self, q):
+        """q-th percentile (0-100) of the recent samples, or None."""
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class Metrics:
+    """
+    Process-wide latency histograms and counters.
+
+    Series are identified by a name plus optional labels, e.g.
+    METRICS.inc("rejections_total", reason="missing_date"). Safe to use from
+    the OCR worker threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.started_at = time.time()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name, seconds, **labels):
+        with self.lock:
+            key = self._key(name, labels)
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        with self.lock:
+            key = self._key(name, labels)
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observes the duration of the with-block, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def percentile(self, name, q, min_samples=1, **labels):
+        """q-th percentile of the recent samples of one histogram, or None with fewer than min_samples."""
+        with self.lock:
+            histogram = self.histograms.get(self._key(name, labels))
+            if histogram is None or len(histogram.recent) < min_samples:
+                return None
+            return histogram.percentile(q)
+
+    def counter(self, name, **labels):
+        with self.lock:
+            return self.counters.get(self._key(name, labels), 0)
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.started_at = time.time()
+
+    def snapshot(self):
+        """Plain-dict view for /stats: counters and p50/p95/p99 of each histogram."""
+        with self.lock:
+            counters = {_series(name, labels): value for (name, labels), value in sorted(self.counters.items())}
+            histograms = {}
+            for (name, labels), h in sorted(self.histograms.items()):
+                histograms[_series(name, labels)] = {
+                    "count": h.count,
+                    "p50": h.percentile(50),
+                    "p95": h.percentile(95),
+                    "p99": h.percentile(99),
+                }
+            return {"uptime": time.time() - self.started_at, "counters": counters, "histograms": histograms}
+
+    def render_prometheus(self):
+        """Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{_series(name, labels)} {value}")
+
+            for (name, labels), h in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                cumulative = 0
+                for bound, count in zip(h.buckets, h.bucket_counts):
+                    cumulative += count
+                    lines.append(f"{_series(name + '_bucket', labels + (('le', repr(bound)),))} {cumulative}")
+                lines.append(f"{_series(name + '_bucket', labels + (('le', '+Inf'),))} {h.count}")
+                lines.append(f"{_series(name + '_sum', labels)} {h.sum}")
+                lines.append(f"{_series(name + '_count', labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _series(name, labels):
+    if not labels:
+        return name
+    inner = ",".join(f'{key}="{value}"' for key, value in labels)
+    return f"{name}{{{inner}}}"
+
+
+METRICS = Metrics()
+
+
+async def start_http_server(port, host="127.0.0.1", metrics=METRICS):
+    """Serves metrics.render_prometheus() at http://host:port/metrics. Returns the aiohttp runner."""
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=metrics.render_prometheus(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
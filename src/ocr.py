@@ -1,104 +1,546 @@
+import asyncio
 import cv2
+import logging
 import re
 import numpy as np
 import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from google.cloud import vision
+from src.imageinfo import sniff_image
+from src.ocr_cache import content_hash, perceptual_hash
+from src.metrics import METRICS
+from src.resilience import CircuitOpen
+
+logger = logging.getLogger(__name__)
+
+# Crop regions as fractions of the screenshot: (y0, y1, x0, x1)
+REGIONS = {
+    # Tuned: 0.015-0.045 / 0.03-0.37 (Tight crop works well)
+    "date": (0.015, 0.045, 0.03, 0.37),
+    # Tuned: 0.485-0.515 / 0.65-0.86
+    "score": (0.485, 0.515, 0.65, 0.86),
+    # Tuned: 0.245-0.268 / 0.05-0.95
+    "title": (0.245, 0.268, 0.05, 0.95),
+}
+
+# Black rows inserted between crops in the composite image so that
+# words from neighbouring regions never share a line.
+COMPOSITE_GAP = 24
+
+# The crop regions are legible at 1080p, so larger captures (4K etc.) are
+# decoded at 1/2, 1/4 or 1/8 resolution.
+TARGET_WIDTH = 1920
+REDUCED_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+]
+
+# Encode stage: each crop is converted to grayscale and downsampled to at most
+# this many px (still legible for Vision). 1080p crops are 25-32px already and
+# 4K captures are decoded at reduced resolution, so this only shrinks captures
+# in between, such as 1440p.
+MAX_CROP_HEIGHT = 32
+
+# The composite holds the date and score digits, so it is sent losslessly
+COMPACT_ENCODING = ('.png', [cv2.IMWRITE_PNG_COMPRESSION, 6])
+
+# In per-crop mode the title crop goes on its own; it is fuzzy-matched against
+# the song list afterwards, so lossy compression is fine there
+TITLE_ENCODING = ('.jpg', [cv2.IMWRITE_JPEG_QUALITY, 85])
+
+# Cloud Vision accepts at most 16 images per batch_annotate_images call
+MAX_BATCH_IMAGES = 16
+
+# Hedged Vision calls: a second request is sent once the first has taken longer
+# than the recent p95, if at least this many calls have been measured
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20
+
+
+def add_stat(stats, key, value):
+    """Accumulates a per-stage timing (seconds) or counter into an optional stats dict."""
+    if stats is not None:
+        stats[key] = stats.get(key, 0) + value
+
+
+def prepare_request(image, compact_encoding=True):
+    """
+    CPU half of a single-request OCR: decode, crop, composite and encode.
+    Needs no Vision client, so it can run in worker processes (see backfill.py).
+    Returns (content, bands) for IIDXReader.annotate_batch / assign_words.
+    """
+    img = IIDXReader.decode_image(image)
+    crops = IIDXReader.crop_regions(img)
+    if compact_encoding:
+        crops = downsample_crops(crops)
+    composite, bands = IIDXReader.build_composite(crops)
+    ext, params = COMPACT_ENCODING if compact_encoding else ('.jpg', [])
+    success, encoded = cv2.imencode(ext, composite, params)
+    if not success:
+        raise ValueError("Could not encode image")
+    return encoded.tobytes(), bands
+
+
+def downsample_crops(crops):
+    """Grayscale and downsample each crop to at most MAX_CROP_HEIGHT."""
+    prepared = {}
+    for name, crop in crops.items():
+        crop = IIDXReader.preprocess_crop(crop)
+        h, w = crop.shape[:2]
+        if h > MAX_CROP_HEIGHT:
+            scale = MAX_CROP_HEIGHT / h
+            crop = cv2.resize(crop, (max(1, round(w * scale)), MAX_CROP_HEIGHT), interpolation=cv2.INTER_AREA)
+        prepared[name] = crop
+    return prepared
+
 
 class IIDXReader:
-    def __init__(self, credentials_path="service_account.json"):
+    def __init__(self, credentials_path="service_account.json", single_request=True, max_workers=4, cache=None,
+                 local_engine=None, rate_limiter=None, compact_encoding=True, vision_timeout=10.0,
+                 circuit_breaker=None, hedge=False, preprocess_pool=None):
         # Set credential path for Google Cloud Client
         if os.path.exists(credentials_path):
             os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials_path
         self.client = vision.ImageAnnotatorClient()
+        # True: one Vision call per screenshot (composite of all crops)
+        # False: legacy mode, one Vision call per crop
+        self.single_request = single_request
+        # OCR (decode, Vision gRPC call, parsing) is blocking, so it runs here
+        # instead of on the discord.py event loop.
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ocr")
+        # Optional OCRCache; re-uploads of the same screenshot skip Vision
+        self.cache = cache
+        # Optional local OCR engine (e.g. DigitRecognizer). It gets the crops first;
+        # regions it can't read confidently, and the title, still go to Vision.
+        self.local_engine = local_engine
+        # Optional TokenBucket shared by all Vision callers (QPS quota)
+        self.rate_limiter = rate_limiter
+        # True: grayscale, downsampled crops sent as PNG (COMPACT_ENCODING)
+        # False: legacy full-resolution colour JPEG
+        self.compact_encoding = compact_encoding
+        # Per-call Vision timeout (seconds), further capped by the caller's Deadline
+        self.vision_timeout = vision_timeout
+        # Optional CircuitBreaker: fail fast while Vision keeps failing
+        self.circuit_breaker = circuit_breaker
+        # True: send a second request when the first is slower than the recent p95
+        self.hedge = hedge
+        self.hedge_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="vision-hedge") if hedge else None
+        # Optional PreprocessPool: decode and crop in worker processes instead of
+        # these threads (shut down with the reader)
+        self.preprocess_pool = preprocess_pool
 
-    def preprocess_crop(self, crop):
+    @staticmethod
+    def preprocess_crop(crop):
         """Minimal preprocessing for Cloud Vision (just grayscale usually enough)"""
         # Cloud Vision is robust, maybe just simple grayscale?
         # Actually usually native color is fine too.
         # Let's clean it a bit just in case.
+        if crop.ndim == 2:
+            return crop
         gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
         return gray
 
-    def recognize_text_cloud(self, image_array):
-        """Sends numpy image to Cloud Vision API and returns full text."""
-        success, encoded_image = cv2.imencode('.jpg', image_array)
+    def prepare_crops(self, crops):
+        """Grayscale and downsample each crop for sending (no-op without compact encoding)."""
+        if not self.compact_encoding:
+            return crops
+        return downsample_crops(crops)
+
+    def encoding(self, region=None):
+        """(format, params) the given crop, or the composite when region is None, is sent in."""
+        if not self.compact_encoding:
+            return ('.jpg', [])
+        return TITLE_ENCODING if region == "title" else COMPACT_ENCODING
+
+    def _annotate(self, image_array, stats=None, encoding=('.jpg', []), deadline=None):
+        """Sends numpy image to Cloud Vision API and returns the raw text annotations."""
+        start = time.perf_counter()
+        ext, params = encoding
+        success, encoded_image = cv2.imencode(ext, image_array, params)
         if not success:
-            return ""
-        
+            return []
+
         content = encoded_image.tobytes()
+        add_stat(stats, "encode", time.perf_counter() - start)
+        add_stat(stats, "bytes_sent", len(content))
+        add_stat(stats, "vision_calls", 1)
+        METRICS.inc("vision_bytes_sent_total", len(content))
+        logger.debug("Sending %d bytes (%s, %dx%d) to Vision", len(content), ext, image_array.shape[1], image_array.shape[0])
         image = vision.Image(content=content)
-        
+
         # Hint Japanese and English
         image_context = vision.ImageContext(language_hints=["ja", "en"])
-        
-        response = self.client.text_detection(image=image, image_context=image_context)
-        texts = response.text_annotations
-        
+
+        if self.rate_limiter:
+            waited = self.rate_limiter.acquire(deadline=deadline)
+            if waited:
+                METRICS.observe("vision_quota_wait_seconds", waited)
+
+        timeout = deadline.timeout(self.vision_timeout) if deadline else self.vision_timeout
+        start = time.perf_counter()
+        try:
+            response = self._call_vision(
+                lambda t: self.client.text_detection(image=image, image_context=image_context, timeout=t), timeout)
+        finally:
+            add_stat(stats, "ocr", time.perf_counter() - start)
+
         if response.error.message:
             raise Exception(f'{response.error.message}')
 
+        return response.text_annotations
+
+    def _call_vision(self, call, timeout, batch=False):
+        """
+        Runs call(timeout) against Vision with the circuit breaker, and hedged if enabled.
+        Raises CircuitOpen without calling while the circuit is open. Batch calls are
+        never hedged and their latency is kept apart from the single-image series
+        the hedge delay comes from.
+        """
+        if self.circuit_breaker:
+            try:
+                self.circuit_breaker.before_call()
+            except CircuitOpen:
+                METRICS.inc("rejections_total", reason="vision_circuit_open")
+                raise
+
+        start = time.perf_counter()
+        try:
+            response = self._hedged(call, timeout) if self.hedge and not batch else call(timeout)
+        except Exception:
+            METRICS.inc("errors_total", stage="vision")
+            if self.circuit_breaker and self.circuit_breaker.record_failure():
+                logger.error("Cloud Vision failing, circuit opened for %.0fs", self.circuit_breaker.reset_timeout)
+            raise
+        finally:
+            METRICS.observe("vision_call_seconds", time.perf_counter() - start, **({"kind": "batch"} if batch else {}))
+
+        if self.circuit_breaker:
+            self.circuit_breaker.record_success()
+        return response
+
+    def _hedged(self, call, timeout):
+        """
+        Sends a second request if the first is slower than the recent p95; the first
+        success wins. The loser is cancelled if it hasn't started yet.
+        """
+        delay = METRICS.percentile("vision_call_seconds", HEDGE_PERCENTILE, min_samples=HEDGE_MIN_SAMPLES)
+        if delay is None or delay >= timeout:
+            return call(timeout)
+
+        start = time.monotonic()
+        primary = self.hedge_executor.submit(call, timeout)
+        try:
+            return primary.result(timeout=delay)
+        except TimeoutError:
+            pass
+        if self.rate_limiter and not self.rate_limiter.try_acquire():
+            # No quota to spare for the extra request
+            return primary.result()
+
+        METRICS.inc("vision_hedged_total")
+        remaining = max(0.1, timeout - (time.monotonic() - start))
+        hedge = self.hedge_executor.submit(call, remaining)
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        return future.result()
+                    error = future.exception()
+            raise error
+        finally:
+            for future in pending:
+                if future.cancel() and future is hedge and self.rate_limiter:
+                    # Never sent, so its quota is given back
+                    self.rate_limiter.refund()
+
+    def recognize_text_cloud(self, image_array, stats=None, encoding=('.jpg', []), deadline=None):
+        """Sends numpy image to Cloud Vision API and returns full text."""
+        texts = self._annotate(image_array, stats, encoding, deadline)
         if texts:
             # texts[0] is the full text
             return texts[0].description
         return ""
 
-    def extract_data(self, image_path):
-        """Extracts Date, Title, Artist, and Score from the image using Cloud Vision."""
-        img = cv2.imread(image_path)
-        if img is None:
-            raise ValueError("Could not read image")
-        
-        height, width, _ = img.shape
+    @staticmethod
+    def crop_regions(img):
+        """Cuts the date/score/title regions out of a full screenshot."""
+        height, width = img.shape[:2]
+        crops = {}
+        for name, (y0, y1, x0, x1) in REGIONS.items():
+            crops[name] = img[int(height*y0):int(height*y1), int(width*x0):int(width*x1)]
+        return crops
+
+    @staticmethod
+    def build_composite(crops):
+        """
+        Stacks the crops vertically into one image.
+        Returns (composite, bands) where bands maps region name -> (top, bottom) rows.
+        """
+        width = max(crop.shape[1] for crop in crops.values())
+        parts = []
+        bands = {}
+        top = 0
+        for name, crop in crops.items():
+            h, w = crop.shape[:2]
+            padded = np.zeros((h, width) + crop.shape[2:], dtype=np.uint8)
+            padded[:, :w] = crop
+            parts.append(padded)
+            bands[name] = (top, top + h)
+            top += h
+            parts.append(np.zeros((COMPOSITE_GAP, width) + crop.shape[2:], dtype=np.uint8))
+            top += COMPOSITE_GAP
+        return np.vstack(parts[:-1]), bands
+
+    @staticmethod
+    def _box(annotation):
+        xs = [v.x for v in annotation.bounding_poly.vertices]
+        ys = [v.y for v in annotation.bounding_poly.vertices]
+        return min(xs), min(ys), max(xs), max(ys)
+
+    @classmethod
+    def _join_words(cls, words):
+        """
+        Rebuilds region text from word annotations.
+        Words are grouped into lines by vertical overlap and ordered left to right;
+        a space is inserted only where the horizontal gap looks like one, so
+        Japanese titles are not split into separate tokens.
+        """
+        boxes = sorted((cls._box(w) + (w.description,) for w in words), key=lambda b: (b[1], b[0]))
+        lines = []
+        for box in boxes:
+            if lines:
+                last = lines[-1]
+                line_mid = (last[0][1] + last[0][3]) / 2
+                if box[1] <= line_mid <= box[3]:
+                    last.append(box)
+                    continue
+            lines.append([box])
+
+        out_lines = []
+        for line in lines:
+            line.sort(key=lambda b: b[0])
+            text = line[0][4]
+            for prev, cur in zip(line, line[1:]):
+                gap = cur[0] - prev[2]
+                height = max(prev[3] - prev[1], cur[3] - cur[1], 1)
+                if gap > height * 0.25:
+                    text += " "
+                text += cur[4]
+            out_lines.append(text)
+        return "\n".join(out_lines)
+
+    def recognize_regions(self, crops, stats=None, deadline=None):
+        """Returns {region name: raw text} for the given crops."""
+        start = time.perf_counter()
+        crops = self.prepare_crops(crops)
+        add_stat(stats, "encode", time.perf_counter() - start)
+
+        if not self.single_request:
+            return {name: self.recognize_text_cloud(crop, stats, self.encoding(name), deadline)
+                    for name, crop in crops.items()}
+
+        start = time.perf_counter()
+        composite, bands = self.build_composite(crops)
+        add_stat(stats, "crop", time.perf_counter() - start)
+        annotations = self._annotate(composite, stats, self.encoding(), deadline)
+        start = time.perf_counter()
+        texts = self.assign_words(annotations, bands)
+        add_stat(stats, "parse", time.perf_counter() - start)
+        return texts
+
+    def assign_words(self, annotations, bands):
+        """Splits the annotations of a composite back into {region name: raw text}."""
+        # annotations[0] is the full text; the rest are individual words.
+        assigned = {name: [] for name in bands}
+        for word in annotations[1:]:
+            _, top, _, bottom = self._box(word)
+            center = (top + bottom) / 2
+            for name, (band_top, band_bottom) in bands.items():
+                if band_top <= center < band_bottom:
+                    assigned[name].append(word)
+                    break
+        return {name: self._join_words(words) for name, words in assigned.items()}
+
+    def annotate_batch(self, contents):
+        """
+        Sends up to MAX_BATCH_IMAGES encoded images in one batch_annotate_images call.
+        Returns the text annotations of each image, in order; an image Vision
+        could not process gets an Exception instead.
+        """
+        image_context = vision.ImageContext(language_hints=["ja", "en"])
+        feature = vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)
+        requests = [vision.AnnotateImageRequest(image=vision.Image(content=content), features=[feature],
+                                                image_context=image_context)
+                    for content in contents]
+        METRICS.inc("vision_bytes_sent_total", sum(len(content) for content in contents))
+
+        if self.rate_limiter:
+            # The quota counts images, not calls
+            waited = self.rate_limiter.acquire(len(contents))
+            if waited:
+                METRICS.observe("vision_quota_wait_seconds", waited)
+
+        response = self._call_vision(
+            lambda t: self.client.batch_annotate_images(requests=requests, timeout=t), self.vision_timeout * 3,
+            batch=True)
+
+        return [Exception(r.error.message) if r.error.message else r.text_annotations
+                for r in response.responses]
+
+    def parse_regions(self, texts):
+        """Turns raw region text into the result dict."""
         data = {
             "date": None,
             "title": None,
             "artist": None,
-            "score": None
+            "score": None,
+            # Every plausible score read from the score region; the matcher
+            # re-picks from these once the song (and its max EX score) is known.
+            "score_candidates": []
         }
 
-        # 1. Date Extraction
-        # Tuned: 0.015-0.045 / 0.03-0.37 (Tight crop works well)
-        date_crop = img[int(height*0.015):int(height*0.045), int(width*0.03):int(width*0.37)]
-        date_text = self.recognize_text_cloud(date_crop)
-        print(f"DEBUG: Date raw: {date_text}")
-        
-        # Parse date
+        # 1. Date
+        date_text = texts.get("date", "")
+        logger.debug("Date raw: %s", date_text)
         match = re.search(r'20\d{2}[-./]\d{2}[-./]\d{2}( \d{2}:\d{2})?', date_text.replace('\n', ' '))
         if match:
              data["date"] = match.group(0)
 
-        # 2. Score Extraction
-        # Tuned: 0.485-0.515 / 0.65-0.86
-        score_crop = img[int(height*0.485):int(height*0.515), int(width*0.65):int(width*0.86)]
-        score_text = self.recognize_text_cloud(score_crop)
-        print(f"DEBUG: Score raw: {score_text}")
-        
-        # Parse score (find largest number)
+        # 2. Score (find largest number)
+        score_text = texts.get("score", "")
+        logger.debug("Score raw: %s", score_text)
         # Cloud vision might return "1234" or "1 234" etc.
         numbers = re.findall(r'\d+', score_text)
-        candidates = []
         for num_str in numbers:
             if 3 <= len(num_str) <= 4:
-                 val = int(num_str)
-                 if val < 6000:
-                     candidates.append(val)
-        
+                 data["score_candidates"].append(int(num_str))
+
+        # Without a known chart, anything below 6000 is accepted
+        candidates = [val for val in data["score_candidates"] if val < 6000]
         if candidates:
             data["score"] = max(candidates)
 
-        # 3. Title Extraction (Merged Song Name)
-        # Tuned: 0.245-0.268 / 0.05-0.95
-        title_crop = img[int(height*0.245):int(height*0.268), int(width*0.05):int(width*0.95)]
-        
-        # Preprocess? Maybe invert for better contrast if it's white on black?
-        # Cloud Vision handles white on black well usually, but let's try raw first.
-        title_text = self.recognize_text_cloud(title_crop)
-        print(f"DEBUG: Title raw: {title_text}")
-        
-        # Clean up title
+        # 3. Title (Merged Song Name)
+        title_text = texts.get("title", "")
+        logger.debug("Title raw: %s", title_text)
         if title_text:
             # Replace newlines with space
             cleaned = title_text.replace('\n', ' ').strip()
             data["title"] = cleaned
 
         return data
+
+    @staticmethod
+    def decode_image(image):
+        """
+        Decodes a file path, bytes, bytearray or memoryview into a BGR array.
+        Encoded data is decoded in memory, at reduced resolution for large captures.
+        """
+        if isinstance(image, (str, os.PathLike)):
+            with open(image, 'rb') as f:
+                image = f.read()
+
+        flags = cv2.IMREAD_COLOR
+        info = sniff_image(image)
+        if info:
+            _, width, _ = info
+            for factor, reduced_flag in REDUCED_FLAGS:
+                if width >= TARGET_WIDTH * factor:
+                    flags = reduced_flag
+                    break
+
+        buffer = np.frombuffer(image, dtype=np.uint8)
+        img = cv2.imdecode(buffer, flags)
+        if img is None:
+            raise ValueError("Could not read image")
+        return img
+
+    def extract_data(self, image, stats=None, deadline=None):
+        """
+        Extracts Date, Title, Artist, and Score from the image using Cloud Vision.
+        `image` is a file path or the encoded image bytes/memoryview.
+        If a `stats` dict is given, per-stage seconds (decode, crop, encode, ocr,
+        parse) and bytes_sent / vision_calls / cache_hit / cache_title_only are added to it.
+        With a Deadline, Vision calls are cut short (DeadlineExceeded) when it runs out.
+        """
+        if isinstance(image, (str, os.PathLike)):
+            with open(image, 'rb') as f:
+                image = f.read()
+
+        if stats is None:
+            stats = {}
+
+        sha = None
+        if self.cache:
+            sha = content_hash(image)
+            cached = self.cache.get_exact(sha)
+            if cached:
+                add_stat(stats, "cache_hit", 1)
+                METRICS.inc("ocr_cache_hits_total", kind="exact")
+                return cached
+
+        start = time.perf_counter()
+        if self.preprocess_pool:
+            # Decoded and cropped in another process; "decode" covers both
+            crops = self.preprocess_pool.crops(image, grayscale=self.compact_encoding, deadline=deadline)
+            add_stat(stats, "decode", time.perf_counter() - start)
+        else:
+            img = self.decode_image(image)
+            add_stat(stats, "decode", time.perf_counter() - start)
+            start = time.perf_counter()
+            crops = self.crop_regions(img)
+            add_stat(stats, "crop", time.perf_counter() - start)
+
+        phash = None
+        similar = None
+        if self.cache:
+            phash = perceptual_hash(crops)
+            similar = self.cache.get_similar(phash)
+            if similar:
+                add_stat(stats, "cache_title_only", 1)
+                METRICS.inc("ocr_cache_hits_total", kind="title_only")
+                # Only the title is taken from a near match: a one-digit change in
+                # the date or score moves their dHash by a few bits at most
+                crops = {name: crop for name, crop in crops.items() if name != "title"}
+            else:
+                METRICS.inc("ocr_cache_misses_total")
+
+        texts = {}
+        if self.local_engine:
+            start = time.perf_counter()
+            texts = self.local_engine.recognize(crops)
+            add_stat(stats, "ocr", time.perf_counter() - start)
+        remaining = {name: crop for name, crop in crops.items() if name not in texts}
+        if remaining:
+            texts.update(self.recognize_regions(remaining, stats, deadline))
+
+        start = time.perf_counter()
+        data = self.parse_regions(texts)
+        if similar:
+            data["title"] = similar.get("title")
+        add_stat(stats, "parse", time.perf_counter() - start)
+        if self.cache:
+            self.cache.put(sha, phash, data)
+
+        for stage in ("decode", "crop", "encode", "parse"):
+            if stage in stats:
+                METRICS.observe(f"ocr_{stage}_seconds", stats[stage])
+        return data
+
+    async def extract_data_async(self, image, deadline=None):
+        """Runs extract_data on the OCR worker pool without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.extract_data, image, None, deadline)
+
+    def close(self):
+        """Stops the OCR worker pool."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.hedge_executor:
+            self.hedge_executor.shutdown(wait=False, cancel_futures=True)
+        if self.preprocess_pool:
+            self.preprocess_pool.close()
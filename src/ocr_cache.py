@@ -0,0 +1,153 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# Each region is hashed separately at this size (rows x cols) so that two
+# result screens that differ only in the score digits never look alike.
+HASH_ROWS = 8
+HASH_COLS = 32
+HASH_BITS = HASH_ROWS * HASH_COLS
+
+
+def content_hash(image_bytes):
+    """Exact key: SHA-256 of the encoded image."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def dhash(region):
+    """Difference hash of one crop as an int of HASH_BITS bits."""
+    if region.ndim == 3:
+        region = cv2.cvtColor(region, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(region, (HASH_COLS + 1, HASH_ROWS), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def perceptual_hash(crops):
+    """Per-region dHash of the OCR crops, as a tuple in region order."""
+    return tuple(dhash(crop) if crop.size else 0 for crop in crops.values())
+
+
+class OCRCache:
+    """
+    Cache of OCR results keyed by exact content hash and by perceptual hash.
+
+    A byte-identical upload is answered before decoding. A re-encoded or
+    slightly different copy of the same screenshot is found after cropping,
+    when every region's dHash is within `max_distance` bits of a cached entry;
+    such a near match is only trusted for the title (see IIDXReader.extract_data),
+    since digits that differ by one barely change the dHash. Near matches are
+    therefore counted as title_only hits and left out of the hit rate.
+    Entries live in an in-memory LRU, and optionally in a SQLite file so they
+    survive restarts (the disk tier matches exact hashes only).
+    """
+
+    def __init__(self, max_entries=512, db_path=None, max_distance=10):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.entries = OrderedDict()  # sha -> (phash, data)
+        self.lock = threading.Lock()
+        self.hits = {"exact": 0, "disk": 0}
+        self.title_only_hits = 0
+        self.misses = 0
+
+        self.db = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS ocr_cache ("
+                " sha TEXT PRIMARY KEY,"
+                " phash TEXT NOT NULL,"
+                " data TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS ocr_cache_phash ON ocr_cache (phash)")
+            self.db.commit()
+
+    def get_exact(self, sha):
+        """Looks up a byte-identical image. Does not count a miss."""
+        with self.lock:
+            entry = self.entries.get(sha)
+            if entry:
+                self.entries.move_to_end(sha)
+                self.hits["exact"] += 1
+                return dict(entry[1])
+
+            if self.db:
+                row = self.db.execute("SELECT phash, data FROM ocr_cache WHERE sha = ?", (sha,)).fetchone()
+                if row:
+                    self._remember(sha, self._decode_phash(row[0]), json.loads(row[1]))
+                    self.hits["disk"] += 1
+                    return json.loads(row[1])
+        return None
+
+    def get_similar(self, phash):
+        """Looks up a near-identical image by perceptual hash (a title_only hit). Counts a miss if none is found."""
+        with self.lock:
+            for sha, (cached_phash, data) in reversed(self.entries.items()):
+                if self._is_similar(phash, cached_phash):
+                    self.entries.move_to_end(sha)
+                    self.title_only_hits += 1
+                    return dict(data)
+
+            if self.db:
+                row = self.db.execute(
+                    "SELECT sha, data FROM ocr_cache WHERE phash = ? LIMIT 1", (self._encode_phash(phash),)
+                ).fetchone()
+                if row:
+                    self._remember(row[0], phash, json.loads(row[1]))
+                    self.title_only_hits += 1
+                    return json.loads(row[1])
+
+            self.misses += 1
+        return None
+
+    def put(self, sha, phash, data):
+        """Stores an OCR result."""
+        with self.lock:
+            self._remember(sha, phash, dict(data))
+            if self.db:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO ocr_cache (sha, phash, data, created_at) VALUES (?, ?, ?, ?)",
+                    (sha, self._encode_phash(phash), json.dumps(data, ensure_ascii=False), time.time()),
+                )
+                self.db.commit()
+
+    def stats(self):
+        """Hit/miss counters and current size. hit_rate counts only full (exact/disk) hits."""
+        with self.lock:
+            hits = sum(self.hits.values())
+            total = hits + self.title_only_hits + self.misses
+            return {
+                **{f"{kind}_hits": count for kind, count in self.hits.items()},
+                "title_only_hits": self.title_only_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+                "entries": len(self.entries),
+            }
+
+    def _remember(self, sha, phash, data):
+        self.entries[sha] = (phash, data)
+        self.entries.move_to_end(sha)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _is_similar(self, a, b):
+        if len(a) != len(b):
+            return False
+        return all((x ^ y).bit_count() <= self.max_distance for x, y in zip(a, b))
+
+    @staticmethod
+    def _encode_phash(phash):
+        return ",".join(f"{h:x}" for h in phash)
+
+    @staticmethod
+    def _decode_phash(text):
+        return tuple(int(h, 16) for h in text.split(","))
@@ -0,0 +1,159 @@
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+
+
+class PendingSubmission:
+    """
+    An OCR preview waiting for the user to press 送信 or 修正.
+    One /result can carry several screenshots; each is an entry
+    (date, title, score, image_url, image_hash).
+    """
+
+    __slots__ = ("key", "user_id", "username", "entries", "is_qualifier", "created_at")
+
+    def __init__(self, key, user_id, username, entries, is_qualifier=False, created_at=None):
+        # Discord id of the /result interaction; also used in the button custom_ids
+        self.key = key
+        self.user_id = user_id
+        self.username = username
+        self.entries = [tuple(entry) for entry in entries]
+        self.is_qualifier = is_qualifier
+        self.created_at = time.time() if created_at is None else created_at
+
+    @staticmethod
+    def entry(data, image_url=None, image_hash=None):
+        return (data.get('date'), data.get('title'), data.get('score'), image_url, image_hash)
+
+    def data(self, index=0):
+        """One entry in the dict form SheetManager.build_row expects."""
+        date, title, score = self.entries[index][:3]
+        return {'date': date, 'title': title, 'score': score}
+
+    def image_hash(self, index=0):
+        entry = self.entries[index]
+        return entry[4] if len(entry) > 4 else None
+
+    def set_score(self, index, score):
+        entry = self.entries[index]
+        self.entries[index] = entry[:2] + (score,) + entry[3:]
+
+    def to_row(self):
+        first_url = self.entries[0][3] if self.entries else None
+        return (self.key, self.user_id, self.username, json.dumps(self.entries, ensure_ascii=False),
+                first_url, int(self.is_qualifier), self.created_at)
+
+    @classmethod
+    def from_row(cls, row):
+        key, user_id, username, data, image_url, is_qualifier, created_at = row
+        entries = json.loads(data)
+        if isinstance(entries, dict):
+            # Single-screenshot record
+            entries = [cls.entry(entries, image_url)]
+        return cls(key, user_id, username, entries, bool(is_qualifier), created_at)
+
+
+class PendingStore:
+    """
+    Previews waiting for confirmation, keyed by PendingSubmission.key.
+
+    At most `max_entries` records are kept in memory (least recently used are
+    evicted first) and records older than `ttl` seconds expire. With `db_path`,
+    every record is also kept in SQLite, so evicted records are reloaded on
+    demand and previews survive a restart.
+    """
+
+    def __init__(self, db_path=None, ttl=24 * 3600, max_entries=1000, expire_interval=60.0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.expire_interval = expire_interval
+        self.entries = OrderedDict()
+        self.last_expire = 0.0
+
+        self.db = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS pending_submissions ("
+                " key INTEGER PRIMARY KEY,"
+                " user_id INTEGER NOT NULL,"
+                " username TEXT NOT NULL,"
+                " data TEXT NOT NULL,"
+                " image_url TEXT,"
+                " is_qualifier INTEGER NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS pending_submissions_created ON pending_submissions (created_at)")
+            self.db.commit()
+        self.expire()
+
+    def __len__(self):
+        if self.db:
+            return self.db.execute("SELECT COUNT(*) FROM pending_submissions").fetchone()[0]
+        return len(self.entries)
+
+    def add(self, record):
+        self._remember(record)
+        if self.db:
+            self.db.execute("INSERT OR REPLACE INTO pending_submissions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            record.to_row())
+            self.db.commit()
+        if time.time() - self.last_expire > self.expire_interval:
+            self.expire()
+
+    def get(self, key):
+        """Returns the record, or None if it is unknown, expired or already submitted."""
+        record = self.entries.get(key)
+        if record is None and self.db:
+            row = self.db.execute("SELECT * FROM pending_submissions WHERE key = ?", (key,)).fetchone()
+            if row:
+                record = PendingSubmission.from_row(row)
+                self._remember(record)
+        if record is None:
+            return None
+        if self._expired(record):
+            self.pop(key)
+            return None
+        self.entries.move_to_end(key)
+        return record
+
+    def update_score(self, key, score, index=0):
+        record = self.get(key)
+        if record is None or index >= len(record.entries):
+            return None
+        record.set_score(index, score)
+        if self.db:
+            self.db.execute("UPDATE pending_submissions SET data = ? WHERE key = ?",
+                            (json.dumps(record.entries, ensure_ascii=False), key))
+            self.db.commit()
+        return record
+
+    def pop(self, key):
+        record = self.entries.pop(key, None)
+        if self.db:
+            self.db.execute("DELETE FROM pending_submissions WHERE key = ?", (key,))
+            self.db.commit()
+        return record
+
+    def expire(self):
+        """Drops every record older than the TTL. Returns how many were dropped from memory."""
+        self.last_expire = time.time()
+        expired = [key for key, record in self.entries.items() if self._expired(record)]
+        for key in expired:
+            del self.entries[key]
+        if self.db:
+            self.db.execute("DELETE FROM pending_submissions WHERE created_at < ?", (self.last_expire - self.ttl,))
+            self.db.commit()
+        return len(expired)
+
+    def _expired(self, record):
+        return time.time() - record.created_at > self.ttl
+
+    def _remember(self, record):
+        self.entries[record.key] = record
+        self.entries.move_to_end(record.key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
@@ -0,0 +1,159 @@
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from src.metrics import METRICS
+from src.ocr import IIDXReader
+
+logger = logging.getLogger(__name__)
+
+# Offsets of the crops in a shared memory block are aligned to this many bytes
+ALIGNMENT = 64
+
+
+def export_crops(crops):
+    """
+    Copies the crops into a new shared memory block. Returns (block name, layout)
+    where layout is [(region name, shape, dtype, offset)]; the receiver unlinks the block.
+    """
+    layout = []
+    size = 0
+    for name, crop in crops.items():
+        layout.append((name, crop.shape, crop.dtype.str, size))
+        size += -(-crop.nbytes // ALIGNMENT) * ALIGNMENT
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        for (name, shape, dtype, offset), crop in zip(layout, crops.values()):
+            np.ndarray(shape, dtype, buffer=block.buf, offset=offset)[...] = crop
+    except BaseException:
+        block.close()
+        block.unlink()
+        raise
+    block.close()
+    return block.name, layout
+
+
+def import_crops(block_name, layout):
+    """Copies the crops out of a block made by export_crops, and frees the block."""
+    block = shared_memory.SharedMemory(name=block_name)
+    try:
+        return {name: np.ndarray(shape, dtype, buffer=block.buf, offset=offset).copy()
+                for name, shape, dtype, offset in layout}
+    finally:
+        block.close()
+        block.unlink()
+
+
+def free_crops(future):
+    """Done callback for a decode_and_crop future nobody waits for: frees its block."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    block_name, _ = future.result()
+    try:
+        block = shared_memory.SharedMemory(name=block_name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+
+def decode_and_crop(image, grayscale=True):
+    """Worker process: decodes the screenshot and hands back its crops through shared memory."""
+    crops = IIDXReader.crop_regions(IIDXReader.decode_image(image))
+    if grayscale:
+        crops = {name: IIDXReader.preprocess_crop(crop) for name, crop in crops.items()}
+    return export_crops(crops)
+
+
+@contextmanager
+def _bare_main():
+    """
+    Hides the running script from multiprocessing while workers start.
+    Otherwise every worker imports it again as __mp_main__; for bot.py
+    that means discord.py and a MyClient the worker never uses.
+    """
+    main = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+
+def _warm(delay):
+    # Importing cv2 and decoding once happens here, not on the first upload
+    IIDXReader.crop_regions(np.zeros((72, 128, 3), dtype=np.uint8))
+    time.sleep(delay)
+    return os.getpid()
+
+
+class PreprocessPool:
+    """
+    Decodes and crops screenshots in worker processes, so a burst of uploads
+    uses every core instead of queueing on the GIL in the OCR threads.
+
+    The encoded screenshot goes to a worker; only the region crops come back,
+    through a multiprocessing.shared_memory block rather than a pickled copy
+    of the frame. Workers are started from a fork server, so they don't
+    inherit the bot's threads; the fork server preloads only this module and
+    the worker processes are started by warm() without the bot's main module.
+    """
+
+    def __init__(self, processes=None, timeout=30.0):
+        self.processes = processes or os.cpu_count() or 1
+        # Longest wait for a worker (further capped by the caller's Deadline), so
+        # a stuck or crashed worker can't hold an OCR thread forever
+        self.timeout = timeout
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload([__name__])
+        else:
+            context = multiprocessing.get_context()
+        self.executor = ProcessPoolExecutor(self.processes, mp_context=context)
+
+    def warm(self):
+        """
+        Starts every worker process now and loads OpenCV in it. Returns how many answered.
+        Call before the first crops(): workers are only kept clear of the main module here.
+        """
+        start = time.perf_counter()
+        with _bare_main():
+            # Processes are started as these are submitted
+            futures = [self.executor.submit(_warm, 0.05) for _ in range(self.processes)]
+        pids = {future.result() for future in futures}
+        logger.info("Preprocess pool warmed: %d processes in %.1fs.", len(pids), time.perf_counter() - start)
+        return len(pids)
+
+    def crops(self, image, grayscale=True, deadline=None):
+        """
+        {region name: crop array} for an encoded screenshot; blocks until a worker is done.
+        With `grayscale`, the crops are converted there too (IIDXReader.preprocess_crop),
+        which also makes the handoff 3x smaller. Raises TimeoutError if no worker is
+        done within `timeout` or the Deadline (DeadlineExceeded if it has already run out).
+        """
+        start = time.perf_counter()
+        timeout = deadline.timeout(self.timeout) if deadline else self.timeout
+        future = self.executor.submit(decode_and_crop, bytes(image), grayscale)
+        try:
+            block_name, layout = future.result(timeout=timeout)
+        except TimeoutError:
+            # A worker that is already on it frees its block once it is done
+            if not future.cancel():
+                future.add_done_callback(free_crops)
+            METRICS.inc("errors_total", stage="preprocess_timeout")
+            raise TimeoutError(f"preprocessing took longer than {timeout:.1f}s") from None
+        crops = import_crops(block_name, layout)
+        METRICS.observe("preprocess_seconds", time.perf_counter() - start)
+        return crops
+
+    def close(self):
+        """Stops the workers. Waits for jobs in progress, so their shared memory is freed first."""
+        self.executor.shutdown(wait=True, cancel_futures=True)
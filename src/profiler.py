@@ -0,0 +1,59 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse(frame, root, max_depth=64):
+    """'root;outer;...;inner' for a frame, the collapsed-stack format flamegraph tools read."""
+    names = []
+    while frame is not None and len(names) < max_depth:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    names.append(root)
+    return ";".join(reversed(names))
+
+
+def sample_stacks(seconds, interval=0.005):
+    """
+    Samples the stack of every thread (except the caller's) every `interval`
+    seconds for `seconds` seconds. Returns (Counter of collapsed stacks, rounds).
+    Each stack starts with its thread name; the event loop runs in MainThread.
+    Run it in a worker thread so the loop keeps running while it samples.
+    """
+    own = threading.get_ident()
+    counts = Counter()
+    rounds = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        frames = sys._current_frames()
+        for ident, frame in frames.items():
+            if ident != own:
+                counts[collapse(frame, names.get(ident, str(ident)))] += 1
+        # Don't keep other threads' frames alive between samples
+        frames = frame = None
+        rounds += 1
+        time.sleep(interval)
+    return counts, rounds
+
+
+def to_collapsed(counts):
+    """One 'stack count' line per stack (input for flamegraph.pl, speedscope, ...)."""
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+def hottest(counts, thread=None, limit=5):
+    """[(function, samples)] of the innermost frames, optionally for one thread only."""
+    leaves = Counter()
+    for stack, count in counts.items():
+        frames = stack.split(";")
+        if thread is None or frames[0] == thread:
+            leaves[frames[-1]] += count
+    return leaves.most_common(limit)
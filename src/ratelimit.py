@@ -0,0 +1,156 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from src.resilience import DeadlineExceeded
+
+
+class RateLimited(Exception):
+    """Raised when a user has used up their request budget."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Rate limited, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, up to `capacity`.
+    Usable from the event loop (try_acquire / acquire_async) and from worker
+    threads (acquire, which sleeps until a token is available).
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        """Takes tokens if available. Returns True on success."""
+        with self.lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def time_until_available(self, tokens=1):
+        with self.lock:
+            self._refill()
+            return max(0.0, (tokens - self.tokens) / self.rate)
+
+    def is_full(self):
+        with self.lock:
+            self._refill()
+            return self.tokens >= self.capacity
+
+    def _reserve(self, tokens):
+        """Takes tokens now, going into debt if needed. Returns how long to wait."""
+        with self.lock:
+            self._refill()
+            self.tokens -= tokens
+            return max(0.0, -self.tokens / self.rate)
+
+    def refund(self, tokens=1):
+        """Gives back tokens that were taken but not used."""
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + tokens)
+
+    def acquire(self, tokens=1, deadline=None):
+        """
+        Blocks the calling thread until tokens are available. Returns seconds waited.
+        With a Deadline, raises DeadlineExceeded right away (taking no tokens)
+        if the wait would outlast it.
+        """
+        wait = self._reserve(tokens)
+        if deadline is not None and wait > deadline.remaining():
+            self.refund(tokens)
+            raise DeadlineExceeded(f"quota wait of {wait:.1f}s exceeds the deadline")
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens=1):
+        """Waits on the event loop until tokens are available. Returns seconds waited."""
+        wait = self._reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+
+class AdmissionController:
+    """
+    Admission control in front of the OCR pipeline.
+
+    Each user has a token bucket (`user_rate` requests per second, bursts of
+    `user_burst`); a user over budget is rejected with RateLimited. Admitted
+    requests then share `max_concurrent` slots; when all are busy, requests wait
+    in FIFO order and `on_queued(position)` is awaited so the user can be told.
+    """
+
+    def __init__(self, max_concurrent=4, user_rate=1 / 20, user_burst=3):
+        self.max_concurrent = max_concurrent
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.active = 0
+        self.waiters = deque()
+        self.user_buckets = {}
+
+    @property
+    def queued(self):
+        return sum(1 for waiter in self.waiters if not waiter.done())
+
+    def _user_bucket(self, user_id):
+        bucket = self.user_buckets.get(user_id)
+        if bucket is None:
+            if len(self.user_buckets) > 1000:
+                # Full buckets carry no state worth keeping
+                self.user_buckets = {uid: b for uid, b in self.user_buckets.items() if not b.is_full()}
+            bucket = self.user_buckets[user_id] = TokenBucket(self.user_rate, self.user_burst)
+        return bucket
+
+    @asynccontextmanager
+    async def admit(self, user_id, on_queued=None):
+        bucket = self._user_bucket(user_id)
+        if not bucket.try_acquire():
+            raise RateLimited(bucket.time_until_available())
+
+        if self.active < self.max_concurrent and not self.queued:
+            self.active += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                if on_queued:
+                    await on_queued(self.queued)
+                # The slot is handed over by _release, so `active` is not incremented here
+                await waiter
+            except BaseException:
+                # Cancelled (or on_queued failed): give back a slot handed over meanwhile
+                if waiter.done() and not waiter.cancelled():
+                    self._release()
+                else:
+                    waiter.cancel()
+                raise
+
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
@@ -0,0 +1,95 @@
+import threading
+import time
+
+
+class DeadlineExceeded(Exception):
+    """Raised when an interaction has used up its time budget."""
+
+
+class Deadline:
+    """
+    Time budget for one interaction, shared by every stage (download, OCR,
+    matching). Each stage asks for `timeout(cap)` before a blocking call.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, cap=None):
+        """Seconds the next call may take: the remaining budget, at most `cap`."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"deadline of {self.seconds:.0f}s exceeded")
+        return remaining if cap is None else min(cap, remaining)
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a service whose circuit breaker is open."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} circuit open, retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker.
+
+    closed: calls go through; `failure_threshold` consecutive failures open it.
+    open: calls fail fast with CircuitOpen for `reset_timeout` seconds.
+    half-open: one probe call is let through; success closes the circuit,
+    failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            if self.opened_at is None:
+                return "closed"
+            if self.probing or time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def before_call(self):
+        """Raises CircuitOpen unless the call may go ahead."""
+        with self.lock:
+            if self.opened_at is None:
+                return
+            waited = time.monotonic() - self.opened_at
+            if waited < self.reset_timeout or self.probing:
+                raise CircuitOpen(self.name, max(0.0, self.reset_timeout - waited))
+            # Half-open: this call is the probe
+            self.probing = True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        """Returns True if this failure opened the circuit."""
+        with self.lock:
+            self.failures += 1
+            if self.probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self.probing = False
+                return True
+            return False
@@ -0,0 +1,45 @@
+import hashlib
+import logging
+from datetime import datetime
+
+from src.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_OPEN_MESSAGE = "画像認識サービスが不安定なため、一時的に受付を停止しています。{retry_after:.0f}秒後にもう一度お試しください。"
+
+
+def check_date(data, event_start=None, event_end=None):
+    """Returns the rejection message for a result outside the event (YYYY-MM-DD bounds), or None."""
+    ocr_date_str = data.get('date')
+    if not ocr_date_str:
+        # "日付について...入っているものだけを受け取る" implies strict -> Reject on missing date.
+        METRICS.inc("rejections_total", reason="missing_date")
+        return "画像から日付を読み取れませんでした。鮮明な画像をアップロードしてください。"
+    try:
+        # Cloud Vision usually returns YYYY-MM-DD HH:MM
+        # Normalize separators
+        norm_date = ocr_date_str.replace('/', '-').replace('.', '-')
+        # Parse just the date part (first 10 chars should be YYYY-MM-DD)
+        date_obj = datetime.strptime(norm_date[:10], "%Y-%m-%d")
+
+        if event_start and event_end:
+            start_obj = datetime.strptime(event_start, "%Y-%m-%d")
+            end_obj = datetime.strptime(event_end, "%Y-%m-%d")
+
+            if not (start_obj <= date_obj <= end_obj):
+                METRICS.inc("rejections_total", reason="date_out_of_range")
+                return "指定期間外のリザルトです。予選期間内の画像をアップロードしてください。"
+    except Exception as e:
+        logger.warning("Date Parsing Warning: %s", e)
+    return None
+
+
+def match_result(matcher, data, image_bytes):
+    """Corrects the OCR title against the song list, re-picks the score and adds the image hash."""
+    # --- Title Fuzzy Matching ---
+    data['title'] = matcher.correct_title(data.get('title'))
+    # Drop scores the matched chart can't produce
+    data['score'] = matcher.pick_score(data['title'], data)
+    data['image_hash'] = hashlib.sha256(image_bytes).hexdigest()
+    return data
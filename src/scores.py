@@ -0,0 +1,152 @@
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+def parse_score(value):
+    """Sheet cell -> int score, or None ('1,234' and 1234 both work)."""
+    try:
+        return int(str(value).replace(",", "").strip())
+    except ValueError:
+        return None
+
+
+class ScoreStore:
+    """
+    Local copy of every submitted score, for leaderboards without reading the sheet.
+
+    `scores` holds one row per submission, in the sheet's column order
+    (date, user, title, score, qualifier); identical rows are stored once, so
+    reconciling with the sheet can be repeated. `best_scores` keeps each user's
+    best score per song and is updated as rows come in, so /ranking and /mybest
+    are single indexed lookups.
+    """
+
+    def __init__(self, db_path="scores.db"):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " played_at TEXT NOT NULL,"
+            " username TEXT NOT NULL,"
+            " title TEXT NOT NULL,"
+            " score INTEGER NOT NULL,"
+            " is_qualifier INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " image_hash TEXT,"
+            " user_id INTEGER,"
+            " UNIQUE (played_at, username, title, score));"
+            "CREATE INDEX IF NOT EXISTS scores_title_score ON scores (title, score DESC);"
+            "CREATE INDEX IF NOT EXISTS scores_user_title ON scores (username, title);"
+            "CREATE TABLE IF NOT EXISTS best_scores ("
+            " title TEXT NOT NULL,"
+            " username TEXT NOT NULL,"
+            " score INTEGER NOT NULL,"
+            " played_at TEXT NOT NULL,"
+            " PRIMARY KEY (title, username));"
+            "CREATE INDEX IF NOT EXISTS best_scores_title_score ON best_scores (title, score DESC);"
+            "CREATE INDEX IF NOT EXISTS best_scores_user ON best_scores (username);"
+        )
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(scores)")]
+        if "image_hash" not in columns:
+            # Stores created before duplicate detection
+            self.db.execute("ALTER TABLE scores ADD COLUMN image_hash TEXT")
+        if "user_id" not in columns:
+            # Stores created before duplicates were keyed by Discord user id
+            self.db.execute("ALTER TABLE scores ADD COLUMN user_id INTEGER")
+        self.db.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+
+    def add(self, data, username, is_qualifier=False, image_hash=None, user_id=None):
+        """Records a submission (same fields and fallbacks as SheetManager.build_row)."""
+        played_at = data.get('date') or datetime.now().strftime("%Y-%m-%d %H:%M")
+        return self.add_row([played_at, username, data.get('title') or 'Unknown', data.get('score') or 0,
+                             is_qualifier], image_hash, user_id)
+
+    def add_row(self, row, image_hash=None, user_id=None):
+        """Records one sheet row (SheetManager.build_row). Returns False if it was already stored."""
+        with self.lock:
+            added = self._insert(row, image_hash, user_id)
+            self.db.commit()
+        return added
+
+    def load_rows(self, rows):
+        """Records many sheet rows in one transaction. Returns how many were new."""
+        added = 0
+        with self.lock:
+            for row in rows:
+                added += self._insert(row)
+            self.db.commit()
+        return added
+
+    def _insert(self, row, image_hash=None, user_id=None):
+        if len(row) < 4:
+            return False
+        played_at, username, title = (str(value).strip() for value in row[:3])
+        score = parse_score(row[3])
+        if score is None or not username or not title:
+            # Header row, or a row edited by hand
+            return False
+        is_qualifier = len(row) > 4 and str(row[4]).upper() in ("TRUE", "1")
+        cursor = self.db.execute(
+            "INSERT OR IGNORE INTO scores"
+            " (played_at, username, title, score, is_qualifier, created_at, image_hash, user_id)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (played_at, username, title, score, int(is_qualifier), time.time(), image_hash, user_id),
+        )
+        if not cursor.rowcount:
+            return False
+        self.db.execute(
+            "INSERT INTO best_scores (title, username, score, played_at) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (title, username) DO UPDATE SET score = excluded.score, played_at = excluded.played_at"
+            " WHERE excluded.score > best_scores.score",
+            (title, username, score, played_at),
+        )
+        return True
+
+    def submission_keys(self):
+        """(user_id, username, title, played_at, score, image_hash) of every stored row, in one query."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT user_id, username, title, played_at, score, image_hash FROM scores").fetchall()
+
+    def ranking(self, title, limit=10):
+        """[(username, score, played_at)] for the song, best first."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT username, score, played_at FROM best_scores WHERE title = ?"
+                " ORDER BY score DESC, played_at LIMIT ?",
+                (title, limit),
+            ).fetchall()
+
+    def best_for_user(self, username):
+        """[(title, score, rank)] for every song the user has played."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT b.title, b.score,"
+                " (SELECT COUNT(*) FROM best_scores o WHERE o.title = b.title AND o.score > b.score) + 1"
+                " FROM best_scores b WHERE b.username = ? ORDER BY b.title",
+                (username,),
+            ).fetchall()
+
+    def reconcile(self, sheet_manager, worksheet_name="素データ"):
+        """Loads every row of the worksheet with a single range read. Returns how many were new."""
+        start = time.perf_counter()
+        rows = sheet_manager.read_rows(worksheet_name)
+        added = self.load_rows(rows)
+        logger.info("Reconciled %d sheet rows (%d new) in %.1fs.", len(rows), added, time.perf_counter() - start)
+        return added
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import time
+
+from src.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceUnavailable(Exception):
+    """Raised when a background service is not ready in time."""
+
+    def __init__(self, name, error=None):
+        super().__init__(f"{name} is not ready" + (f": {error}" if error else ""))
+        self.name = name
+        self.error = error
+
+
+class BackgroundService:
+    """
+    A component built in the background, off the event loop.
+
+    `factory` is a blocking callable run in a worker thread (heavy imports and
+    network setup belong inside it). If it raises, it is retried with
+    exponential backoff until it succeeds or the service is closed, so a
+    subsystem that fails at startup comes back on its own. Once built,
+    `on_ready(value)` is called on the event loop.
+
+    With `retry_if`, only errors it returns True for are retried; any other
+    error (e.g. a configuration mistake) makes the service give up, and
+    `on_failed(error)` is called on the event loop.
+    """
+
+    def __init__(self, name, factory, on_ready=None, retry_base=5.0, retry_max=300.0, retry_if=None,
+                 on_failed=None):
+        self.name = name
+        self.factory = factory
+        self.on_ready = on_ready
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.retry_if = retry_if
+        self.on_failed = on_failed
+        self.value = None
+        self.error = None
+        self.attempts = 0
+        self.failed = False
+        self._ready = asyncio.Event()
+        # Set once the service is ready or has given up
+        self._settled = asyncio.Event()
+        self._task = None
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def start(self):
+        """Starts building the service. Must be called from a running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name=f"start-{self.name}")
+
+    async def get(self, timeout=None):
+        """Returns the built value, waiting up to `timeout` seconds for it."""
+        if not self._settled.is_set():
+            try:
+                await asyncio.wait_for(self._settled.wait(), timeout)
+            except asyncio.TimeoutError:
+                raise ServiceUnavailable(self.name, self.error) from None
+        if self.failed:
+            raise ServiceUnavailable(self.name, self.error)
+        return self.value
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self.attempts += 1
+            start = time.perf_counter()
+            try:
+                value = await asyncio.to_thread(self.factory)
+                if self.on_ready:
+                    self.on_ready(value)
+            except Exception as e:
+                self.error = e
+                METRICS.inc("errors_total", stage=f"start_{self.name}")
+                if self.retry_if and not self.retry_if(e):
+                    logger.error("%s failed to start, not retrying: %s", self.name, e)
+                    self.failed = True
+                    self._settled.set()
+                    if self.on_failed:
+                        self.on_failed(e)
+                    return
+                delay = min(self.retry_base * (2 ** (self.attempts - 1)), self.retry_max)
+                logger.error("%s failed to start (attempt %d), retrying in %.0fs: %s",
+                             self.name, self.attempts, delay, e)
+                await asyncio.sleep(delay)
+                continue
+
+            self.value = value
+            self.error = None
+            self._ready.set()
+            self._settled.set()
+            METRICS.observe("startup_seconds", time.perf_counter() - start, service=self.name)
+            logger.info("%s ready in %.1fs.", self.name, time.perf_counter() - start)
+            return
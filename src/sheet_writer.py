@@ -0,0 +1,191 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+
+import google.auth.exceptions
+import gspread
+import requests
+
+from src.metrics import METRICS
+from src.sheets import SheetManager
+
+logger = logging.getLogger(__name__)
+
+
+def is_retryable(error):
+    """True for errors worth retrying: rate limits, server errors and network failures."""
+    if isinstance(error, gspread.exceptions.APIError):
+        status = getattr(error.response, "status_code", None) or error.code
+        return status == 429 or status >= 500
+    return isinstance(error, (requests.exceptions.RequestException, google.auth.exceptions.TransportError,
+                              ConnectionError, TimeoutError))
+
+
+class SheetWriter:
+    """
+    Writes score rows to Google Sheets in the background.
+
+    Rows are first committed to a local SQLite journal (WAL mode), so submit()
+    returns immediately and nothing is lost if the bot crashes or Sheets is down.
+    A background task groups rows that arrive close together into one
+    append_rows call and deletes them from the journal once Sheets accepts them.
+    Pending rows left over from a previous run are sent on start().
+
+    The writer can be created before Sheets is connected (sheet_manager=None):
+    rows are journaled as usual and sent once set_sheet_manager() is called.
+    """
+
+    def __init__(self, sheet_manager=None, journal_path="sheet_journal.db", worksheet_name="素データ",
+                 batch_delay=2.0, max_batch=100, retry_base=2.0, retry_max=300.0):
+        self.sheet_manager = sheet_manager
+        self.worksheet_name = worksheet_name
+        self.batch_delay = batch_delay
+        self.max_batch = max_batch
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+
+        self.db = sqlite3.connect(journal_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS pending_rows ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " worksheet TEXT NOT NULL,"
+            " row TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " failed INTEGER NOT NULL DEFAULT 0,"
+            " last_error TEXT)"
+        )
+        self.db.commit()
+
+        self._wakeup = asyncio.Event()
+        # Held while a batch is read from the journal and sent, so the background
+        # task and flush() never send the same rows
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    def submit(self, data, username, is_qualifier=False):
+        """Journals one score row for writing. Returns immediately."""
+        self.submit_many([data], username, is_qualifier)
+
+    def submit_many(self, entries, username, is_qualifier=False):
+        """Journals several rows in one transaction, so they go out in the same append."""
+        now = time.time()
+        rows = [json.dumps(SheetManager.build_row(data, username, is_qualifier), ensure_ascii=False)
+                for data in entries]
+        self.db.executemany(
+            "INSERT INTO pending_rows (worksheet, row, created_at) VALUES (?, ?, ?)",
+            [(self.worksheet_name, row, now) for row in rows],
+        )
+        self.db.commit()
+        self._wakeup.set()
+
+    def pending_count(self):
+        """Number of rows still waiting to be written."""
+        return self.db.execute("SELECT COUNT(*) FROM pending_rows WHERE failed = 0").fetchone()[0]
+
+    def set_sheet_manager(self, sheet_manager):
+        """Hands over the connected SheetManager; rows journaled meanwhile are sent now."""
+        self.sheet_manager = sheet_manager
+        self._wakeup.set()
+
+    def start(self):
+        """Starts the background writer. Must be called from a running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            # Replay anything left in the journal by a previous run
+            self._wakeup.set()
+
+    async def stop(self):
+        """Flushes what can be flushed right now and stops the background writer."""
+        if self._task:
+            # A batch being sent is finished first: cancelling the task mid-append would
+            # leave the append running in its thread and the rows in the journal
+            async with self._lock:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        """Writes all pending rows now. Returns False if a batch could not be written."""
+        if self.sheet_manager is None:
+            return False
+        while True:
+            async with self._lock:
+                batch = self._next_batch()
+                if not batch:
+                    return True
+                if not await self._write_batch(batch):
+                    return False
+
+    def _next_batch(self):
+        return self.db.execute(
+            "SELECT id, worksheet, row FROM pending_rows WHERE failed = 0 ORDER BY id LIMIT ?",
+            (self.max_batch,),
+        ).fetchall()
+
+    async def _write_batch(self, batch):
+        """Sends one batch. Returns True if it was written (or permanently rejected)."""
+        # A batch may mix worksheets only if the target changed between runs
+        by_sheet = {}
+        for row_id, worksheet, row in batch:
+            by_sheet.setdefault(worksheet, []).append((row_id, json.loads(row)))
+
+        for worksheet, entries in by_sheet.items():
+            ids = [(row_id,) for row_id, _ in entries]
+            rows = [row for _, row in entries]
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(self.sheet_manager.append_rows, rows, worksheet)
+            except Exception as e:
+                METRICS.inc("errors_total", stage="sheet_append")
+                retryable = is_retryable(e)
+                self.db.executemany(
+                    "UPDATE pending_rows SET attempts = attempts + 1, failed = ?, last_error = ? WHERE id = ?",
+                    [(0 if retryable else 1, str(e), row_id) for (row_id,) in ids],
+                )
+                self.db.commit()
+                if retryable:
+                    logger.warning("Sheet write failed, will retry: %s", e)
+                    return False
+                logger.error("Sheet write rejected, %d rows kept in journal as failed: %s", len(rows), e)
+                continue
+            finally:
+                METRICS.observe("sheet_append_seconds", time.perf_counter() - start)
+
+            METRICS.inc("sheet_rows_written_total", len(rows))
+            self.db.executemany("DELETE FROM pending_rows WHERE id = ?", ids)
+            self.db.commit()
+        return True
+
+    async def _run(self):
+        failures = 0
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if self.sheet_manager is None:
+                # Not connected yet; set_sheet_manager() wakes us up again
+                continue
+            # Give rows that arrive close together a moment to pile up
+            await asyncio.sleep(self.batch_delay)
+
+            while True:
+                async with self._lock:
+                    batch = self._next_batch()
+                    written = await self._write_batch(batch) if batch else True
+                if not batch:
+                    failures = 0
+                    break
+                if written:
+                    failures = 0
+                    continue
+                failures += 1
+                delay = min(self.retry_base * (2 ** (failures - 1)), self.retry_max)
+                await asyncio.sleep(delay)
@@ -1,19 +1,28 @@
 import gspread
 from google.oauth2.service_account import Credentials
+import logging
 import os
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 SCOPES = [
     'https://www.googleapis.com/auth/spreadsheets',
     'https://www.googleapis.com/auth/drive'
 ]
 
 class SheetManager:
-    def __init__(self, key_path="service_account.json"):
+    def __init__(self, key_path="service_account.json", direct_append=False, rate_limiter=None):
         self.key_path = key_path
         self.client = None
         self.workbook = None
         self.sheet = None
+        # Worksheet handles by title, so appends don't re-fetch spreadsheet metadata
+        self.worksheets = {}
+        # True: append_rows posts straight to the "'<title>'!A1" range via values_append
+        self.direct_append = direct_append
+        # Optional TokenBucket for the Sheets write quota
+        self.rate_limiter = rate_limiter
 
     def connect(self, sheet_key):
         """Connects to Google Sheets using the service account."""
@@ -25,29 +34,46 @@ class SheetManager:
         
         # Open by key
         self.workbook = self.client.open_by_key(sheet_key)
-        self.sheet = self.workbook.sheet1
+        self.refresh_worksheets()
 
-    def append_score(self, data, username, is_qualifier=False, worksheet_name=None):
-        """
-        Appends a score entry to the sheet.
-        Columns: [Date, User Name, Song Title, Score, Is Qualifier]
-        """
+    def refresh_worksheets(self):
+        """Reloads all worksheet handles with a single metadata fetch."""
+        worksheets = self.workbook.worksheets()
+        self.worksheets = {ws.title: ws for ws in worksheets}
+        self.sheet = worksheets[0] if worksheets else self.workbook.sheet1
+
+    def invalidate(self, worksheet_name=None):
+        """Drops one cached worksheet handle, or all of them."""
+        if worksheet_name:
+            self.worksheets.pop(worksheet_name, None)
+        else:
+            self.worksheets.clear()
+
+    def get_worksheet(self, worksheet_name=None):
+        """Returns the named worksheet, or the default sheet if it does not exist."""
         if not self.workbook:
             raise RuntimeError("Sheet not connected. Call connect() first.")
 
-        # Determine target sheet
-        target_sheet = self.sheet
-        if worksheet_name:
-            try:
-                target_sheet = self.workbook.worksheet(worksheet_name)
-            except gspread.WorksheetNotFound:
-                print(f"Worksheet '{worksheet_name}' not found. Falling back to default.")
-                # target_sheet remains self.sheet (sheet1)
-            except Exception as e:
-                print(f"Error fetching worksheet '{worksheet_name}': {e}")
-                return False
-
-        # Prepare row
+        if not worksheet_name:
+            return self.sheet
+
+        cached = self.worksheets.get(worksheet_name)
+        if cached:
+            return cached
+        try:
+            worksheet = self.workbook.worksheet(worksheet_name)
+        except gspread.WorksheetNotFound:
+            logger.warning("Worksheet '%s' not found. Falling back to default.", worksheet_name)
+            return self.sheet
+        self.worksheets[worksheet_name] = worksheet
+        return worksheet
+
+    @staticmethod
+    def build_row(data, username, is_qualifier=False):
+        """
+        Builds a sheet row from OCR data.
+        Columns: [Date, User Name, Song Title, Score, Is Qualifier]
+        """
         ocr_date = data.get('date')
         if not ocr_date:
             # Fallback to current date if OCR failed
@@ -56,15 +82,64 @@ class SheetManager:
         title = data.get('title', '') or 'Unknown'
         score = data.get('score', '') or 0
         
-        # [Date, User Name, Song Title, Score, Is Qualifier]
         # is_qualifier: True/False -> TRUE/FALSE in sheet (or customised if needed)
-        row = [ocr_date, username, title, score, is_qualifier]
+        return [ocr_date, username, title, score, is_qualifier]
+
+    def read_rows(self, worksheet_name=None):
+        """Reads every row of the worksheet in one API call."""
+        return self.get_worksheet(worksheet_name).get_all_values()
+
+    def append_rows(self, rows, worksheet_name=None):
+        """
+        Appends several rows in one API call.
+        Unlike append_score, errors are raised so the caller can retry.
+        """
+        try:
+            self._append_rows(rows, worksheet_name)
+        except gspread.exceptions.APIError as e:
+            # 400 usually means the cached worksheet was renamed or deleted
+            if e.code != 400 or not worksheet_name:
+                raise
+            self.invalidate(worksheet_name)
+            self._append_rows(rows, worksheet_name)
+
+    def _append_rows(self, rows, worksheet_name):
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        if self.direct_append and worksheet_name and worksheet_name in self.worksheets:
+            self.workbook.values_append(
+                gspread.utils.absolute_range_name(worksheet_name, "A1"),
+                params={"valueInputOption": "RAW"},
+                body={"values": rows},
+            )
+            return
+        target_sheet = self.get_worksheet(worksheet_name)
+        target_sheet.append_rows(rows)
+
+    def append_score(self, data, username, is_qualifier=False, worksheet_name=None):
+        """
+        Appends a score entry to the sheet.
+        Columns: [Date, User Name, Song Title, Score, Is Qualifier]
+        """
+        if not self.workbook:
+            raise RuntimeError("Sheet not connected. Call connect() first.")
+
+        # Determine target sheet
+        try:
+            target_sheet = self.get_worksheet(worksheet_name)
+        except Exception as e:
+            logger.error("Error fetching worksheet '%s': %s", worksheet_name, e)
+            return False
+
+        row = self.build_row(data, username, is_qualifier)
         
         try:
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
             target_sheet.append_row(row)
             return True
         except Exception as e:
-            print(f"Error appending to sheet: {e}")
+            logger.error("Error appending to sheet: %s", e)
             return False
 
 if __name__ == "__main__":
@@ -1,6 +1,36 @@
 import discord
 from discord import ui
-import traceback
+import logging
+
+from src.dedupe import DuplicateIndex
+from src.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+EXPIRED_MESSAGE = "このプレビューは期限切れか、既に送信済みです。もう一度 /result からアップロードしてください。"
+
+
+def build_preview_embed(record):
+    """OCR preview shown with VerificationView (one row per screenshot)."""
+    embed = discord.Embed(title="OCR Result Preview", color=discord.Color.blue())
+    if len(record.entries) == 1:
+        date, title, score, image_url = record.entries[0][:4]
+        embed.add_field(name="Date", value=date or 'N/A', inline=True)
+        embed.add_field(name="Player", value=record.username, inline=True)
+        embed.add_field(name="Song", value=title or 'N/A', inline=True)
+        embed.add_field(name="Score", value=str(score or 'N/A'), inline=True)
+        if image_url:
+            embed.set_thumbnail(url=image_url)
+        return embed
+
+    embed.description = f"Player: {record.username}"
+    for i, entry in enumerate(record.entries, 1):
+        date, title, score, image_url = entry[:4]
+        link = f" [画像]({image_url})" if image_url else ""
+        embed.add_field(name=f"{i}. {title or 'N/A'}", value=f"Score: {score or 'N/A'} / {date or 'N/A'}{link}",
+                        inline=False)
+    return embed
+
 
 class ScoreCorrectionModal(ui.Modal, title="スコア修正"):
     score_input = ui.TextInput(
@@ -12,126 +42,176 @@ class ScoreCorrectionModal(ui.Modal, title="スコア修正"):
         max_length=5
     )
 
-    def __init__(self, view, data, username, client, image_url, is_qualifier):
-        super().__init__()
-        self.original_view = view
-        self.data = data
-        self.username = username
-        self.client = client
-        self.image_url = image_url
-        self.is_qualifier = is_qualifier
+    def __init__(self, record, index=0):
+        # Dismissed modals are dropped from discord.py's store after the timeout
+        super().__init__(timeout=600)
+        self.key = record.key
+        self.index = index
         # Set default value
-        self.score_input.default = str(data.get('score', 0))
+        self.score_input.default = str(record.entries[index][2] or 0)
 
     async def on_submit(self, interaction: discord.Interaction):
         # Update score
         try:
-            # Full-width to half-width conversion just in case, though usually int() handles simple cases? 
-            # int() handles stick '123' but not fullwidth '１２３' without help in some versions? 
-            # Actually python int() handles fullwidth digits fine.
-            val = self.score_input.value
-            new_score = int(val)
-            self.data['score'] = new_score
+            # int() also accepts full-width digits ('１２３')
+            new_score = int(self.score_input.value)
         except ValueError:
             await interaction.response.send_message("スコアは数値で入力してください。", ephemeral=True)
             return
 
-        # Defer to prevent interaction failure
+        record = interaction.client.pending.update_score(self.key, new_score, self.index)
+        if record is None:
+            await interaction.response.send_message(EXPIRED_MESSAGE, ephemeral=True)
+            return
+
+        if len(record.entries) > 1:
+            # Several screenshots: show the corrected row and wait for 送信
+            await interaction.response.edit_message(embed=build_preview_embed(record), view=VerificationView(record))
+            return
+
+        # Defer to prevent interaction failure; the preview message is edited afterwards
+        await interaction.response.defer()
+        await finalize_submission(interaction, record)
+
+
+class SubmitButton(ui.DynamicItem[ui.Button], template=r"verify:submit:(?P<key>[0-9]+)"):
+    """送信 button. The custom_id carries the pending record key, so it works after a restart."""
+
+    def __init__(self, key):
+        super().__init__(ui.Button(label="送信", style=discord.ButtonStyle.green, custom_id=f"verify:submit:{key}"))
+        self.key = key
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(int(match["key"]))
+
+    async def callback(self, interaction: discord.Interaction):
+        record = interaction.client.pending.get(self.key)
+        if record is None:
+            await interaction.response.send_message(EXPIRED_MESSAGE, ephemeral=True)
+            return
         await interaction.response.defer()
+        await finalize_submission(interaction, record)
 
-        # Proceed to submission
-        # We need to update the original message to reflect the new state (Confirmed)
-        await self.original_view.finalize_submission(
-            interaction, 
-            self.data, 
-            self.username, 
-            self.client, 
-            self.image_url, 
-            self.is_qualifier,
-            is_modal=True
-        )
+
+class EditButton(ui.DynamicItem[ui.Button], template=r"verify:edit:(?P<key>[0-9]+)(?::(?P<index>[0-9]+))?"):
+    """修正 button for one row: opens ScoreCorrectionModal for it."""
+
+    def __init__(self, key, index=0, label="修正"):
+        super().__init__(ui.Button(label=label, style=discord.ButtonStyle.secondary,
+                                   custom_id=f"verify:edit:{key}:{index}"))
+        self.key = key
+        self.index = index
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(int(match["key"]), int(match["index"] or 0))
+
+    async def callback(self, interaction: discord.Interaction):
+        record = interaction.client.pending.get(self.key)
+        if record is None or self.index >= len(record.entries):
+            await interaction.response.send_message(EXPIRED_MESSAGE, ephemeral=True)
+            return
+        await interaction.response.send_modal(ScoreCorrectionModal(record, self.index))
 
 
 class VerificationView(ui.View):
-    def __init__(self, data, username, client, image_url, is_qualifier=False):
+    """
+    送信/修正 buttons for an OCR preview. The buttons are DynamicItems
+    (register them with client.add_dynamic_items), so discord.py keeps no
+    per-message state and the submission itself lives in client.pending.
+    """
+
+    def __init__(self, record):
         super().__init__(timeout=None)
-        self.data = data
-        self.username = username
-        self.client = client
-        self.image_url = image_url
-        self.is_qualifier = is_qualifier
-        self.message = None # To be set after sending
-
-    @ui.button(label="送信", style=discord.ButtonStyle.green, custom_id="verify_submit")
-    async def submit(self, interaction: discord.Interaction, button: ui.Button):
-        await interaction.response.defer()
-        await self.finalize_submission(
-            interaction, 
-            self.data, 
-            self.username, 
-            self.client, 
-            self.image_url, 
-            self.is_qualifier,
-            is_modal=False
-        )
-
-    @ui.button(label="修正", style=discord.ButtonStyle.secondary, custom_id="verify_edit")
-    async def edit(self, interaction: discord.Interaction, button: ui.Button):
-        modal = ScoreCorrectionModal(self, self.data, self.username, self.client, self.image_url, self.is_qualifier)
-        await interaction.response.send_modal(modal)
-
-    async def finalize_submission(self, interaction, data, username, client, image_url, is_qualifier, is_modal):
-        try:
-            # 1. Write to sheet
-            status_text = ""
-            if client.sheet_manager:
-                success = client.sheet_manager.append_score(data, username, is_qualifier, worksheet_name="素データ")
-                if success:
-                    status_text = "スプレッドシートを更新しました！"
-                else:
-                    status_text = "スプレッドシートの更新に失敗しました。"
-            else:
-                status_text = "スプレッドシート連携は無効です。"
-
-            # 2. Public Embed
-            embed = discord.Embed(title="New Score!", color=discord.Color.green())
-            embed.add_field(name="Player", value=username, inline=True)
-            embed.add_field(name="Song", value=data.get('title', 'Unknown'), inline=True)
-            embed.add_field(name="Score", value=f"{data.get('score', 0):,}", inline=True)
-            embed.add_field(name="Date", value=data.get('date', 'N/A'), inline=True)
-            
+        self.record = record
+        self.add_item(SubmitButton(record.key))
+        if len(record.entries) == 1:
+            self.add_item(EditButton(record.key))
+        else:
+            for index in range(len(record.entries)):
+                self.add_item(EditButton(record.key, index, label=f"修正 {index + 1}"))
+
+
+async def finalize_submission(interaction, record):
+    client = interaction.client
+    # Claim the record first, so a double click can't submit it twice
+    if client.pending.pop(record.key) is None:
+        await interaction.followup.send(EXPIRED_MESSAGE, ephemeral=True)
+        return
+
+    # Drop results that were already submitted, or that appear twice in this
+    # submission, before any write
+    entries = []
+    image_hashes = []
+    duplicates = []
+    seen = DuplicateIndex()
+    for i in range(len(record.entries)):
+        data, image_hash = record.data(i), record.image_hash(i)
+        reason = ((client.dedupe and client.dedupe.check(record.user_id, record.username, data, image_hash))
+                  or seen.check(record.user_id, record.username, data, image_hash))
+        seen.add(record.user_id, data, image_hash)
+        if reason:
+            METRICS.inc("rejections_total", reason=f"duplicate_{reason}")
+            duplicates.append(data)
+        else:
+            entries.append(data)
+            image_hashes.append(image_hash)
+    if not entries:
+        titles = "、".join(str(data.get('title')) for data in duplicates)
+        await interaction.edit_original_response(
+            content=f"このリザルトは既に登録されています（{titles}）。", view=None, embed=None)
+        return
+
+    journaled = False
+    try:
+        # 1. Write to sheet
+        status_text = ""
+        if client.sheet_writer:
+            # Journaled locally and written to the sheet in the background, in one append
+            client.sheet_writer.submit_many(entries, record.username, record.is_qualifier)
+            journaled = True
+            status_text = "スプレッドシートへの登録を受け付けました！"
+        else:
+            status_text = "スプレッドシート連携は無効です。"
+        if duplicates:
+            status_text += "\n登録済みのため除外: " + "、".join(str(data.get('title')) for data in duplicates)
+
+        for data, image_hash in zip(entries, image_hashes):
+            if client.dedupe:
+                client.dedupe.add(record.user_id, data, image_hash)
+            # Local copy for /ranking and /mybest
+            if client.scores:
+                client.scores.add(data, record.username, record.is_qualifier, image_hash, record.user_id)
+
+        # 2. Public Embed
+        embed = discord.Embed(title="New Score!", color=discord.Color.green())
+        embed.add_field(name="Player", value=record.username, inline=True)
+        if len(entries) == 1:
+            data = entries[0]
+            embed.add_field(name="Song", value=data.get('title') or 'Unknown', inline=True)
+            embed.add_field(name="Score", value=f"{data.get('score') or 0:,}", inline=True)
+            embed.add_field(name="Date", value=data.get('date') or 'N/A', inline=True)
+            image_url = record.entries[0][3] if len(record.entries) == 1 else None
             if image_url:
                 embed.set_thumbnail(url=image_url)
-            
-            # Send to the channel (public)
-            if interaction.channel:
-                 await interaction.channel.send(content="", embed=embed)
-
-            # 3. Update Ephemeral Message (The View)
-            final_content = (
-                f"送信が完了しました！\n{status_text}\n\n"
-                f"**登録内容**\n"
-                f"曲名: {data.get('title')}\n"
-                f"スコア: {data.get('score')}\n"
-            )
-            
-            # Disable buttons
-            for child in self.children:
-                child.disabled = True
-            
-            # Update the private message
-            if is_modal:
-                # Modal interaction deferred. checking self.message
-                if self.message:
-                    await self.message.edit(content=final_content, view=None, embed=None)
-                else:
-                    # Fallback if message not tracked (should not happen if set correctly)
-                    await interaction.followup.send("送信完了 (元のメッセージが見つかりませんでした)", ephemeral=True)
-            else:
-                # Button interaction deferred.
-                await interaction.edit_original_response(content=final_content, view=None, embed=None)
-                
-        except Exception as e:
-            print(f"Error in finalize_submission: {e}")
-            traceback.print_exc()
-            await interaction.followup.send(f"エラーが発生しました: {e}", ephemeral=True)
+        else:
+            for data in entries:
+                embed.add_field(name=data.get('title') or 'Unknown', value=f"{data.get('score') or 0:,}",
+                                inline=False)
+
+        # Send to the channel (public)
+        if interaction.channel:
+            await interaction.channel.send(content="", embed=embed)
+
+        # 3. Update the private preview message (the button or modal was deferred)
+        lines = "".join(f"曲名: {data.get('title')}\nスコア: {data.get('score')}\n" for data in entries)
+        final_content = f"送信が完了しました！\n{status_text}\n\n**登録内容**\n{lines}"
+        await interaction.edit_original_response(content=final_content, view=None, embed=None)
+
+    except Exception as e:
+        logger.exception("Error in finalize_submission: %s", e)
+        if client.sheet_writer and not journaled:
+            # Nothing was written, so the user can press 送信 again
+            client.pending.add(record)
+        await interaction.followup.send(f"エラーが発生しました: {e}", ephemeral=True)
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from src.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+class LoopWatchdog:
+    """
+    Always-on event loop lag monitor.
+
+    A heartbeat task on the loop wakes up every `interval` seconds and records
+    how late it was (event_loop_lag_seconds). A daemon thread checks the
+    heartbeat; when the loop has not beaten for `threshold` seconds, something
+    synchronous is running on it, and the thread captures the loop thread's
+    stack right then, so the blocking callback (a sheet write, cv2.imread, ...)
+    shows up in the log and in `stalls`.
+    """
+
+    def __init__(self, threshold=0.25, interval=0.05, max_stalls=20, stack_limit=25):
+        self.threshold = threshold
+        self.interval = interval
+        self.stack_limit = stack_limit
+        # Most recent stalls: {"at", "seconds", "stack", "beat"}
+        self.stalls = deque(maxlen=max_stalls)
+        self.stall_count = 0
+        self.last_beat = time.monotonic()
+        self.loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Starts monitoring the running loop. Must be called from it."""
+        if self._task:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._beat(), name="loop-watchdog")
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread:
+            self._thread.join(self.interval * 2)
+            self._thread = None
+
+    async def _beat(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - start - self.interval)
+            METRICS.observe("event_loop_lag_seconds", lag)
+            stall = self.stalls[-1] if self.stalls else None
+            if stall and stall["beat"] == self.last_beat:
+                # The stall the thread reported is over; now its full length is known
+                stall["seconds"] = now - self.last_beat
+            self.last_beat = now
+
+    def _watch(self):
+        reported = None
+        while not self._stopped.wait(self.interval):
+            beat = self.last_beat
+            blocked = time.monotonic() - beat
+            if blocked < self.threshold or beat == reported:
+                continue
+            # One report per stall, taken while the loop is still stuck
+            reported = beat
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame, limit=self.stack_limit)) if frame else ""
+            del frame
+            self.stalls.append({"at": time.time(), "seconds": blocked, "stack": stack, "beat": beat})
+            self.stall_count += 1
+            METRICS.inc("event_loop_stalls_total")
+            logger.warning("Event loop blocked for over %.0f ms in:\n%s", blocked * 1000, stack)
+
+    def format_stalls(self):
+        """The recorded stalls as text, newest first."""
+        parts = []
+        for stall in reversed(self.stalls):
+            at = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(stall["at"]))
+            parts.append(f"{at} blocked {stall['seconds'] * 1000:.0f} ms\n{stall['stack']}")
+        return "\n".join(parts)
@@ -0,0 +1,136 @@
+import csv
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from google.cloud import vision
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import backfill
+from bench_ocr import make_synthetic_corpus, word
+from src.matcher import TitleMatcher
+from src.ocr import IIDXReader, prepare_request
+
+
+class BatchStubClient:
+    """Answers batch_annotate_images with the labelled text of each image."""
+
+    def __init__(self, answers):
+        # request content -> (labels, bands)
+        self.answers = answers
+        self.calls = 0
+        self.timeouts = []
+        # Requests containing one of these images fail as a whole
+        self.failing = set()
+
+    def batch_annotate_images(self, requests, timeout=None):
+        self.calls += 1
+        self.timeouts.append(timeout)
+        if any(request.image.content in self.failing for request in requests):
+            raise RuntimeError("Vision unavailable")
+        responses = []
+        for request in requests:
+            labels, bands = self.answers[request.image.content]
+            annotations = [word("full text", 0, 0, 10, 10)]
+            for name, (top, bottom) in bands.items():
+                text = str(labels[name])
+                annotations.append(word(text, 4, top + 2, 4 + 12 * len(text), bottom - 2))
+            responses.append(vision.AnnotateImageResponse(text_annotations=annotations))
+        return vision.BatchAnnotateImagesResponse(responses=responses)
+
+
+class TestBackfill(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp, "shots")
+        os.makedirs(os.path.join(self.root, "alice"))
+        make_synthetic_corpus(self.root, 5)
+        with open(os.path.join(self.root, "labels.json"), encoding="utf-8") as f:
+            self.labels = json.load(f)
+        # Two of the screenshots belong to alice
+        for name in list(self.labels)[:2]:
+            shutil.move(os.path.join(self.root, name), os.path.join(self.root, "alice", name))
+
+        answers = {}
+        for path in backfill.find_images(self.root):
+            with open(os.path.join(self.root, path), 'rb') as f:
+                content, bands = prepare_request(f.read())
+            answers[content] = (self.labels[os.path.basename(path)], bands)
+        self.contents = {content: labels for content, (labels, _) in answers.items()}
+        self.client = BatchStubClient(answers)
+        with patch('src.ocr.vision.ImageAnnotatorClient', return_value=self.client):
+            self.reader = IIDXReader(credentials_path="missing.json", max_workers=1)
+        self.matcher = TitleMatcher(os.path.join(os.path.dirname(__file__), '..', 'songs.txt'))
+
+    def tearDown(self):
+        self.reader.close()
+        shutil.rmtree(self.tmp)
+
+    def run_backfill(self, checkpoint_path):
+        checkpoint = backfill.Checkpoint(checkpoint_path)
+        report = backfill.run(self.root, self.reader, self.matcher, checkpoint, username="bob",
+                              processes=2, batch_size=2, concurrency=2, log=lambda *_: None)
+        return checkpoint, report
+
+    def test_backfill_csv_sheet_and_resume(self):
+        checkpoint_path = os.path.join(self.tmp, "backfill.jsonl")
+        checkpoint, report = self.run_backfill(checkpoint_path)
+        self.assertEqual(report["images"], 5)
+        self.assertEqual(report["failed"], 0)
+        self.assertEqual(self.client.calls, 3)
+        # Every batch call carries the Vision timeout
+        self.assertEqual(self.client.timeouts, [self.reader.vision_timeout * 3] * 3)
+
+        csv_path = os.path.join(self.tmp, "out.csv")
+        backfill.write_csv(csv_path, checkpoint)
+        with open(csv_path, encoding="utf-8-sig") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 5)
+        for row in rows:
+            label = self.labels[os.path.basename(row["file"])]
+            self.assertEqual(int(row["score"]), label["score"])
+            self.assertEqual(row["date"], label["date"])
+            self.assertEqual(row["username"], "alice" if row["file"].startswith("alice") else "bob")
+
+        sheet = MagicMock()
+        self.assertEqual(backfill.append_to_sheet(sheet, checkpoint), 5)
+        sheet.append_rows.assert_called_once()
+        checkpoint.close()
+
+        # Resume: nothing left to OCR or append
+        checkpoint, report = self.run_backfill(checkpoint_path)
+        self.assertEqual(report["images"], 0)
+        self.assertEqual(self.client.calls, 3)
+        self.assertEqual(backfill.append_to_sheet(sheet, checkpoint), 0)
+        checkpoint.close()
+
+    def test_failed_batch_is_recorded_and_retried_on_resume(self):
+        checkpoint_path = os.path.join(self.tmp, "backfill.jsonl")
+        self.client.failing = {next(iter(self.contents))}
+        checkpoint, report = self.run_backfill(checkpoint_path)
+
+        # The run finishes; only the batch holding the failing image is lost
+        self.assertEqual(report["images"], 5)
+        self.assertEqual(report["failed"], 2)
+        retry = {file for file, entry in checkpoint.results.items() if entry.get("retry")}
+        self.assertEqual(len(retry), 2)
+        self.assertEqual(backfill.append_to_sheet(MagicMock(), checkpoint), 3)
+        checkpoint.close()
+
+        # Resume: only the two failed files are sent again
+        self.client.failing = set()
+        checkpoint, report = self.run_backfill(checkpoint_path)
+        self.assertEqual((report["images"], report["failed"]), (2, 0))
+        self.assertEqual(self.client.calls, 4)
+        self.assertEqual(checkpoint.finished(), set(backfill.find_images(self.root)))
+        checkpoint.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
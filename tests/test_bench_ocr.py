@@ -0,0 +1,29 @@
+import unittest
+import sys
+import os
+import tempfile
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bench_ocr import make_synthetic_corpus, run
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_synthetic_run(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            make_synthetic_corpus(tmp, 3)
+            single = run(tmp)
+            per_crop = run(tmp, single_request=False)
+
+        self.assertEqual(single["images"], 3)
+        self.assertEqual(single["accuracy"]["all"], 1.0)
+        self.assertEqual(single["vision_calls_per_image"], 1)
+        self.assertEqual(per_crop["vision_calls_per_image"], 3)
+        for stage in ("decode", "crop", "encode", "ocr", "parse", "match", "total"):
+            self.assertIn(stage, single["stages"])
+        self.assertGreater(single["bytes_sent"]["mean"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.digits import DigitRecognizer
+from src.ocr import IIDXReader
+
+
+def render(text, height=40, width=400):
+    img = np.zeros((height, width, 3), dtype=np.uint8)
+    cv2.putText(img, text, (5, height - 8), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2)
+    return img
+
+
+class TestDigitRecognizer(unittest.TestCase):
+    def setUp(self):
+        self.recognizer = DigitRecognizer()
+        self.assertTrue(self.recognizer.learn(render("0123456789"), "0123456789"))
+
+    def test_score_and_date(self):
+        texts = self.recognizer.recognize({"date": render("2026-02-11 12:34"), "score": render("3087")})
+        self.assertEqual(texts, {"date": "2026-02-11 12:34", "score": "3087"})
+
+    def test_dark_on_light_text(self):
+        texts = self.recognizer.recognize({"score": cv2.bitwise_not(render("1999"))})
+        self.assertEqual(texts, {"score": "1999"})
+
+    def test_low_confidence_regions_are_left_out(self):
+        texts = self.recognizer.recognize({"score": render("SCORE"), "title": render("1234")})
+        self.assertEqual(texts, {})
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.recognizer.save(tmp)
+            loaded = DigitRecognizer.load(tmp)
+        self.assertEqual(loaded.recognize({"score": render("4521")}), {"score": "4521"})
+
+    def test_reader_only_sends_remaining_regions_to_vision(self):
+        with patch('src.ocr.vision.ImageAnnotatorClient'):
+            reader = IIDXReader(credentials_path="missing.json", local_engine=self.recognizer)
+        reader.recognize_regions = MagicMock(return_value={"title": "SHADE"})
+        reader.local_engine.recognize = MagicMock(return_value={"date": "2026-02-11 12:34", "score": "1234"})
+        image = cv2.imencode('.png', np.zeros((1080, 1920, 3), dtype=np.uint8))[1].tobytes()
+
+        data = reader.extract_data(image)
+
+        self.assertEqual(list(reader.recognize_regions.call_args[0][0]), ["title"])
+        self.assertEqual(data, {"date": "2026-02-11 12:34", "title": "SHADE", "artist": None, "score": 1234,
+                                "score_candidates": [1234]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+import sys
+import os
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.ingest import AttachmentIngestor, IngestError
+from src.resilience import Deadline
+
+
+def encode(width, height, ext='.png'):
+    ok, buf = cv2.imencode(ext, np.zeros((height, width, 3), dtype=np.uint8))
+    return buf.tobytes()
+
+
+class FakeResponse:
+    def __init__(self, data, chunk_size):
+        self.data = data
+        self.chunk_size = chunk_size
+        self.chunks_read = 0
+        self.content = self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    async def iter_chunked(self, _):
+        for i in range(0, len(self.data), self.chunk_size):
+            self.chunks_read += 1
+            yield self.data[i:i + self.chunk_size]
+
+
+class FakeSession:
+    closed = False
+
+    def __init__(self, data, chunk_size=1024):
+        self.response = FakeResponse(data, chunk_size)
+        self.timeout = None
+
+    def get(self, url, timeout=None):
+        self.timeout = timeout
+        return self.response
+
+
+def attachment(data, content_type='image/png', size=None, width=None, height=None):
+    return SimpleNamespace(url="https://cdn.example/result.png", content_type=content_type,
+                           size=len(data) if size is None else size, width=width, height=height)
+
+
+class TestAttachmentIngestor(unittest.IsolatedAsyncioTestCase):
+    async def fetch(self, ingestor, data, **kwargs):
+        ingestor.session = FakeSession(data)
+        return await ingestor.fetch(attachment(data, **kwargs))
+
+    async def test_accepts_result_screenshot(self):
+        data = encode(1280, 720)
+        result = await self.fetch(AttachmentIngestor(), data)
+        self.assertEqual(bytes(result), data)
+
+    async def test_download_timeout_is_capped_by_deadline(self):
+        ingestor = AttachmentIngestor(timeout=30.0)
+        ingestor.session = FakeSession(encode(1280, 720))
+        await ingestor.fetch(attachment(encode(1280, 720)), deadline=Deadline(2.0))
+        self.assertLessEqual(ingestor.session.timeout.total, 2.0)
+
+    async def test_rejects_by_declared_size_without_downloading(self):
+        ingestor = AttachmentIngestor(max_bytes=1000)
+        ingestor.session = FakeSession(b"")
+        with self.assertRaises(IngestError) as ctx:
+            await ingestor.fetch(attachment(b"", size=5000))
+        self.assertEqual(ctx.exception.reason, "too_large")
+        self.assertEqual(ingestor.session.response.chunks_read, 0)
+
+    async def test_enforces_size_while_streaming(self):
+        data = encode(1280, 720) + b"\0" * 5000
+        with self.assertRaises(IngestError) as ctx:
+            await self.fetch(AttachmentIngestor(max_bytes=4000), data, size=100)
+        self.assertEqual(ctx.exception.reason, "too_large")
+
+    async def test_rejects_portrait_image_after_first_chunk(self):
+        ingestor = AttachmentIngestor()
+        data = encode(720, 1280) + b"\0" * 10000
+        with self.assertRaises(IngestError) as ctx:
+            await self.fetch(ingestor, data)
+        self.assertEqual(ctx.exception.reason, "bad_aspect")
+        self.assertEqual(ingestor.session.response.chunks_read, 1)
+
+    async def test_rejects_by_reported_dimensions_and_content_type(self):
+        ingestor = AttachmentIngestor()
+        with self.assertRaises(IngestError) as ctx:
+            await self.fetch(ingestor, b"", width=320, height=180)
+        self.assertEqual(ctx.exception.reason, "too_small")
+        with self.assertRaises(IngestError) as ctx:
+            await self.fetch(ingestor, b"", content_type='image/gif')
+        self.assertEqual(ctx.exception.reason, "bad_format")
+        with self.assertRaises(IngestError) as ctx:
+            await self.fetch(ingestor, b"", content_type='video/mp4')
+        self.assertEqual(ctx.exception.reason, "not_image")
+
+
+if __name__ == '__main__':
+    unittest.main()
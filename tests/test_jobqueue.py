@@ -0,0 +1,158 @@
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.jobqueue import JobClient, JobFailed, JobQueue
+from src.resilience import CircuitOpen
+from worker import process_job
+
+DATA = {'date': '2026-02-11 12:34', 'title': 'SHADE?', 'score': 1234, 'score_candidates': [1234]}
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "jobs.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_job_lifecycle(self):
+        queue = JobQueue(self.db_path)
+        first = queue.enqueue(bytearray(b"image1"), {"user_id": 1})
+        second = queue.enqueue(b"image2", {"user_id": 2})
+
+        # Another process sees the same queue; jobs are claimed oldest first
+        worker = JobQueue(self.db_path)
+        self.assertEqual(worker.claim("w1"), (first, b"image1", {"user_id": 1}))
+        self.assertEqual(worker.claim("w2")[0], second)
+        self.assertIsNone(worker.claim("w3"))
+        self.assertEqual(queue.counts(), {"running": 2})
+
+        self.assertEqual(queue.results([first, second]), {})
+        worker.finish(first, {"data": {"score": 1234}})
+        worker.fail(second, "boom")
+        self.assertEqual(queue.results([first, second]), {
+            first: ("done", {"data": {"score": 1234}}, None),
+            second: ("failed", None, "boom"),
+        })
+
+        queue.delete([first, second])
+        self.assertEqual(queue.counts(), {})
+        worker.close()
+        queue.close()
+
+    def test_concurrent_claims_take_each_job_once(self):
+        queue = JobQueue(self.db_path)
+        job_ids = [queue.enqueue(b"x", {}) for _ in range(50)]
+        claimed = []
+
+        def claim_all(name):
+            worker = JobQueue(self.db_path)
+            while (job := worker.claim(name)) is not None:
+                claimed.append(job[0])
+            worker.close()
+
+        threads = [threading.Thread(target=claim_all, args=(f"w{i}",)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(claimed), job_ids)
+        queue.close()
+
+    def test_stale_jobs_are_requeued_then_failed(self):
+        queue = JobQueue(self.db_path, stale_after=0, max_attempts=2)
+        job_id = queue.enqueue(b"x", {})
+        queue.claim("dead worker")
+        time.sleep(0.01)
+        self.assertEqual(queue.requeue_stale(), 1)
+        self.assertEqual(queue.claim("w")[0], job_id)
+        time.sleep(0.01)
+        # Second attempt lost too: give up
+        self.assertEqual(queue.requeue_stale(), 0)
+        self.assertEqual(queue.results([job_id])[job_id][0], "failed")
+        queue.close()
+
+
+class TestJobClient(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "jobs.db")
+        self.client = JobClient(JobQueue(self.db_path), poll_interval=0.01)
+        self.client.start()
+        self.worker = JobQueue(self.db_path)
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        self.worker.close()
+        self.tmp.cleanup()
+
+    async def work(self, outcome):
+        while (job := self.worker.claim("w")) is None:
+            await asyncio.sleep(0.01)
+        if isinstance(outcome, Exception):
+            self.worker.fail(job[0], outcome)
+        else:
+            self.worker.finish(job[0], outcome)
+
+    async def test_results_come_back(self):
+        worker = asyncio.create_task(self.work({"data": DATA}))
+        self.assertEqual(await self.client.run(b"image", {"user_id": 1}, timeout=5), (DATA, None))
+        await worker
+
+        worker = asyncio.create_task(self.work({"rejection": "指定期間外のリザルトです。"}))
+        self.assertEqual(await self.client.run(b"image", {}, timeout=5), (None, "指定期間外のリザルトです。"))
+        await worker
+
+        worker = asyncio.create_task(self.work(RuntimeError("Vision down")))
+        with self.assertRaises(JobFailed):
+            await self.client.run(b"image", {}, timeout=5)
+        await worker
+
+        # Finished jobs are deleted by the poller
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.client.queue.counts(), {})
+
+    async def test_timeout_abandons_job(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.client.run(b"image", {}, timeout=0.05)
+        await asyncio.sleep(0.05)
+        # Nobody is waiting for it, so no worker should pick it up
+        self.assertIsNone(self.worker.claim("w"))
+
+
+class TestProcessJob(unittest.TestCase):
+    def setUp(self):
+        self.reader = MagicMock()
+        self.reader.extract_data.return_value = dict(DATA)
+        self.matcher = MagicMock()
+        self.matcher.correct_title.return_value = "SHADE"
+        self.matcher.pick_score.return_value = 1234
+
+    def test_matches_title_and_hashes_image(self):
+        result = process_job(self.reader, self.matcher, b"image", {"expires_at": time.time() + 30})
+        self.assertEqual(result["data"]["title"], "SHADE")
+        self.assertEqual(len(result["data"]["image_hash"]), 64)
+        deadline = self.reader.extract_data.call_args.kwargs["deadline"]
+        self.assertGreater(deadline.remaining(), 25)
+
+    def test_rejections(self):
+        result = process_job(self.reader, self.matcher, b"image", {"event_start": "2026-03-01", "event_end": "2026-03-31"})
+        self.assertIn("指定期間外", result["rejection"])
+
+        self.reader.extract_data.side_effect = CircuitOpen("vision", 12)
+        result = process_job(self.reader, self.matcher, b"image", {})
+        self.assertIn("12秒後", result["rejection"])
+
+
+if __name__ == '__main__':
+    unittest.main()
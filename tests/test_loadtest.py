@@ -0,0 +1,29 @@
+import unittest
+import sys
+import os
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from loadtest import run
+
+
+class TestLoadTest(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_flows(self):
+        report = await run([1, 4], max_lag_ms=1000, log=lambda line: None, edit_rate=0.5)
+
+        self.assertEqual([level["completed"] for level in report["levels"]], [1, 4])
+        self.assertEqual([level["errors"] for level in report["levels"]], [{}, {}])
+        # Every flow went through the real SheetWriter into the fake sheet
+        self.assertEqual(report["submitted"], 5)
+        self.assertEqual(report["sheet_rows"], 5)
+        self.assertTrue(report["sheets_flushed"])
+        self.assertEqual(report["vision"]["requests"], 5)
+        for level in report["levels"]:
+            for key in ("preview", "submit", "loop_lag"):
+                self.assertIn("p99_ms", level[key])
+        self.assertIn("passed", report)
+
+
+if __name__ == '__main__':
+    unittest.main()
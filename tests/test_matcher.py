@@ -0,0 +1,89 @@
+import unittest
+import sys
+import os
+import tempfile
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.matcher import TitleMatcher, TitleIndex, SHORTLIST_SIZE
+from src.catalog import SongCatalog
+
+
+def write_songs(path, songs):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(songs) + "\n")
+
+
+class TestTitleMatcher(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "songs.txt")
+        write_songs(self.path, ["メイメツ、フラグメンツ", "GRADIUS 2012", "Snake Stick", "Scharfrichter"])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_full_width_and_case_are_normalized(self):
+        matcher = TitleMatcher(self.path)
+        self.assertEqual(matcher.correct_title("ＧＲＡＤＩＵＳ　２０１２"), "GRADIUS 2012")
+        self.assertEqual(matcher.correct_title("snake stick"), "Snake Stick")
+        self.assertEqual(matcher.correct_title("Totally Wrong Song"), "Totally Wrong Song")
+
+    def test_large_catalog_is_shortlisted(self):
+        songs = [f"Filler Track {i:04d}" for i in range(5000)] + ["Scharfrichter"]
+        index = TitleIndex(songs)
+        shortlist = list(index.shortlist("scharfrichtor"))
+        self.assertLessEqual(len(shortlist), SHORTLIST_SIZE)
+        self.assertIn(len(songs) - 1, shortlist)
+        self.assertEqual(index.best_match("Scharfrichtor")[0], "Scharfrichter")
+
+    def test_queries_are_memoized(self):
+        matcher = TitleMatcher(self.path)
+        matcher.correct_title("Snake Stik")
+        matcher.correct_title("Snake Stik")
+        self.assertEqual(len(matcher.index.memo), 1)
+
+    def test_hot_reload(self):
+        matcher = TitleMatcher(self.path, reload_interval=0)
+        old_index = matcher.index
+        write_songs(self.path, ["SHADE"])
+        os.utime(self.path, ns=(0, matcher._mtime + 1_000_000_000))
+
+        self.assertEqual(matcher.correct_title("SHADF"), "SHADE")
+        self.assertIsNot(matcher.index, old_index)
+        self.assertEqual(matcher.songs, ["SHADE"])
+
+
+class TestSongCatalog(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "songs.txt")
+        write_songs(self.path, [
+            "# title\tdifficulty\tnotes",
+            "SHADE\tHYPER\t900",
+            "SHADE\tANOTHER\t1200",
+            "Snake Stick",
+        ])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_load(self):
+        catalog = SongCatalog.load(self.path)
+        self.assertEqual(catalog.titles, ["SHADE", "Snake Stick"])
+        self.assertEqual(catalog.max_score("SHADE"), 2400)
+        self.assertEqual(catalog.max_score("SHADE", "HYPER"), 1800)
+        self.assertIsNone(catalog.max_score("Snake Stick"))
+
+    def test_scores_above_max_ex_are_rejected(self):
+        matcher = TitleMatcher(self.path)
+        data = {"score": 5870, "score_candidates": [5870, 2187]}
+        self.assertEqual(matcher.pick_score("SHADE", data), 2187)
+        self.assertIsNone(matcher.pick_score("SHADE", {"score": 5870, "score_candidates": [5870]}))
+        # No note count: the OCR score is kept
+        self.assertEqual(matcher.pick_score("Snake Stick", data), 5870)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+import sys
+import os
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.metrics import Metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def test_snapshot_percentiles_and_counters(self):
+        metrics = Metrics()
+        for ms in range(1, 101):
+            metrics.observe("result_seconds", ms / 1000)
+        metrics.inc("rejections_total", reason="missing_date")
+        metrics.inc("rejections_total", reason="missing_date")
+        with self.assertRaises(ValueError):
+            with metrics.timer("vision_call_seconds"):
+                raise ValueError
+
+        snapshot = metrics.snapshot()
+        result = snapshot["histograms"]["result_seconds"]
+        self.assertEqual(result["count"], 100)
+        self.assertAlmostEqual(result["p50"], 0.05, places=2)
+        self.assertAlmostEqual(result["p99"], 0.099, places=2)
+        self.assertEqual(snapshot["histograms"]["vision_call_seconds"]["count"], 1)
+        self.assertEqual(snapshot["counters"]['rejections_total{reason="missing_date"}'], 2)
+        self.assertEqual(metrics.counter("rejections_total", reason="missing_date"), 2)
+
+    def test_prometheus_text(self):
+        metrics = Metrics()
+        metrics.observe("download_seconds", 0.02)
+        metrics.observe("download_seconds", 3.0)
+        metrics.inc("errors_total", stage="vision")
+
+        text = metrics.render_prometheus()
+
+        self.assertIn("# TYPE errors_total counter", text)
+        self.assertIn('errors_total{stage="vision"} 1', text)
+        self.assertIn("# TYPE download_seconds histogram", text)
+        self.assertIn('download_seconds_bucket{le="0.025"} 1', text)
+        self.assertIn('download_seconds_bucket{le="+Inf"} 2', text)
+        self.assertIn("download_seconds_count 2", text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+
+import numpy as np
+import cv2
+from google.cloud import vision
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.ocr import IIDXReader
+from src.imageinfo import sniff_image
+from src.resilience import Deadline
+
+
+def word(text, x0, y0, x1, y1):
+    vertices = [vision.Vertex(x=x0, y=y0), vision.Vertex(x=x1, y=y0),
+                vision.Vertex(x=x1, y=y1), vision.Vertex(x=x0, y=y1)]
+    return vision.EntityAnnotation(description=text, bounding_poly=vision.BoundingPoly(vertices=vertices))
+
+
+def make_reader(**kwargs):
+    with patch('src.ocr.vision.ImageAnnotatorClient'):
+        return IIDXReader(credentials_path="missing.json", **kwargs)
+
+
+class TestSingleRequestOCR(unittest.TestCase):
+    def setUp(self):
+        self.img = np.zeros((1080, 1920, 3), dtype=np.uint8)
+
+    def test_one_call_and_geometry_assignment(self):
+        reader = make_reader()
+        crops = reader.crop_regions(self.img)
+        _, bands = reader.build_composite(reader.prepare_crops(crops))
+
+        date_top = bands["date"][0]
+        score_top = bands["score"][0]
+        title_top = bands["title"][0]
+        response = vision.AnnotateImageResponse(text_annotations=[
+            word("full text", 0, 0, 10, 10),
+            word("2026-02-11", 5, date_top + 5, 200, date_top + 25),
+            word("12:34", 215, date_top + 5, 280, date_top + 25),
+            word("1234", 10, score_top + 5, 80, score_top + 25),
+            word("メイメツ", 10, title_top + 2, 90, title_top + 22),
+            word("、フラグメンツ", 91, title_top + 2, 200, title_top + 22),
+        ])
+        reader.client.text_detection = MagicMock(return_value=response)
+
+        data = reader.parse_regions(reader.recognize_regions(crops))
+
+        reader.client.text_detection.assert_called_once()
+        self.assertEqual(data["date"], "2026-02-11 12:34")
+        self.assertEqual(data["score"], 1234)
+        self.assertEqual(data["title"], "メイメツ、フラグメンツ")
+
+    def test_per_crop_mode(self):
+        reader = make_reader(single_request=False)
+        reader.recognize_text_cloud = MagicMock(side_effect=["2026/02/11", "SCORE 987", "SHADE"])
+
+        data = reader.parse_regions(reader.recognize_regions(reader.crop_regions(self.img)))
+
+        self.assertEqual(reader.recognize_text_cloud.call_count, 3)
+        self.assertEqual(data, {"date": "2026/02/11", "title": "SHADE", "artist": None, "score": 987,
+                                "score_candidates": [987]})
+
+    def test_compact_encoding(self):
+        reader = make_reader()
+        img = np.zeros((1440, 2560, 3), dtype=np.uint8)
+        prepared = reader.prepare_crops(reader.crop_regions(img))
+        for name, crop in prepared.items():
+            self.assertEqual(crop.ndim, 2)
+            self.assertLessEqual(crop.shape[0], 32)
+        self.assertEqual(reader.encoding()[0], '.png')
+        self.assertEqual(reader.encoding("title")[0], '.jpg')
+        self.assertEqual(reader.encoding("score")[0], '.png')
+
+        legacy = make_reader(compact_encoding=False)
+        self.assertEqual(legacy.prepare_crops(reader.crop_regions(img))["title"].ndim, 3)
+        self.assertEqual(legacy.encoding(), ('.jpg', []))
+
+
+class TestDecode(unittest.TestCase):
+    def test_sniff_headers(self):
+        img = np.zeros((90, 160, 3), dtype=np.uint8)
+        for ext, fmt in [('.png', 'png'), ('.jpg', 'jpeg'), ('.webp', 'webp')]:
+            _, encoded = cv2.imencode(ext, img)
+            self.assertEqual(sniff_image(encoded.tobytes()), (fmt, 160, 90))
+        self.assertIsNone(sniff_image(b"not an image"))
+
+    def test_decode_bytes_and_memoryview(self):
+        reader = make_reader()
+        _, encoded = cv2.imencode('.png', np.zeros((1080, 1920, 3), dtype=np.uint8))
+        self.assertEqual(reader.decode_image(encoded.tobytes()).shape, (1080, 1920, 3))
+        self.assertEqual(reader.decode_image(memoryview(encoded.tobytes())).shape, (1080, 1920, 3))
+
+    def test_4k_is_decoded_at_reduced_resolution(self):
+        reader = make_reader()
+        _, encoded = cv2.imencode('.jpg', np.zeros((2160, 3840, 3), dtype=np.uint8))
+        self.assertEqual(reader.decode_image(encoded.tobytes()).shape, (1080, 1920, 3))
+
+    def test_undecodable_bytes(self):
+        reader = make_reader()
+        with self.assertRaises(ValueError):
+            reader.decode_image(b"garbage")
+
+
+class TestAsyncOCR(unittest.IsolatedAsyncioTestCase):
+    async def test_uploads_run_concurrently_off_loop(self):
+        reader = make_reader(max_workers=4)
+        loop_thread = threading.get_ident()
+        threads = []
+        deadlines = []
+        deadline = Deadline(5.0)
+
+        def slow_extract(image_path, stats=None, deadline=None):
+            threads.append(threading.get_ident())
+            deadlines.append(deadline)
+            time.sleep(0.2)
+            return {"date": None, "title": image_path, "artist": None, "score": None}
+
+        reader.extract_data = slow_extract
+        start = time.perf_counter()
+        results = await asyncio.gather(*(reader.extract_data_async(f"img{i}", deadline) for i in range(4)))
+        elapsed = time.perf_counter() - start
+        reader.close()
+
+        self.assertEqual([r["title"] for r in results], ["img0", "img1", "img2", "img3"])
+        self.assertNotIn(loop_thread, threads)
+        self.assertEqual(deadlines, [deadline] * 4)
+        self.assertLess(elapsed, 0.6)
+
+
+if __name__ == '__main__':
+    unittest.main()
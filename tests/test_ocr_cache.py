@@ -0,0 +1,107 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.ocr import IIDXReader
+from src.ocr_cache import OCRCache, content_hash
+from src.resilience import Deadline
+
+
+def screenshot(score):
+    img = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    cv2.putText(img, "2026-02-11 12:34", (70, 45), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2)
+    cv2.putText(img, "SHADE", (200, 285), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+    cv2.putText(img, str(score), (1300, 550), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2)
+    return img
+
+
+def encode(img, ext='.png', params=()):
+    return cv2.imencode(ext, img, list(params))[1].tobytes()
+
+
+class TestOCRCache(unittest.TestCase):
+    def setUp(self):
+        with patch('src.ocr.vision.ImageAnnotatorClient'):
+            self.reader = IIDXReader(credentials_path="missing.json", cache=OCRCache())
+        self.texts = {"date": "2026-02-11", "score": "1234", "title": "SHADE"}
+        self.reader.recognize_regions = MagicMock(
+            side_effect=lambda crops, stats=None, deadline=None: {name: self.texts[name] for name in crops})
+
+    def test_identical_upload_hits_before_decode(self):
+        image = encode(screenshot(1234))
+        first = self.reader.extract_data(image)
+        first["title"] = "mutated by caller"
+        self.reader.decode_image = MagicMock()
+
+        second = self.reader.extract_data(image)
+
+        self.assertEqual(second["title"], "SHADE")
+        self.reader.decode_image.assert_not_called()
+        self.assertEqual(self.reader.recognize_regions.call_count, 1)
+        self.assertEqual(self.reader.cache.stats()["exact_hits"], 1)
+
+    def test_reencoded_upload_reuses_title_by_perceptual_hash(self):
+        self.reader.extract_data(encode(screenshot(1234)))
+        data = self.reader.extract_data(encode(screenshot(1234), '.jpg', (cv2.IMWRITE_JPEG_QUALITY, 80)))
+
+        self.assertEqual(self.reader.cache.stats()["title_only_hits"], 1)
+        self.assertEqual((data["title"], data["score"]), ("SHADE", 1234))
+        # Date and score are still read; only the title comes from the cache
+        self.assertEqual(list(self.reader.recognize_regions.call_args.args[0]), ["date", "score"])
+        # A title-only reuse is not a full hit
+        self.assertEqual(self.reader.cache.stats()["hit_rate"], 0.0)
+
+    def test_deadline_reaches_vision(self):
+        deadline = Deadline(5.0)
+        self.reader.extract_data(encode(screenshot(1234)), deadline=deadline)
+        self.assertIs(self.reader.recognize_regions.call_args.args[2], deadline)
+
+    def test_one_digit_score_change_is_read_again(self):
+        self.reader.extract_data(encode(screenshot(1234)))
+        self.texts["score"] = "1334"
+        image = encode(screenshot(1334))
+        data = self.reader.extract_data(image)
+
+        # 1234 and 1334 have the same dHash, so this is a near match...
+        self.assertEqual(self.reader.cache.stats()["title_only_hits"], 1)
+        # ...but the score is read again rather than served from the cache
+        self.assertEqual(data["score"], 1334)
+        self.assertEqual(data["title"], "SHADE")
+        self.assertEqual(self.reader.recognize_regions.call_count, 2)
+        # The exact-hash entry of the new screenshot holds the new score
+        self.assertEqual(self.reader.cache.get_exact(content_hash(image))["score"], 1334)
+
+    def test_different_score_is_a_miss(self):
+        self.reader.extract_data(encode(screenshot(1234)))
+        self.reader.extract_data(encode(screenshot(2987)))
+
+        self.assertEqual(self.reader.recognize_regions.call_count, 2)
+        self.assertEqual(self.reader.cache.stats()["misses"], 2)
+
+    def test_lru_eviction_and_disk_tier(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.db")
+            cache = OCRCache(max_entries=1, db_path=path)
+            cache.put("a", (0, 0, 0), {"score": 1})
+            cache.put("b", (2**64 - 1,) * 3, {"score": 2})
+            self.assertEqual(list(cache.entries), ["b"])
+
+            restarted = OCRCache(db_path=path)
+            self.assertEqual(restarted.get_exact("a"), {"score": 1})
+            self.assertEqual(restarted.get_similar((2**64 - 1,) * 3), {"score": 2})
+            self.assertEqual(restarted.stats()["disk_hits"], 1)
+            self.assertEqual(restarted.stats()["title_only_hits"], 1)
+            cache.db.close()
+            restarted.db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
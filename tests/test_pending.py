@@ -0,0 +1,157 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.dedupe import DuplicateIndex
+from src.pending import PendingStore, PendingSubmission
+from src.ui import ScoreCorrectionModal, SubmitButton, finalize_submission
+
+DATA = {'date': '2026-02-11', 'title': 'Test Song', 'score': 1234, 'score_candidates': [1234]}
+
+
+def record(key, created_at=None, count=1):
+    # Distinct results, one day apart
+    entries = [PendingSubmission.entry(dict(DATA, date=f"2026-02-{11 + i}"), "http://example.com/image.jpg")
+               for i in range(count)]
+    return PendingSubmission(key, 7, "TestUser", entries, True, created_at)
+
+
+class TestPendingStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "pending.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_lru_bound_and_reload_from_disk(self):
+        store = PendingStore(self.db_path, max_entries=2)
+        for key in (1, 2, 3):
+            store.add(record(key))
+        self.assertEqual(list(store.entries), [2, 3])
+        self.assertEqual(len(store), 3)
+        # Evicted from memory, reloaded from SQLite
+        self.assertEqual(store.get(1).data()['title'], "Test Song")
+        self.assertEqual(list(store.entries), [3, 1])
+
+    def test_survives_restart_with_updated_score(self):
+        store = PendingStore(self.db_path)
+        store.add(record(1))
+        store.update_score(1, 2000)
+        store.db.close()
+
+        restored = PendingStore(self.db_path).get(1)
+        self.assertEqual(restored.data()['score'], 2000)
+        self.assertTrue(restored.is_qualifier)
+        self.assertNotIn('score_candidates', restored.data())
+
+    def test_ttl(self):
+        store = PendingStore(self.db_path, ttl=60)
+        store.add(record(1, created_at=time.time() - 120))
+        store.add(record(2))
+        self.assertIsNone(store.get(1))
+        store.expire()
+        self.assertEqual(len(store), 1)
+
+
+class TestFinalizeSubmission(unittest.IsolatedAsyncioTestCase):
+    def interaction(self, store):
+        interaction = MagicMock()
+        interaction.client.pending = store
+        interaction.client.dedupe = DuplicateIndex()
+        interaction.response.defer = AsyncMock()
+        interaction.response.send_message = AsyncMock()
+        interaction.followup.send = AsyncMock()
+        interaction.channel.send = AsyncMock()
+        interaction.edit_original_response = AsyncMock()
+        return interaction
+
+    async def test_submit_button_writes_once(self):
+        store = PendingStore()
+        store.add(record(5))
+        interaction = self.interaction(store)
+
+        await SubmitButton(5).callback(interaction)
+        interaction.client.sheet_writer.submit_many.assert_called_once_with(
+            [{'date': '2026-02-11', 'title': 'Test Song', 'score': 1234}], "TestUser", True)
+        interaction.edit_original_response.assert_awaited_once()
+
+        # A second click finds nothing to submit
+        await SubmitButton(5).callback(interaction)
+        interaction.client.sheet_writer.submit_many.assert_called_once()
+        interaction.response.send_message.assert_awaited_once()
+
+    async def test_multi_screenshot_edit_then_submit(self):
+        store = PendingStore()
+        store.add(record(8, count=3))
+        interaction = self.interaction(store)
+        interaction.response.edit_message = AsyncMock()
+
+        modal = ScoreCorrectionModal(store.get(8), index=1)
+        modal.score_input._value = "1500"
+        await modal.on_submit(interaction)
+        # Only the preview is updated; nothing is written yet
+        interaction.response.edit_message.assert_awaited_once()
+        interaction.client.sheet_writer.submit_many.assert_not_called()
+
+        await SubmitButton(8).callback(interaction)
+        rows = interaction.client.sheet_writer.submit_many.call_args[0][0]
+        self.assertEqual([row['score'] for row in rows], [1234, 1500, 1234])
+
+    async def test_duplicates_are_dropped_before_writing(self):
+        store = PendingStore()
+        interaction = self.interaction(store)
+        # Submitted earlier by the same account under another display name
+        interaction.client.dedupe.add(7, {'date': '2026/02/11', 'title': 'ＴＥＳＴ Song', 'score': 1234})
+        store.add(record(9))
+
+        await SubmitButton(9).callback(interaction)
+        interaction.client.sheet_writer.submit_many.assert_not_called()
+        interaction.channel.send.assert_not_awaited()
+        self.assertIn("既に登録", interaction.edit_original_response.call_args.kwargs["content"])
+
+    async def test_same_image_from_another_account(self):
+        store = PendingStore()
+        interaction = self.interaction(store)
+        interaction.client.dedupe.add(1, {'date': '2026-01-01', 'title': 'Other', 'score': 1}, "abc")
+        entries = [PendingSubmission.entry(DATA, None, "abc"), PendingSubmission.entry(dict(DATA, score=999))]
+        store.add(PendingSubmission(10, 7, "TestUser", entries))
+
+        await SubmitButton(10).callback(interaction)
+        rows = interaction.client.sheet_writer.submit_many.call_args[0][0]
+        self.assertEqual([row['score'] for row in rows], [999])
+        # Recorded, so the same row is caught next time
+        self.assertEqual(interaction.client.dedupe.check(7, "Renamed", rows[0]), "result")
+
+    async def test_duplicates_within_one_submission(self):
+        store = PendingStore()
+        interaction = self.interaction(store)
+        entries = [PendingSubmission.entry(DATA, None, "abc"),
+                   PendingSubmission.entry(DATA, None, "abc"),  # the same file attached twice
+                   PendingSubmission.entry(DATA, None, "def"),  # the same result, re-encoded
+                   PendingSubmission.entry(dict(DATA, score=999), None, "ghi")]
+        store.add(PendingSubmission(11, 7, "TestUser", entries))
+
+        await SubmitButton(11).callback(interaction)
+        rows = interaction.client.sheet_writer.submit_many.call_args[0][0]
+        self.assertEqual([row['score'] for row in rows], [1234, 999])
+
+    async def test_failed_journal_write_keeps_record(self):
+        store = PendingStore()
+        rec = record(6)
+        store.add(rec)
+        interaction = self.interaction(store)
+        interaction.client.sheet_writer.submit_many.side_effect = RuntimeError("disk full")
+
+        await finalize_submission(interaction, rec)
+        self.assertIsNotNone(store.get(6))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import subprocess
+import tempfile
+import time
+import unittest
+from concurrent.futures import Future
+from unittest.mock import MagicMock, patch
+import sys
+import os
+
+import cv2
+import numpy as np
+from multiprocessing import shared_memory
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.ocr import IIDXReader
+from src.preprocess import PreprocessPool, export_crops, free_crops, import_crops
+from src.resilience import Deadline
+
+
+def screenshot(seed=0):
+    rng = np.random.default_rng(seed)
+    img = rng.integers(0, 255, size=(1080, 1920, 3), dtype=np.uint8)
+    return cv2.imencode(".png", img)[1].tobytes()
+
+
+class TestSharedMemoryHandoff(unittest.TestCase):
+    def test_round_trip_frees_block(self):
+        crops = IIDXReader.crop_regions(IIDXReader.decode_image(screenshot()))
+        block_name, layout = export_crops(crops)
+        self.assertEqual([entry[0] for entry in layout], list(crops))
+        self.assertTrue(all(entry[3] % 64 == 0 for entry in layout))
+
+        restored = import_crops(block_name, layout)
+        for name, crop in crops.items():
+            np.testing.assert_array_equal(restored[name], crop)
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=block_name)
+
+    def test_abandoned_result_is_freed(self):
+        crops = IIDXReader.crop_regions(IIDXReader.decode_image(screenshot()))
+        future = Future()
+        future.add_done_callback(free_crops)
+        block_name, layout = export_crops(crops)
+        future.set_result((block_name, layout))
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=block_name)
+
+
+class TestPreprocessPool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = PreprocessPool(2)
+        cls.warmed = cls.pool.warm()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+
+    def test_same_crops_as_in_process(self):
+        self.assertEqual(self.warmed, 2)
+        image = screenshot(1)
+        expected = IIDXReader.crop_regions(IIDXReader.decode_image(image))
+
+        crops = self.pool.crops(bytearray(image), grayscale=False)
+        for name in expected:
+            np.testing.assert_array_equal(crops[name], expected[name])
+
+        gray = self.pool.crops(image)
+        for name in expected:
+            np.testing.assert_array_equal(gray[name], IIDXReader.preprocess_crop(expected[name]))
+
+    def test_busy_workers_time_out_at_deadline(self):
+        # Both workers are stuck on something else
+        for _ in range(2):
+            self.pool.executor.submit(time.sleep, 0.5)
+        start = time.perf_counter()
+        with self.assertRaises(TimeoutError):
+            self.pool.crops(screenshot(3), deadline=Deadline(0.1))
+        self.assertLess(time.perf_counter() - start, 0.4)
+
+    @patch('src.ocr.vision.ImageAnnotatorClient')
+    def test_reader_uses_pool(self, _):
+        image = screenshot(2)
+        with_pool = IIDXReader(credentials_path="missing.json", max_workers=1, preprocess_pool=MagicMock())
+        with_pool.preprocess_pool.crops.side_effect = self.pool.crops
+        without_pool = IIDXReader(credentials_path="missing.json", max_workers=1)
+        for reader in (with_pool, without_pool):
+            reader.recognize_regions = MagicMock(return_value={"date": "2026-02-11 12:34", "score": "1234",
+                                                               "title": "SHADE"})
+        self.assertEqual(with_pool.extract_data(image), without_pool.extract_data(image))
+        with_pool.preprocess_pool.crops.assert_called_once_with(image, grayscale=True, deadline=None)
+
+        with_pool.close()
+        with_pool.preprocess_pool.close.assert_called_once()
+        without_pool.close()
+
+
+PROBE = """
+import os, sys
+sys.path.insert(0, {root!r})
+if __name__ == "__mp_main__":
+    with open({marker!r}, "a") as f:
+        f.write("imported\\n")
+from src.preprocess import PreprocessPool
+if __name__ == "__main__":
+    pool = PreprocessPool(2)
+    pool.warm()
+    processes = list(pool.executor._processes.values())
+    pool.close()
+    print(sum(process.is_alive() for process in processes))
+"""
+
+
+class TestWorkerStartup(unittest.TestCase):
+    def test_workers_skip_main_module_and_stop_on_close(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            marker = os.path.join(tmp, "marker")
+            script = os.path.join(tmp, "probe.py")
+            root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+            with open(script, "w") as f:
+                f.write(PROBE.format(root=root, marker=marker))
+            result = subprocess.run([sys.executable, script], capture_output=True, text=True, timeout=120)
+            self.assertEqual(result.returncode, 0, result.stderr)
+            # No worker re-imported the script, and none is left running
+            self.assertFalse(os.path.exists(marker))
+            self.assertEqual(result.stdout.strip(), "0")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import asyncio
+import time
+import unittest
+import sys
+import os
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.ratelimit import AdmissionController, RateLimited, TokenBucket
+from src.resilience import Deadline, DeadlineExceeded
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_refill(self):
+        bucket = TokenBucket(rate=100, capacity=2)
+        self.assertTrue(bucket.try_acquire())
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+        self.assertGreater(bucket.time_until_available(), 0)
+
+        start = time.perf_counter()
+        bucket.acquire()
+        self.assertGreater(time.perf_counter() - start, 0.005)
+
+    def test_acquire_gives_up_at_deadline(self):
+        bucket = TokenBucket(rate=1, capacity=1)
+        self.assertTrue(bucket.try_acquire())
+
+        start = time.perf_counter()
+        with self.assertRaises(DeadlineExceeded):
+            bucket.acquire(deadline=Deadline(0.1))
+        self.assertLess(time.perf_counter() - start, 0.05)
+        # The tokens were not spent: the next caller doesn't wait behind the debt
+        self.assertLess(bucket.time_until_available(), 1.0)
+
+
+class TestAdmissionController(unittest.IsolatedAsyncioTestCase):
+    async def test_queue_positions_and_concurrency_limit(self):
+        admission = AdmissionController(max_concurrent=2, user_rate=1, user_burst=5)
+        positions = []
+        running = 0
+        peak = 0
+
+        async def request(user_id):
+            nonlocal running, peak
+
+            async def on_queued(position):
+                positions.append(position)
+
+            async with admission.admit(user_id, on_queued=on_queued):
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.02)
+                running -= 1
+
+        await asyncio.gather(*(request(i) for i in range(5)))
+
+        self.assertEqual(peak, 2)
+        self.assertEqual(positions, [1, 2, 3])
+        self.assertEqual(admission.active, 0)
+
+    async def test_per_user_budget(self):
+        admission = AdmissionController(max_concurrent=4, user_rate=0.01, user_burst=2)
+        for _ in range(2):
+            async with admission.admit("u1"):
+                pass
+        with self.assertRaises(RateLimited) as ctx:
+            async with admission.admit("u1"):
+                pass
+        self.assertGreater(ctx.exception.retry_after, 0)
+        # Other users are unaffected
+        async with admission.admit("u2"):
+            pass
+
+    async def test_cancelled_waiter_does_not_leak_slot(self):
+        admission = AdmissionController(max_concurrent=1, user_rate=1, user_burst=5)
+        release = asyncio.Event()
+
+        async def holder():
+            async with admission.admit("a"):
+                await release.wait()
+
+        holding = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(admission.admit("b").__aenter__())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        release.set()
+        await holding
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+
+        self.assertEqual(admission.active, 0)
+        async with admission.admit("c"):
+            self.assertEqual(admission.active, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+
+import numpy as np
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.metrics import METRICS
+from src.ocr import IIDXReader, HEDGE_MIN_SAMPLES
+from src.ratelimit import TokenBucket
+from src.resilience import CircuitBreaker, CircuitOpen, Deadline, DeadlineExceeded
+
+
+class TestDeadline(unittest.TestCase):
+    def test_timeout_is_capped_by_remaining_budget(self):
+        deadline = Deadline(0.2)
+        self.assertEqual(deadline.timeout(0.05), 0.05)
+        self.assertLessEqual(deadline.timeout(10), 0.2)
+        time.sleep(0.25)
+        self.assertTrue(deadline.expired)
+        with self.assertRaises(DeadlineExceeded):
+            deadline.timeout(10)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_then_half_open_probe_closes(self):
+        breaker = CircuitBreaker("vision", failure_threshold=2, reset_timeout=0.05)
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.record_failure())
+        with self.assertRaises(CircuitOpen):
+            breaker.before_call()
+
+        time.sleep(0.06)
+        breaker.before_call()  # the probe
+        with self.assertRaises(CircuitOpen):
+            breaker.before_call()  # only one probe at a time
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker("vision", failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        breaker.before_call()
+        self.assertTrue(breaker.record_failure())
+        self.assertEqual(breaker.state, "open")
+
+
+class TestVisionCalls(unittest.TestCase):
+    def setUp(self):
+        METRICS.reset()
+
+    def make_reader(self, **kwargs):
+        with patch('src.ocr.vision.ImageAnnotatorClient'):
+            return IIDXReader(credentials_path="missing.json", **kwargs)
+
+    def test_breaker_fails_fast_after_consecutive_failures(self):
+        reader = self.make_reader(circuit_breaker=CircuitBreaker("vision", failure_threshold=2, reset_timeout=60))
+        reader.client.text_detection.side_effect = TimeoutError("deadline exceeded")
+        image = np.zeros((64, 64), dtype=np.uint8)
+        for _ in range(2):
+            with self.assertRaises(TimeoutError):
+                reader.recognize_text_cloud(image)
+        with self.assertRaises(CircuitOpen):
+            reader.recognize_text_cloud(image)
+        self.assertEqual(reader.client.text_detection.call_count, 2)
+        self.assertEqual(METRICS.counter("rejections_total", reason="vision_circuit_open"), 1)
+
+    def test_timeout_is_passed_and_capped_by_deadline(self):
+        reader = self.make_reader(vision_timeout=5.0)
+        reader.client.text_detection.return_value = MagicMock(text_annotations=[], error=MagicMock(message=""))
+        reader.recognize_text_cloud(np.zeros((64, 64), dtype=np.uint8), deadline=Deadline(1.0))
+        self.assertLessEqual(reader.client.text_detection.call_args.kwargs["timeout"], 1.0)
+
+    def test_quota_wait_past_deadline_skips_the_call(self):
+        bucket = TokenBucket(rate=1, capacity=1)
+        bucket.try_acquire()
+        reader = self.make_reader(rate_limiter=bucket)
+        with self.assertRaises(DeadlineExceeded):
+            reader.recognize_text_cloud(np.zeros((64, 64), dtype=np.uint8), deadline=Deadline(0.2))
+        reader.client.text_detection.assert_not_called()
+
+    def test_hedged_request_wins_over_slow_primary(self):
+        reader = self.make_reader(hedge=True)
+        for _ in range(HEDGE_MIN_SAMPLES):
+            METRICS.observe("vision_call_seconds", 0.01)
+        calls = []
+        release = threading.Event()
+
+        def call(timeout):
+            calls.append(timeout)
+            if len(calls) == 1:
+                release.wait(2)  # the slow primary
+                return "primary"
+            return "hedge"
+
+        start = time.perf_counter()
+        self.assertEqual(reader._call_vision(call, 5.0), "hedge")
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertEqual(METRICS.counter("vision_hedged_total"), 1)
+        release.set()
+        reader.close()
+
+    def test_queued_hedge_is_cancelled_when_primary_wins(self):
+        bucket = TokenBucket(rate=0.001, capacity=5)
+        reader = self.make_reader(hedge=True, max_workers=1, rate_limiter=bucket)
+        for _ in range(HEDGE_MIN_SAMPLES):
+            METRICS.observe("vision_call_seconds", 0.01)
+        calls = []
+
+        def call(timeout):
+            calls.append(timeout)
+            # Another request's call is next in line for the only hedge thread,
+            # so the hedge is still queued when the primary returns
+            reader.hedge_executor.submit(time.sleep, 0.2)
+            time.sleep(0.1)
+            return "primary"
+
+        self.assertEqual(reader._call_vision(call, 5.0), "primary")
+        time.sleep(0.3)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(METRICS.counter("vision_hedged_total"), 1)
+        # The hedge's token was given back
+        self.assertAlmostEqual(bucket.tokens, 5, places=2)
+        reader.close()
+
+    def test_batch_calls_are_not_hedged(self):
+        reader = self.make_reader(hedge=True, vision_timeout=2.0)
+        for _ in range(HEDGE_MIN_SAMPLES):
+            METRICS.observe("vision_call_seconds", 0.01)
+
+        def slow_batch(requests, timeout=None):
+            time.sleep(0.1)
+            return MagicMock(responses=[])
+
+        reader.client.batch_annotate_images.side_effect = slow_batch
+        reader.annotate_batch([b"image"] * 16)
+
+        reader.client.batch_annotate_images.assert_called_once()
+        self.assertEqual(reader.client.batch_annotate_images.call_args.kwargs["timeout"], 6.0)
+        self.assertEqual(METRICS.counter("vision_hedged_total"), 0)
+        self.assertGreater(METRICS.percentile("vision_call_seconds", 50, kind="batch"), 0.05)
+        reader.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,6 +7,7 @@ import asyncio
 # Add project root to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from src.pending import PendingSubmission
 from src.ui import VerificationView
 from src.sheets import SheetManager
 
@@ -22,14 +23,20 @@ class TestRoleVerification(unittest.IsolatedAsyncioTestCase):
 
     async def test_verification_view_init(self):
         # View init requires running loop which IsolatedAsyncioTestCase provides
-        
+
         # Test initialization with is_qualifier=True
-        view = VerificationView(self.data, self.username, self.mock_client, self.image_url, is_qualifier=True)
-        self.assertTrue(view.is_qualifier)
+        entries = [PendingSubmission.entry(self.data, self.image_url)]
+        record = PendingSubmission(42, 1, self.username, entries, is_qualifier=True)
+        view = VerificationView(record)
+        self.assertTrue(view.record.is_qualifier)
+        self.assertEqual([item.custom_id for item in view.children], ["verify:submit:42", "verify:edit:42:0"])
 
         # Test initialization with is_qualifier=False (default)
-        view = VerificationView(self.data, self.username, self.mock_client, self.image_url)
-        self.assertFalse(view.is_qualifier)
+        view = VerificationView(PendingSubmission(43, 1, self.username, entries * 3))
+        self.assertFalse(view.record.is_qualifier)
+        # One 修正 button per screenshot
+        self.assertEqual([item.custom_id for item in view.children][1:],
+                         ["verify:edit:43:0", "verify:edit:43:1", "verify:edit:43:2"])
 
     async def test_sheet_manager_append_score(self):
         # Mock the workbook and sheet
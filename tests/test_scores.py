@@ -0,0 +1,65 @@
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+import tempfile
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.dedupe import DuplicateIndex
+from src.scores import ScoreStore
+
+
+class TestScoreStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = ScoreStore(os.path.join(self.tmp.name, "scores.db"))
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_best_score_aggregates(self):
+        self.store.add({'date': '2026-02-11 20:00', 'title': 'Song A', 'score': 1500}, "alice", True)
+        self.store.add({'date': '2026-02-12 20:00', 'title': 'Song A', 'score': 1400}, "alice", True)
+        self.store.add({'date': '2026-02-12 21:00', 'title': 'Song A', 'score': 1800}, "bob")
+        self.store.add({'date': '2026-02-12 22:00', 'title': 'Song B', 'score': 900}, "alice")
+
+        self.assertEqual([(u, s) for u, s, _ in self.store.ranking('Song A')], [("bob", 1800), ("alice", 1500)])
+        self.assertEqual(self.store.best_for_user("alice"), [('Song A', 1500, 2), ('Song B', 900, 1)])
+        self.assertEqual(len(self.store), 4)
+
+    def test_submission_keys_feed_duplicate_index(self):
+        self.store.add({'date': '2026-02-11 20:00', 'title': 'Song A', 'score': 1500}, "alice", True, "hash1", 1)
+        # Read back from the sheet: no user id
+        self.store.add_row(["2026-02-11 21:00", "carol", "Song B", 800, False])
+        index = DuplicateIndex()
+        index.load(self.store.submission_keys())
+        song_a = {'date': '2026-02-11 20:00', 'title': 'song a', 'score': 1500}
+        self.assertEqual(index.check(1, "alice", song_a), "result")
+        # Keyed by user id: a rename doesn't help, and someone else taking the name isn't blocked
+        self.assertEqual(index.check(1, "alice2", song_a), "result")
+        self.assertIsNone(index.check(2, "alice", song_a))
+        self.assertEqual(index.check(2, "bob", {'date': '2026-02-12', 'title': 'Song A', 'score': 1}, "hash1"), "image")
+        self.assertEqual(index.check(3, "carol", {'date': '2026-02-11 21:00', 'title': 'Song B', 'score': 800}),
+                         "result")
+
+    def test_reconcile_is_idempotent(self):
+        sheet = MagicMock()
+        sheet.read_rows.return_value = [
+            ["Date", "User Name", "Song Title", "Score", "Is Qualifier"],
+            ["2026-02-11 20:00", "alice", "Song A", "1,500", "TRUE"],
+            ["2026-02-11 21:00", "bob", "Song A", "1200", "FALSE"],
+            ["", "", "", "", ""],
+        ]
+        self.assertEqual(self.store.reconcile(sheet), 2)
+        self.store.add({'date': '2026-02-11 20:00', 'title': 'Song A', 'score': 1500}, "alice", True)
+        self.assertEqual(self.store.reconcile(sheet), 0)
+        sheet.read_rows.assert_called_with("素データ")
+        self.assertEqual(len(self.store), 2)
+        self.assertEqual(self.store.ranking('Song A')[0][:2], ("alice", 1500))
+
+
+if __name__ == '__main__':
+    unittest.main()
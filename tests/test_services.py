@@ -0,0 +1,72 @@
+import asyncio
+import unittest
+import sys
+import os
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.services import BackgroundService, ServiceUnavailable
+
+
+class TestBackgroundService(unittest.IsolatedAsyncioTestCase):
+    async def test_retries_until_factory_succeeds(self):
+        calls = []
+        ready = []
+
+        def factory():
+            calls.append(1)
+            if len(calls) < 3:
+                raise ConnectionError("sheets down")
+            return "manager"
+
+        service = BackgroundService("sheets", factory, on_ready=ready.append, retry_base=0.01)
+        service.start()
+        self.assertEqual(await service.get(timeout=2), "manager")
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(ready, ["manager"])
+        self.assertIsNone(service.error)
+
+    async def test_get_times_out_while_starting(self):
+        service = BackgroundService("ocr", lambda: 1 / 0, retry_base=10)
+        service.start()
+        with self.assertRaises(ServiceUnavailable) as ctx:
+            await service.get(timeout=0.1)
+        self.assertIsInstance(ctx.exception.error, ZeroDivisionError)
+        await service.close()
+        self.assertFalse(service.ready)
+
+    async def test_gives_up_on_errors_that_are_not_retryable(self):
+        calls = []
+        failed = []
+
+        def factory():
+            calls.append(1)
+            raise FileNotFoundError("service_account.json")
+
+        service = BackgroundService("sheets", factory, retry_base=0.01, on_failed=failed.append,
+                                    retry_if=lambda e: isinstance(e, ConnectionError))
+        service.start()
+        with self.assertRaises(ServiceUnavailable):
+            await service.get(timeout=2)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(service.failed)
+        self.assertIsInstance(failed[0], FileNotFoundError)
+
+    async def test_services_start_concurrently(self):
+        def slow():
+            import time
+            time.sleep(0.2)
+            return True
+
+        services = [BackgroundService(f"s{i}", slow) for i in range(3)]
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for service in services:
+            service.start()
+        await asyncio.gather(*(service.get() for service in services))
+        self.assertLess(loop.time() - start, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+import tempfile
+import threading
+import time
+
+import gspread
+import requests
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.sheets import SheetManager
+from src.sheet_writer import SheetWriter
+
+
+def api_error(status):
+    response = requests.Response()
+    response.status_code = status
+    response._content = b'{"error": {"code": %d, "message": "quota", "status": "X"}}' % status
+    return gspread.exceptions.APIError(response)
+
+
+class TestSheetWriter(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.journal = os.path.join(self.tmp.name, "journal.db")
+        self.sm = SheetManager()
+        self.sm.append_rows = MagicMock()
+        self.data = {'date': '2026-02-11', 'title': 'Test Song', 'score': 1234}
+
+    async def asyncTearDown(self):
+        self.tmp.cleanup()
+
+    def make_writer(self):
+        return SheetWriter(self.sm, self.journal, batch_delay=0.01, retry_base=0.01)
+
+    async def test_rows_are_batched(self):
+        writer = self.make_writer()
+        writer.submit(self.data, "A", True)
+        writer.submit(self.data, "B", False)
+        self.assertEqual(writer.pending_count(), 2)
+
+        self.assertTrue(await writer.flush())
+
+        self.sm.append_rows.assert_called_once_with(
+            [['2026-02-11', 'A', 'Test Song', 1234, True], ['2026-02-11', 'B', 'Test Song', 1234, False]],
+            "素データ",
+        )
+        self.assertEqual(writer.pending_count(), 0)
+
+    async def test_submit_many_goes_out_in_one_append(self):
+        writer = self.make_writer()
+        writer.start()
+        writer.submit_many([self.data, dict(self.data, score=1500)], "A", True)
+
+        for _ in range(100):
+            if writer.pending_count() == 0:
+                break
+            await asyncio.sleep(0.01)
+        await writer.stop()
+
+        self.sm.append_rows.assert_called_once()
+        self.assertEqual([row[3] for row in self.sm.append_rows.call_args[0][0]], [1234, 1500])
+
+    async def test_rate_limit_is_retried(self):
+        self.sm.append_rows.side_effect = [api_error(429), None]
+        writer = self.make_writer()
+        writer.start()
+        writer.submit(self.data, "A")
+
+        for _ in range(100):
+            if writer.pending_count() == 0:
+                break
+            await asyncio.sleep(0.01)
+        await writer.stop()
+
+        self.assertEqual(self.sm.append_rows.call_count, 2)
+        self.assertEqual(writer.pending_count(), 0)
+
+    async def test_pending_rows_survive_restart(self):
+        self.sm.append_rows.side_effect = ConnectionError("sheets down")
+        writer = self.make_writer()
+        writer.submit(self.data, "A")
+        self.assertFalse(await writer.flush())
+        writer.db.close()
+
+        self.sm.append_rows.side_effect = None
+        restarted = self.make_writer()
+        self.assertEqual(restarted.pending_count(), 1)
+        self.assertTrue(await restarted.flush())
+        self.assertEqual(restarted.pending_count(), 0)
+
+    async def test_rejected_rows_are_kept_but_not_retried(self):
+        self.sm.append_rows.side_effect = api_error(400)
+        writer = self.make_writer()
+        writer.submit(self.data, "A")
+
+        self.assertTrue(await writer.flush())
+
+        self.assertEqual(writer.pending_count(), 0)
+        self.assertEqual(writer.db.execute("SELECT COUNT(*) FROM pending_rows WHERE failed = 1").fetchone()[0], 1)
+
+    async def test_rows_wait_for_the_sheet_manager(self):
+        writer = SheetWriter(None, self.journal, batch_delay=0.01, retry_base=0.01)
+        writer.start()
+        writer.submit(self.data, "A")
+        await asyncio.sleep(0.05)
+        self.assertEqual(writer.pending_count(), 1)
+        self.assertFalse(await writer.flush())
+
+        writer.set_sheet_manager(self.sm)
+        for _ in range(100):
+            if writer.pending_count() == 0:
+                break
+            await asyncio.sleep(0.01)
+        await writer.stop()
+
+        self.sm.append_rows.assert_called_once_with([['2026-02-11', 'A', 'Test Song', 1234, False]], "素データ")
+
+    async def slow_append_in_progress(self, writer):
+        """Makes append_rows take a while and returns once the writer task is inside it."""
+        started = threading.Event()
+
+        def slow_append(rows, worksheet):
+            started.set()
+            time.sleep(0.2)
+
+        self.sm.append_rows.side_effect = slow_append
+        writer.start()
+        writer.submit(self.data, "A")
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+
+    async def test_stop_during_append_does_not_resend(self):
+        writer = self.make_writer()
+        await self.slow_append_in_progress(writer)
+
+        await writer.stop()
+
+        self.sm.append_rows.assert_called_once()
+        self.assertEqual(writer.pending_count(), 0)
+
+    async def test_flush_during_append_does_not_resend(self):
+        writer = self.make_writer()
+        await self.slow_append_in_progress(writer)
+
+        self.assertTrue(await writer.flush())
+
+        self.sm.append_rows.assert_called_once()
+        self.assertEqual(writer.pending_count(), 0)
+        await writer.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
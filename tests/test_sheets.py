@@ -0,0 +1,90 @@
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+
+import gspread
+import requests
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.sheets import SheetManager
+
+
+def worksheet(title):
+    ws = MagicMock()
+    ws.title = title
+    return ws
+
+
+class TestWorksheetCache(unittest.TestCase):
+    def setUp(self):
+        self.default = worksheet("Sheet1")
+        self.raw = worksheet("素データ")
+        self.workbook = MagicMock()
+        self.workbook.worksheets.return_value = [self.default, self.raw]
+
+    def make_manager(self, **kwargs):
+        sm = SheetManager(**kwargs)
+        sm.workbook = self.workbook
+        sm.refresh_worksheets()
+        return sm
+
+    def test_handles_are_cached(self):
+        sm = self.make_manager()
+        for _ in range(3):
+            sm.append_rows([["row"]], "素データ")
+
+        self.workbook.worksheet.assert_not_called()
+        self.workbook.worksheets.assert_called_once()
+        self.assertEqual(self.raw.append_rows.call_count, 3)
+
+    def test_missing_worksheet_is_fetched_then_cached(self):
+        sm = self.make_manager()
+        sm.invalidate("素データ")
+        self.workbook.worksheet.return_value = self.raw
+
+        sm.get_worksheet("素データ")
+        sm.get_worksheet("素データ")
+
+        self.workbook.worksheet.assert_called_once_with("素データ")
+
+    def test_unknown_worksheet_falls_back_to_default(self):
+        sm = self.make_manager()
+        self.workbook.worksheet.side_effect = gspread.WorksheetNotFound("nope")
+        self.assertIs(sm.get_worksheet("nope"), self.default)
+
+    def test_direct_append_targets_range(self):
+        sm = self.make_manager(direct_append=True)
+        sm.append_rows([["a", 1]], "素データ")
+
+        self.workbook.values_append.assert_called_once_with(
+            "'素データ'!A1", params={"valueInputOption": "RAW"}, body={"values": [["a", 1]]}
+        )
+        self.raw.append_rows.assert_not_called()
+
+    def test_direct_append_quotes_worksheet_name(self):
+        self.workbook.worksheets.return_value.append(worksheet("Player's sheet"))
+        sm = self.make_manager(direct_append=True)
+        sm.append_rows([["a", 1]], "Player's sheet")
+
+        self.assertEqual(self.workbook.values_append.call_args.args[0], "'Player''s sheet'!A1")
+
+    def test_stale_handle_is_refreshed(self):
+        sm = self.make_manager()
+        response = requests.Response()
+        response.status_code = 400
+        response._content = b'{"error": {"code": 400, "message": "Unable to parse range", "status": "X"}}'
+        self.raw.append_rows.side_effect = gspread.exceptions.APIError(response)
+        fresh = worksheet("素データ")
+        self.workbook.worksheet.return_value = fresh
+
+        sm.append_rows([["row"]], "素データ")
+
+        fresh.append_rows.assert_called_once_with([["row"]])
+        self.assertIs(sm.worksheets["素データ"], fresh)
+
+
+if __name__ == '__main__':
+    unittest.main()
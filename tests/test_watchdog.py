@@ -0,0 +1,71 @@
+import unittest
+import asyncio
+import sys
+import os
+import threading
+import time
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.watchdog import LoopWatchdog
+from src.profiler import hottest, sample_stacks, to_collapsed
+
+
+def blocking_sheet_write():
+    time.sleep(0.3)
+
+
+def busy_worker(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class TestLoopWatchdog(unittest.IsolatedAsyncioTestCase):
+    async def test_captures_blocking_call(self):
+        watchdog = LoopWatchdog(threshold=0.1, interval=0.01)
+        watchdog.start()
+        try:
+            await asyncio.sleep(0.05)
+            self.assertEqual(watchdog.stall_count, 0)
+
+            blocking_sheet_write()
+            await asyncio.sleep(0.05)
+        finally:
+            await watchdog.stop()
+
+        self.assertEqual(watchdog.stall_count, 1)
+        stall = watchdog.stalls[-1]
+        # The stack was taken while the loop was stuck in the blocking call
+        self.assertIn("blocking_sheet_write", stall["stack"])
+        # ...and the full length is filled in once the loop beats again
+        self.assertGreaterEqual(stall["seconds"], 0.29)
+        self.assertIn("blocked", watchdog.format_stalls())
+
+
+class TestProfiler(unittest.TestCase):
+    def test_samples_other_threads(self):
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_worker, args=(stop,), name="worker")
+        worker.start()
+        try:
+            counts, rounds = sample_stacks(0.2, interval=0.002)
+        finally:
+            stop.set()
+            worker.join()
+
+        self.assertGreater(rounds, 10)
+        worker_stacks = [stack for stack in counts if stack.startswith("worker;")]
+        self.assertTrue(any("busy_worker (test_watchdog.py" in stack for stack in worker_stacks))
+        # The sampler does not sample itself
+        self.assertFalse(any("sample_stacks" in stack for stack in counts))
+
+        lines = to_collapsed(counts).splitlines()
+        stack, count = lines[0].rsplit(" ", 1)
+        self.assertEqual(int(count), max(counts.values()))
+        self.assertTrue(hottest(counts, thread="worker"))
+        self.assertEqual(hottest(counts, thread="no such thread"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
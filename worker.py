@@ -0,0 +1,146 @@
+"""
+OCR worker processes for the bot's worker mode.
+
+With OCR_QUEUE_PATH set, bot.py only handles Discord: it downloads the
+screenshots and queues them in that SQLite file (see src/jobqueue.py). Each
+worker process started here claims jobs, runs IIDXReader and TitleMatcher and
+stores the result, and the bot sends the preview. Start as many processes as
+OCR should use cores; more can be started (or stopped) at any time without
+restarting the bot.
+
+The OCR settings of the bot (OCR_SINGLE_REQUEST, OCR_CACHE_SIZE,
+DIGIT_TEMPLATES_DIR, VISION_TIMEOUT_SECONDS, VISION_BREAKER_*) are read from
+the same .env. VISION_QPS is shared between the processes started by one
+command.
+
+Usage:
+    uv run python worker.py [--queue jobs.db] [--processes 4]
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from src.jobqueue import JobQueue
+from src.resilience import CircuitBreaker, CircuitOpen, Deadline, DeadlineExceeded
+from src.results import CIRCUIT_OPEN_MESSAGE, check_date, match_result
+
+logger = logging.getLogger("hiyoshi_worker")
+
+
+def build(vision_qps):
+    """IIDXReader and TitleMatcher configured from the environment, like the bot's."""
+    from src.ocr import IIDXReader
+    from src.ocr_cache import OCRCache
+    from src.digits import DigitRecognizer
+    from src.matcher import TitleMatcher
+    from src.ratelimit import TokenBucket
+
+    local_engine = None
+    templates = os.getenv('DIGIT_TEMPLATES_DIR', 'templates/digits')
+    if os.path.isdir(templates):
+        local_engine = DigitRecognizer.load(templates)
+    breaker = CircuitBreaker("vision", int(os.getenv('VISION_BREAKER_FAILURES', '5')),
+                             float(os.getenv('VISION_BREAKER_RESET_SECONDS', '30')))
+    reader = IIDXReader(single_request=os.getenv('OCR_SINGLE_REQUEST', '1') != '0', max_workers=1,
+                        cache=OCRCache(max_entries=int(os.getenv('OCR_CACHE_SIZE', '512'))),
+                        local_engine=local_engine, rate_limiter=TokenBucket(vision_qps, max(1, int(vision_qps))),
+                        vision_timeout=float(os.getenv('VISION_TIMEOUT_SECONDS', '10')), circuit_breaker=breaker)
+    return reader, TitleMatcher()
+
+
+def process_job(reader, matcher, image, meta):
+    """OCR, date check and title matching for one job. Returns the result stored for the bot."""
+    deadline = Deadline(meta["expires_at"] - time.time()) if meta.get("expires_at") else None
+    try:
+        data = reader.extract_data(image, deadline=deadline)
+    except CircuitOpen as e:
+        return {"rejection": CIRCUIT_OPEN_MESSAGE.format(retry_after=e.retry_after)}
+
+    rejection = check_date(data, meta.get("event_start"), meta.get("event_end"))
+    if rejection:
+        return {"rejection": rejection}
+    return {"data": match_result(matcher, data, image)}
+
+
+def work(queue_path, name, vision_qps, poll_interval=0.2):
+    """One worker process: claims and processes jobs until SIGTERM/SIGINT."""
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'),
+                        format=f"%(asctime)s %(levelname)s {name}: %(message)s")
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    reader, matcher = build(vision_qps)
+    queue = JobQueue(queue_path)
+    logger.info("Ready.")
+    try:
+        while not stopping:
+            job = queue.claim(name)
+            if job is None:
+                time.sleep(poll_interval)
+                continue
+            job_id, image, meta = job
+            if meta.get("expires_at") and meta["expires_at"] < time.time():
+                # The bot has given up on it already
+                queue.fail(job_id, "expired")
+                continue
+            start = time.perf_counter()
+            try:
+                queue.finish(job_id, process_job(reader, matcher, image, meta))
+            except DeadlineExceeded as e:
+                queue.fail(job_id, f"timed out: {e}")
+            except Exception as e:
+                logger.exception("Job %d failed: %s", job_id, e)
+                queue.fail(job_id, e)
+            logger.debug("Job %d done in %.2fs", job_id, time.perf_counter() - start)
+    finally:
+        queue.close()
+        reader.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queue", default=None, help="job queue file (default: OCR_QUEUE_PATH or jobs.db)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="worker processes (default: CPU count)")
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="seconds between polls of an empty queue")
+    args = parser.parse_args()
+
+    load_dotenv()
+    queue_path = args.queue or os.getenv('OCR_QUEUE_PATH', 'jobs.db')
+    # The Vision quota is per project, so the processes split it
+    vision_qps = float(os.getenv('VISION_QPS', '10')) / args.processes
+    # The queue file has to exist before the workers open it concurrently
+    JobQueue(queue_path).close()
+
+    host = socket.gethostname()
+    processes = [multiprocessing.Process(target=work, name=f"{host}-{os.getpid()}-{i}",
+                                         args=(queue_path, f"{host}-{os.getpid()}-{i}", vision_qps, args.poll_interval))
+                 for i in range(args.processes)]
+    for process in processes:
+        process.start()
+    print(f"{len(processes)} workers processing {queue_path}; Ctrl+C to stop")
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())